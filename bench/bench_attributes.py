@@ -0,0 +1,59 @@
+"""
+
+  bench_attributes:  benchmark parsing of attribute-heavy records.
+
+This script parses a document made up of records that carry all of their
+data in attributes, which exercises the binding of attributes to fields.
+
+    python bench/bench_attributes.py [num_attrs] [num_items]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dexml
+from dexml import fields
+
+
+def make_model(num_attrs):
+    attrs = {}
+    for i in range(num_attrs):
+        if i % 2:
+            attrs["a%d" % (i,)] = fields.Integer(required=False)
+        else:
+            attrs["a%d" % (i,)] = fields.String(required=False)
+    Record = type("Record",(dexml.Model,),attrs)
+    Table = type("Table",(dexml.Model,),{"records":fields.List(Record)})
+    return Table
+
+
+def make_doc(num_attrs,num_items):
+    attrs = " ".join("a%d='%d'" % (i,i) for i in reversed(range(num_attrs)))
+    record = "<Record %s />" % (attrs,)
+    return "<Table>" + record * num_items + "</Table>"
+
+
+def main(argv):
+    num_attrs = 40
+    num_items = 2000
+    if len(argv) > 1:
+        num_attrs = int(argv[1])
+    if len(argv) > 2:
+        num_items = int(argv[2])
+    Table = make_model(num_attrs)
+    xml = make_doc(num_attrs,num_items)
+    Table.parse(xml)
+    t = time.time()
+    table = Table.parse(xml)
+    t = time.time() - t
+    assert len(table.records) == num_items
+    print("parse(): %.3fs for %d records of %d attributes"
+          % (t,num_items,num_attrs))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
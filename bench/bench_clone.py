@@ -0,0 +1,78 @@
+"""
+
+  bench_clone:  benchmark copying of parsed model instances.
+
+This script parses a catalog-style document and then copies it repeatedly,
+comparing Model.clone() against copy.deepcopy().
+
+    python bench/bench_clone.py [num_items] [num_copies]
+
+"""
+
+import os
+import sys
+import copy
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dexml
+from dexml import fields
+
+
+class Price(dexml.Model):
+    currency = fields.String()
+    amount = fields.Decimal()
+
+
+class Product(dexml.Model):
+    sku = fields.String()
+    name = fields.String(tagname="name")
+    price = fields.Model(Price)
+    tags = fields.List(fields.String(tagname="tag"),required=False)
+
+
+class Catalog(dexml.Model):
+    title = fields.String(tagname="title")
+    products = fields.List(Product,tagname="products")
+    index = fields.Dict(Product,key="sku",required=False)
+
+
+def make_catalog(num_items):
+    xml = ["<Catalog><title>Bench</title><products>"]
+    for i in range(num_items):
+        xml.append("<Product sku='p%d'><name>Product %d</name>" % (i,i))
+        xml.append("<Price currency='USD' amount='%d.99' />" % (i,))
+        xml.append("<tag>a</tag><tag>b</tag></Product>")
+    xml.append("</products></Catalog>")
+    catalog = Catalog.parse("".join(xml))
+    for p in catalog.products[:num_items // 10]:
+        catalog.index[p.sku] = p.clone()
+    return catalog
+
+
+def timeit(func,catalog,num_copies):
+    t = time.time()
+    for _ in range(num_copies):
+        func(catalog)
+    return time.time() - t
+
+
+def main(argv):
+    num_items = 100
+    num_copies = 200
+    if len(argv) > 1:
+        num_items = int(argv[1])
+    if len(argv) > 2:
+        num_copies = int(argv[2])
+    catalog = make_catalog(num_items)
+    assert catalog.clone().render() == copy.deepcopy(catalog).render()
+    t_clone = timeit(lambda c: c.clone(),catalog,num_copies)
+    t_deepcopy = timeit(copy.deepcopy,catalog,num_copies)
+    print("clone():    %.3fs for %d copies" % (t_clone,num_copies))
+    print("deepcopy(): %.3fs for %d copies (%.1fx slower)"
+          % (t_deepcopy,num_copies,t_deepcopy / t_clone))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,83 @@
+"""
+
+  bench_import:  benchmark import time for a large generated schema.
+
+This script generates a module defining a large number of dexml.Model
+classes, in the style of code generated from an industry XML schema, and
+measures how long it takes to import that module in a fresh interpreter.
+
+    python bench/bench_import.py [num_classes] [num_runs]
+
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+
+def generate_schema(num_classes):
+    """Generate source code for a module with the given number of models."""
+    lines = ["import dexml","from dexml import fields",""]
+    lines.append("class Base(dexml.Model):")
+    lines.append("    class meta:")
+    lines.append("        namespace = 'urn:bench'")
+    lines.append("        namespace_prefix = 'b'")
+    lines.append("    id = fields.String()")
+    lines.append("    version = fields.Integer(required=False)")
+    lines.append("")
+    for i in range(num_classes):
+        lines.append("class Type%d(Base):" % (i,))
+        lines.append("    class meta:")
+        lines.append("        tagname = 'type%d'" % (i,))
+        lines.append("    name = fields.String(tagname='name')")
+        lines.append("    code = fields.String(required=False)")
+        lines.append("    amount = fields.Float(tagname='amount',required=False)")
+        lines.append("    flag = fields.Boolean(required=False)")
+        if i > 0:
+            lines.append("    parts = fields.List(Type%d,required=False)" % (i-1,))
+            lines.append("    ref = fields.Model('type%d',required=False)" % (i-1,))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv):
+    num_classes = 5000
+    num_runs = 3
+    if len(argv) > 1:
+        num_classes = int(argv[1])
+    if len(argv) > 2:
+        num_runs = int(argv[2])
+    tdir = tempfile.mkdtemp()
+    try:
+        f = open(os.path.join(tdir,"bench_schema.py"),"w")
+        f.write(generate_schema(num_classes))
+        f.close()
+        pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = "; ".join((
+            "import sys, time",
+            "sys.path[:0] = [%r, %r]" % (tdir,pkgdir),
+            "import dexml",
+            "t = time.time()",
+            "import bench_schema",
+            "print(time.time() - t)",
+        ))
+        #  Import once to produce the .pyc file, so that we only time
+        #  the creation of the model classes.
+        subprocess.check_call([sys.executable,"-c",script],
+                              stdout=subprocess.PIPE)
+        times = []
+        for _ in range(num_runs):
+            p = subprocess.Popen([sys.executable,"-c",script],
+                                 stdout=subprocess.PIPE)
+            (out,_) = p.communicate()
+            times.append(float(out.strip()))
+        print("import of %d model classes: best %.3fs of %d runs"
+              % (num_classes,min(times),num_runs))
+    finally:
+        shutil.rmtree(tdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,147 @@
+"""
+
+  bench_memory:  benchmark memory use when parsing representative models.
+
+For each of a few representative models, this script generates a document,
+parses it in a fresh interpreter, and reports:
+
+    * the peak RSS growth of the process during Model.parse(), which covers
+      both the DOM and the resulting objects
+    * the peak traced allocation during Model.parse(), if the tracemalloc
+      module is available
+    * the memory retained by each parsed instance, according to
+      dexml.sizeof()
+
+    python bench/bench_memory.py [num_items]
+
+"""
+
+import os
+import sys
+import subprocess
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dexml
+from dexml import fields
+
+
+class Person(dexml.Model):
+    name = fields.String()
+    email = fields.String(tagname="email",required=False)
+    age = fields.Integer(tagname="age")
+
+
+class Price(dexml.Model):
+    currency = fields.String(intern=True)
+    amount = fields.Decimal()
+
+
+class Product(dexml.Model):
+    sku = fields.String()
+    name = fields.String(tagname="name")
+    price = fields.Model(Price)
+    tags = fields.List(fields.String(tagname="tag"),required=False)
+
+
+class Catalog(dexml.Model):
+    products = fields.List(Product,tagname="products")
+
+
+class Directory(dexml.Model):
+    people = fields.Dict(Person,key="name")
+
+
+class Blob(dexml.Model):
+    id = fields.String()
+    payload = fields.XmlNode(tagname="payload")
+
+
+class Archive(dexml.Model):
+    blobs = fields.List(Blob)
+
+
+def make_catalog(num_items):
+    xml = ["<Catalog><products>"]
+    for i in range(num_items):
+        xml.append("<Product sku='p%d'><name>Product %d</name>" % (i,i))
+        xml.append("<Price currency='USD' amount='%d.99' />" % (i,))
+        xml.append("<tag>new</tag><tag>sale</tag></Product>")
+    xml.append("</products></Catalog>")
+    return "".join(xml)
+
+
+def make_directory(num_items):
+    xml = ["<Directory>"]
+    for i in range(num_items):
+        xml.append("<Person name='person%d'><email>p%d@example.com</email>" % (i,i))
+        xml.append("<age>%d</age></Person>" % (i % 100,))
+    xml.append("</Directory>")
+    return "".join(xml)
+
+
+def make_archive(num_items):
+    xml = ["<Archive>"]
+    for i in range(num_items):
+        xml.append("<Blob id='b%d'><payload><data a='1'>%s</data>" % (i,"x" * 100))
+        xml.append("<extra><more /></extra></payload></Blob>")
+    xml.append("</Archive>")
+    return "".join(xml)
+
+
+#  (model class, document generator, attribute holding the items)
+CASES = {
+    "catalog": (Catalog,make_catalog,"products"),
+    "directory": (Directory,make_directory,"people"),
+    "archive": (Archive,make_archive,"blobs"),
+}
+
+
+def peak_rss_kb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(case,num_items):
+    """Measure a single case; run in a fresh interpreter."""
+    (cls,make_doc,attr) = CASES[case]
+    xml = make_doc(num_items)
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    rss_before = peak_rss_kb()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    obj = cls.parse(xml)
+    traced_peak = None
+    if tracemalloc is not None:
+        (_,traced_peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    rss_growth = peak_rss_kb() - rss_before
+    items = getattr(obj,attr)
+    if isinstance(items,dict):
+        items = list(items.values())
+    per_item = sum(dexml.sizeof(item) for item in items) / float(len(items))
+    print("%s: %d items, %d bytes of xml" % (case,num_items,len(xml)))
+    print("  peak RSS growth during parse: %d KiB" % (rss_growth,))
+    if traced_peak is not None:
+        print("  peak traced allocation during parse: %d KiB" % (traced_peak // 1024,))
+    print("  retained size: %d KiB total, %.0f bytes per item"
+          % (dexml.sizeof(obj) // 1024,per_item))
+
+
+def main(argv):
+    num_items = 10000
+    if len(argv) > 1 and argv[1] == "--case":
+        measure(argv[2],int(argv[3]))
+        return
+    if len(argv) > 1:
+        num_items = int(argv[1])
+    for case in sorted(CASES):
+        subprocess.check_call([sys.executable,os.path.abspath(__file__),
+                               "--case",case,str(num_items)])
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,65 @@
+"""
+
+  bench_parse_into:  benchmark parsing messages into a reused instance.
+
+This script parses the same small message many times, either creating a
+new instance each time with parse() or refilling a single instance with
+parse_into(), and reports the time taken.  The document is parsed into a
+DOM once up front, so that only the work of building models is measured.
+
+    python bench/bench_parse_into.py [num_items] [num_messages]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dexml
+from dexml import fields
+
+
+class line(dexml.Model):
+    sku = fields.String()
+    qty = fields.Integer()
+    note = fields.String(tagname="note",required=False)
+
+class customer(dexml.Model):
+    name = fields.String()
+    email = fields.String(required=False)
+
+class order(dexml.Model):
+    id = fields.Integer()
+    customer = fields.Model(customer)
+    lines = fields.List(line,tagname="lines")
+
+
+def make_doc(num_items):
+    lines = "".join("<line sku='s%d' qty='%d'><note>n%d</note></line>" % (i,i,i)
+                    for i in range(num_items))
+    return "<order id='1'><customer name='c' email='e' /><lines>%s</lines></order>" % (lines,)
+
+
+def main(argv):
+    num_items = 20
+    num_messages = 5000
+    if len(argv) > 1:
+        num_items = int(argv[1])
+    if len(argv) > 2:
+        num_messages = int(argv[2])
+    xml = make_doc(num_items)
+    node = order._make_xml_node(xml)
+    inst = order.parse(node)
+    for (name,func) in (("parse()",lambda: order.parse(node)),
+                        ("parse_into()",lambda: order.parse_into(inst,node))):
+        t = time.time()
+        for _ in xrange(num_messages):
+            func()
+        t = time.time() - t
+        print("%s: %.3fs for %d messages of %d items" % (name,t,num_messages,num_items))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,70 @@
+"""
+
+  bench_render_many:  benchmark batch rendering of small documents.
+
+This script renders a large number of small messages, first by calling
+render() on each one and then with a single call to Model.render_many(),
+and reports the throughput of each approach.
+
+    python bench/bench_render_many.py [num_messages] [num_runs]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dexml
+from dexml import fields
+
+
+class Message(dexml.Model):
+    class meta:
+        namespace = "urn:bench"
+        namespace_prefix = "m"
+    id = fields.Integer()
+    topic = fields.String()
+    body = fields.String(tagname="body")
+
+
+def make_messages(num_messages):
+    return [Message(id=i,topic="orders",body="order %d" % (i,))
+            for i in range(num_messages)]
+
+
+def bench_render(messages):
+    return [m.render(encoding="utf-8") for m in messages]
+
+
+def bench_render_many(messages):
+    return Message.render_many(messages,encoding="utf-8")
+
+
+def bench_render_many_framed(messages):
+    return Message.render_many(messages,encoding="utf-8",framed=True)
+
+
+def main(argv):
+    num_messages = 50000
+    num_runs = 3
+    if len(argv) > 1:
+        num_messages = int(argv[1])
+    if len(argv) > 2:
+        num_runs = int(argv[2])
+    messages = make_messages(num_messages)
+    assert bench_render(messages) == bench_render_many(messages)
+    for func in (bench_render,bench_render_many,bench_render_many_framed):
+        times = []
+        for _ in range(num_runs):
+            t = time.time()
+            func(messages)
+            times.append(time.time() - t)
+        best = min(times)
+        print("%s: best %.3fs of %d runs, %d messages/s"
+              % (func.__name__,best,num_runs,num_messages / best))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -72,10 +72,22 @@ __version__ = "%d.%d.%d%s" % (__ver_major__,__ver_minor__,__ver_patch__,__ver_su
 
 import sys
 import re
-import copy
+import codecs
+import marshal
+import operator
 from xml.dom import minidom
 
 from dexml import fields
+from dexml.cache import ParseCache
+from dexml.writer import ExportWriter
+from dexml import parallel
+from dexml.delta import ChangeSet, diff, patch
+from dexml.limits import ParseLimits, _DOMBuilder
+from dexml import metrics
+from dexml.memory import sizeof
+from dexml import synth
+from dexml.projection import Projection
+from dexml.interning import InternTable
 
 
 if sys.version_info >= (3,):
@@ -140,6 +152,9 @@ class Meta:
         * ignore_unknown_elements:  ignore unknown elements when parsing
         * case_sensitive:    match tag/attr names case-sensitively
         * order_sensitive:   match child tags in order of field definition
+        * parse_limits:      ParseLimits to enforce when parsing documents
+        * frozen:            make instances immutable and hashable
+        * intern_table:      InternTable sharing equal parsed instances
 
     """
 
@@ -148,7 +163,10 @@ class Meta:
                  "namespace_prefix":None,
                  "ignore_unknown_elements":True,
                  "case_sensitive":True,
-                 "order_sensitive":True}
+                 "order_sensitive":True,
+                 "parse_limits":None,
+                 "frozen":False,
+                 "intern_table":None}
 
     def __init__(self,name,meta_attrs):
         for (attr,default) in self._defaults.items():
@@ -161,12 +179,85 @@ def _meta_attributes(meta):
     """Extract attributes from a "meta" object."""
     meta_attrs = {}
     if meta:
-        for attr in dir(meta):
-            if not attr.startswith("_"):
-                meta_attrs[attr] = getattr(meta,attr)
+        if isinstance(meta,Meta):
+            #  Meta instances hold all their attributes directly, so we
+            #  can avoid the overhead of walking dir().
+            for (attr,val) in meta.__dict__.iteritems():
+                if not attr.startswith("_"):
+                    meta_attrs[attr] = val
+        else:
+            for attr in dir(meta):
+                if not attr.startswith("_"):
+                    meta_attrs[attr] = getattr(meta,attr)
     return meta_attrs
 
 
+_field_order = operator.attrgetter("_order_counter")
+
+
+def _frozen_setattr(self,name,value):
+    raise AttributeError("Can't set attribute '%s' of frozen model '%s'"
+                         % (name,self.__class__.__name__,))
+
+def _frozen_delattr(self,name):
+    raise AttributeError("Can't delete attribute '%s' of frozen model '%s'"
+                         % (name,self.__class__.__name__,))
+
+def _frozen_eq(self,other):
+    if other is self:
+        return True
+    if other.__class__ is not self.__class__:
+        return NotImplemented
+    return self._frozen_key() == other._frozen_key()
+
+def _frozen_ne(self,other):
+    eq = _frozen_eq(self,other)
+    if eq is NotImplemented:
+        return eq
+    return not eq
+
+def _frozen_hash(self):
+    #  The hash is cached, since nested models are hashed repeatedly
+    #  when interning a tree of them.
+    try:
+        return self.__dict__["_hash"]
+    except KeyError:
+        h = self.__dict__["_hash"] = hash(self._frozen_key())
+        return h
+
+#  Methods installed on model classes with the 'frozen' meta option.
+_FROZEN_METHODS = {"__setattr__":_frozen_setattr,
+                   "__delattr__":_frozen_delattr,
+                   "__eq__":_frozen_eq,
+                   "__ne__":_frozen_ne,
+                   "__hash__":_frozen_hash}
+
+def _unfrozen_eq(self,other):
+    return NotImplemented
+
+#  Default methods restored on unfrozen subclasses of frozen models.
+#  Returning NotImplemented from __eq__ and __ne__ falls back to the usual
+#  comparison by identity.
+_UNFROZEN_METHODS = {"__setattr__":object.__setattr__,
+                     "__delattr__":object.__delattr__,
+                     "__eq__":_unfrozen_eq,
+                     "__ne__":_unfrozen_eq,
+                     "__hash__":object.__hash__}
+
+
+def _same_namespace(meta1,meta2):
+    return (meta1.namespace == meta2.namespace and
+            meta1.namespace_prefix == meta2.namespace_prefix)
+
+
+def _inherited_attr(cls,name):
+    """Get the raw value of a class attribute, as found in the mro."""
+    for base in cls.__mro__:
+        if name in base.__dict__:
+            return base.__dict__[name]
+    return None
+
+
 class ModelMetaclass(type):
     """Metaclass for dexml.Model and subclasses.
 
@@ -194,15 +285,17 @@ class ModelMetaclass(type):
         cls.meta = Meta(name,meta_attrs)
         #  Create ordered list of field objects, telling each about their
         #  name and containing class.  Inherit fields from base classes
-        #  only if not overridden on the class itself.
+        #  only if not overridden on the class itself.  Fields look at the
+        #  namespace of their class, so they are shared with the base class
+        #  unless this class changes it.
         base_fields = {}
         for base in bases:
             if not isinstance(base,ModelMetaclass):
                 continue
             for field in base._fields:
                 if field.field_name not in base_fields:
-                    field = copy.copy(field)
-                    field.model_class = cls
+                    if not _same_namespace(field.model_class.meta,cls.meta):
+                        field = field._copy_for_model(cls)
                     base_fields[field.field_name] = field
         cls_fields = []
         for (name,value) in attrs.iteritems():
@@ -212,7 +305,17 @@ class ModelMetaclass(type):
                 value.model_class = cls
                 cls_fields.append(value)
         cls._fields = base_fields.values() + cls_fields
-        cls._fields.sort(key=lambda f: f._order_counter)
+        cls._fields.sort(key=_field_order)
+        if cls.meta.frozen:
+            for (name,method) in _FROZEN_METHODS.iteritems():
+                setattr(cls,name,method)
+        else:
+            if cls.meta.intern_table is not None:
+                raise ValueError("Class '%s' must be frozen to use an intern table"
+                                 % (cls.__name__,))
+            for (name,method) in _UNFROZEN_METHODS.iteritems():
+                if _inherited_attr(cls,name) is _FROZEN_METHODS[name]:
+                    setattr(cls,name,method)
         #  Register the new class so we can find it by name later on
         tagname = (cls.meta.namespace,cls.meta.tagname)
         mcls.instances_by_tagname[tagname] = cls
@@ -237,6 +340,115 @@ class ModelMetaclass(type):
 #  document string.  Hopefully you won't have to, but you might need to...
 _XML_ENCODING_RE = re.compile("<\\?xml [^>]*encoding=[\"']([a-zA-Z0-9\\.\\-\\_]+)[\"'][^>]*?>")
 
+#  Version of the marshal format used by Model.dumps().  Version 2 is the
+#  newest one understood by all supported python versions.
+_MARSHAL_VERSION = 2
+
+
+#  Number of fragments to buffer before encoding, when rendering to bytes.
+#  Most fragments are only a few characters long.
+RENDER_CHUNK_SIZE = 1024
+
+#  Value wrappers used by _render() when rendering all fields.
+_NO_WRAPPERS = {}
+
+#  Encodings for which an ascii bytestring needs no re-encoding.
+_ASCII_COMPATIBLE_ENCODINGS = ("utf-8","ascii",)
+
+
+def _encode_chunks(chunks,encoding,header=None):
+    """Generator coalescing string chunks into larger encoded chunks.
+
+    Encoding each tiny fragment separately has a lot of overhead, so we
+    buffer up to RENDER_CHUNK_SIZE fragments and encode them in one go.
+    An incremental encoder is used so that e.g. a BOM is emitted only once.
+    For utf8 and ascii output, bytestring chunks are assumed to be ascii
+    and are passed through without being re-encoded.
+    """
+    encoder = codecs.getincrementalencoder(encoding)()
+    passthrough = codecs.lookup(encoding).name in _ASCII_COMPATIBLE_ENCODINGS
+    buf = []
+    if header is not None:
+        buf.append(header)
+    append = buf.append
+    for data in chunks:
+        append(data)
+        if len(buf) >= RENDER_CHUNK_SIZE:
+            data = "".join(buf)
+            if passthrough and isinstance(data,bytes):
+                yield data
+            else:
+                yield encoder.encode(data)
+            del buf[:]
+    data = "".join(buf)
+    if not passthrough or not isinstance(data,bytes):
+        data = encoder.encode(data,True)
+    if data:
+        yield data
+
+
+class _EncodingBuffer(list):
+    """Output buffer for Model._render_into() that encodes as it goes.
+
+    Fragments are appended to this list as usual.  Each time a model has
+    finished rendering it calls maybe_flush(), which encodes the buffered
+    fragments and writes them to the output stream once there are at least
+    RENDER_CHUNK_SIZE of them.  Since the rendering code watches len() to
+    tell whether anything was rendered, the reported length includes the
+    fragments that have already been written out.
+
+    If the encoding is None then strings are written to the stream as-is.
+    """
+
+    def __init__(self,encoding,stream):
+        super(_EncodingBuffer,self).__init__()
+        self.stream = stream
+        self.num_flushed = 0
+        if encoding is None:
+            self._encoder = None
+            self._passthrough = True
+        else:
+            self._encoder = codecs.getincrementalencoder(encoding)()
+            self._passthrough = (codecs.lookup(encoding).name in
+                                 _ASCII_COMPATIBLE_ENCODINGS)
+
+    def __len__(self):
+        return self.num_flushed + list.__len__(self)
+
+    def maybe_flush(self):
+        if list.__len__(self) >= RENDER_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self,final=False):
+        data = "".join(self)
+        if self._encoder is None:
+            pass
+        elif not self._passthrough or not isinstance(data,bytes):
+            data = self._encoder.encode(data,final)
+        if data:
+            self.stream.write(data)
+        self.num_flushed += list.__len__(self)
+        del self[:]
+
+
+class _ChunkWriter(list):
+    """File-like object collecting the chunks written to it in a list.
+
+    Unlike BytesIO this never copies the data while it grows, and joining
+    the chunks at the end makes the one copy needed to produce a string.
+    """
+    write = list.append
+
+
+def _load_model(cls,data):
+    """Helper function for unpickling Model instances."""
+    return cls.loads(data)
+
+
+def _new_model(cls):
+    """Helper function for unpickling Model instances from their state."""
+    return cls.__new__(cls)
+
 
 class Model(object):
     """Base class for dexml Model objects.
@@ -270,49 +482,290 @@ class Model(object):
         """Default Model constructor.
 
         Keyword arguments that correspond to declared fields are processed
-        and assigned to that field.
+        and assigned to that field.  Instances of frozen models can only be
+        given values in this way.
         """
+        set_value = setattr
+        if self.meta.frozen:
+            set_value = object.__setattr__
         for f in self._fields:
             try:
-                setattr(self,f.field_name,kwds[f.field_name])
+                set_value(self,f.field_name,kwds[f.field_name])
             except KeyError:
                 pass
+        if self.meta.frozen:
+            self._freeze()
 
     @classmethod
-    def parse(cls,xml):
+    def parse(cls,xml,limits=None,workers=None):
         """Produce an instance of this model from some xml.
 
         The given xml can be a string, a readable file-like object, or
         a DOM node; we might add support for more types in the future.
+
+        To bound the resources spent on parsing an untrusted document, pass
+        a ParseLimits object as the 'limits' argument.  If not given, the
+        limits from the model's meta object are used, if any.
+
+        To parse a large document in parallel, set the 'workers' argument
+        to a number of processes or to a multiprocessing.Pool instance.
+        See dexml.parallel for details.  Parse limits are not supported
+        in this mode.
         """
-        self = cls()
-        node = self._make_xml_node(xml)
+        if metrics.registry.enabled:
+            size = 0
+            if isinstance(xml,basestring):
+                size = metrics._byte_size(xml)
+            return metrics.registry.call(cls,"parse",size,cls._parse,xml,
+                                         limits,workers)
+        return cls._parse(xml,limits,workers)
+
+    @classmethod
+    def parse_into(cls,instance,xml,limits=None):
+        """Parse some xml into an existing instance of this model.
+
+        The instance's fields are reset and filled from the xml, as if it
+        had been newly created by parse().  Its List and Dict containers
+        and nested model instances are reused where the parsed data has
+        the same shape, which avoids allocating new objects when parsing
+        many similar documents in a loop.  Attributes that don't belong
+        to a field are left alone.  The instance is returned.
+
+        Nested objects are modified in place, so don't keep references to
+        them from a previous parse.  If parsing fails after the document
+        has been read, the instance is left partially filled.
+        """
+        if not isinstance(instance,cls):
+            raise ValueError("Class '%s' can't parse into %s instance"
+                             % (cls.__name__,instance.__class__.__name__))
+        if instance.meta.frozen:
+            raise ValueError("Can't parse into frozen model '%s'"
+                             % (instance.__class__.__name__,))
+        if metrics.registry.enabled:
+            size = 0
+            if isinstance(xml,basestring):
+                size = metrics._byte_size(xml)
+            return metrics.registry.call(cls,"parse",size,cls._parse,xml,
+                                         limits,None,instance)
+        return cls._parse(xml,limits,None,instance)
+
+    @classmethod
+    def _parse(cls,xml,limits,workers=None,into=None):
+        """Implementation of parse() and parse_into(), without metrics."""
+        if limits is None:
+            limits = cls.meta.parse_limits
+        if workers:
+            if limits is not None:
+                raise ValueError("Can't use parse limits with workers")
+            return parallel.ParallelParser(workers).parse(cls,xml)
+        if into is None:
+            self = cls()
+        else:
+            self = into
+        node = self._make_xml_node(xml,limits)
         self.validate_xml_node(node)
-        #  Keep track of fields that have successfully parsed something
-        fields_found = []
-        #  Try to consume all the node's attributes
+        if into is not None:
+            self._offer_reusable()
+        try:
+            #  Keep track of fields that have successfully parsed something
+            fields_found = []
+            self._parse_attributes(node,fields_found)
+            #  Try to consume all child nodes
+            if self.meta.order_sensitive:
+                self._parse_children_ordered(node,self._fields,fields_found)
+            else:
+                self._parse_children_unordered(node,self._fields,fields_found)
+            self._parse_done(fields_found)
+        finally:
+            if into is not None:
+                del self.__dict__["_reusable"]
+        #  All done, return the instance so created
+        return self
+
+    def _offer_reusable(self):
+        """Clear all fields, keeping their values for reuse while parsing.
+
+        The old values are held in a dict under the "_reusable" attribute,
+        from which fields can take them while parsing.  See parse_into().
+        """
+        vals = self.__dict__
+        reusable = {}
+        for f in self._fields:
+            val = vals.pop(f.field_name,None)
+            if val is not None:
+                reusable[f.field_name] = val
+        vals["_reusable"] = reusable
+
+    def _parse_attributes(self,node,fields_found):
+        """Try to consume all the attributes of the given node.
+
+        Attributes belonging to plain Value fields are bound with a single
+        lookup in the class's attribute map.  Any others are offered to
+        fields with a custom parse_attributes() method, in order.
+        """
+        (attr_map,custom_fields) = self._get_attribute_plan()
         attrs = node.attributes.values()
-        for field in self._fields:
+        unused_attrs = []
+        for attr in attrs:
+            try:
+                field = attr_map[(attr.namespaceURI,attr.localName)]
+            except KeyError:
+                unused_attrs.append(attr)
+            else:
+                field.__set__(self,field.parse_value(attr.nodeValue))
+                fields_found.append(field)
+        attrs = unused_attrs
+        for field in custom_fields:
+            if not attrs:
+                break
             unused_attrs = field.parse_attributes(self,attrs)
             if len(unused_attrs) < len(attrs):
                 fields_found.append(field)
             attrs = unused_attrs
         for attr in attrs:
             self._handle_unparsed_node(attr)
-        #  Try to consume all child nodes
-        if self.meta.order_sensitive:
-            self._parse_children_ordered(node,self._fields,fields_found)
-        else:
-            self._parse_children_unordered(node,self._fields,fields_found)
-        #  Check that all required fields have been found
+
+    @classmethod
+    def _get_attribute_plan(cls):
+        """Get tuple (attr_map,custom_fields) for parsing attributes.
+
+        The attr_map dict maps (namespace,localName) pairs to the Value
+        fields that parse them, and custom_fields lists the fields that
+        override parse_attributes().  Fields that don't handle attributes
+        appear in neither.  This is calculated once per class.
+        """
+        try:
+            return cls.__dict__["_attribute_plan"]
+        except KeyError:
+            attr_map = {}
+            custom_fields = []
+            for f in cls._fields:
+                for klass in f.__class__.__mro__:
+                    if "parse_attributes" in klass.__dict__:
+                        break
+                if klass is fields.Field:
+                    continue
+                if klass is not fields.Value:
+                    custom_fields.append(f)
+                elif not f.tagname:
+                    attrname = f.attrname
+                    if isinstance(attrname,basestring):
+                        attr_map.setdefault((None,attrname),f)
+                    else:
+                        attr_map.setdefault(tuple(attrname),f)
+            plan = (attr_map,custom_fields)
+            cls._attribute_plan = plan
+            return plan
+
+    def _parse_done(self,fields_found):
+        """Check that all required fields have been found, and finalize."""
         for field in self._fields:
             if field.required and field not in fields_found:
                 err = "required field not found: '%s'" % (field.field_name,)
                 raise ParseError(err)
             field.parse_done(self)
-        #  All done, return the instance so created
+        if self.meta.frozen:
+            self._freeze()
+
+    def _freeze(self):
+        """Make the value of each field immutable, for frozen models."""
+        vals = self.__dict__
+        for f in self._fields:
+            val = vals.get(f.field_name)
+            if val is not None:
+                vals[f.field_name] = f.freeze_value(self,val)
+
+    def _frozen_key(self):
+        """Get a tuple of field values, for comparing frozen models."""
+        return tuple([f.peek_value(self) for f in self._fields])
+
+    def dumps(self):
+        """Produce a compact binary encoding of this model's instance data.
+
+        The encoding is driven by the model's field definitions: each field
+        contributes one value by position, nested models are encoded as
+        tuples of their own fields, and no tag or attribute names are
+        stored.  It is much faster to decode than the equivalent XML, but
+        can only be decoded by Model.loads() on the same model class.
+
+        The encoding uses the 'marshal' module, so it is suitable for
+        caching and interprocess communication but should not be used
+        to load data from untrusted sources.
+        """
+        return marshal.dumps(self._dump_fields(),_MARSHAL_VERSION)
+
+    @classmethod
+    def loads(cls,data):
+        """Produce an instance of this model from the output of dumps()."""
+        try:
+            fields = marshal.loads(data)
+        except (ValueError,EOFError,TypeError), e:
+            raise ParseError(e)
+        return cls._load_fields(fields)
+
+    def _dump_fields(self):
+        """Produce a tuple encoding the value of each field by position."""
+        vals = self.__dict__
+        return tuple([f.dump_value(self,vals.get(f.field_name))
+                      for f in self._fields])
+
+    @classmethod
+    def _load_fields(cls,data):
+        """Produce an instance of this model from a _dump_fields() tuple."""
+        if not isinstance(data,tuple) or len(data) != len(cls._fields):
+            err = "Class '%s' got data not matching its fields"
+            raise ParseError(err % (cls.__name__,))
+        self = cls()
+        for (field,fdata) in zip(cls._fields,data):
+            field.load_value(self,fdata)
+        if cls.meta.frozen:
+            self._freeze()
         return self
 
+    def __reduce__(self):
+        #  Pickle via the compact encoding, carrying along any attributes
+        #  that don't correspond to a field.  Instances that the encoding
+        #  can't represent, e.g. those holding an instance of a subclass
+        #  of a field's declared model, are pickled by their __dict__.
+        try:
+            data = self.dumps()
+        except ValueError:
+            state = self.__dict__.copy()
+            state.pop("_hash",None)
+            return (_new_model,(self.__class__,),state)
+        field_names = set(f.field_name for f in self._fields)
+        state = {}
+        for (attr,val) in self.__dict__.iteritems():
+            if attr not in field_names and attr != "_hash":
+                state[attr] = val
+        return (_load_model,(self.__class__,data),state or None)
+
+    def __copy__(self):
+        #  Copying would otherwise go via __reduce__, making a deep copy.
+        return self.clone(deep=False)
+
+    def clone(self,deep=True):
+        """Produce a copy of this model instance.
+
+        By default a deep copy is made, driven by the model's fields: list
+        and dict values are copied, nested models are cloned, and scalar
+        values are shared since they are immutable.  This is much faster
+        than copy.deepcopy().  Attributes that don't correspond to a field
+        are copied by reference.  Pass deep=False for a shallow copy.
+        Instances of frozen models are returned unchanged.
+        """
+        if self.meta.frozen:
+            return self
+        new = self.__class__.__new__(self.__class__)
+        vals = new.__dict__
+        vals.update(self.__dict__)
+        if deep:
+            for f in self._fields:
+                val = vals.get(f.field_name)
+                if val is not None:
+                    vals[f.field_name] = f.clone_value(self,val)
+        return new
+
     def _parse_children_ordered(self,node,fields,fields_found):
         """Parse the children of the given node using strict field ordering."""
         cur_field_idx = 0 
@@ -388,7 +841,8 @@ class Model(object):
                     err = "unknown attribute: %s" % (node.name,)
                     raise ParseError(err)
 
-    def render(self,encoding=None,fragment=False,pretty=False,nsmap=None):
+    def render(self,encoding=None,fragment=False,pretty=False,nsmap=None,
+                    workers=None,only=None,exclude=None):
         """Produce XML from this model's instance data.
 
         A unicode string will be returned if any of the objects contain
@@ -398,19 +852,65 @@ class Model(object):
         By default a complete XML document is produced, including the
         leading "<?xml>" declaration.  To generate an XML fragment set
         the 'fragment' argument to True.
+
+        To render the items of large List and Dict fields on this model in
+        parallel, set the 'workers' argument to a number of processes or to
+        a multiprocessing.Pool instance.  See dexml.parallel for details.
+
+        To render only some of the fields, give a list of field names as
+        the 'only' or 'exclude' argument.  See dexml.projection for details.
         """
+        if metrics.registry.enabled:
+            return metrics.registry.call(self.__class__,"render",None,
+                                         self._render_document,encoding,
+                                         fragment,pretty,nsmap,workers,
+                                         only,exclude)
+        return self._render_document(encoding,fragment,pretty,nsmap,workers,
+                                     only,exclude)
+
+    def _render_document(self,encoding,fragment,pretty,nsmap,workers,
+                              only=None,exclude=None):
+        """Implementation of render(), without metrics."""
         if nsmap is None:
             nsmap = {}
-        data = []
+        if only is not None or exclude is not None:
+            if workers:
+                raise ValueError("Can't use 'only' or 'exclude' with workers")
+            plan = Projection(self.__class__,only,exclude).plan
+            def render_into(self,nsmap,out):
+                self._render_into(nsmap,out,plan)
+        elif workers:
+            render_into = parallel.ParallelRenderer(workers).render_into
+        else:
+            render_into = self.__class__._render_into
         header = '<?xml version="1.0" ?>'
         if encoding:
             header = '<?xml version="1.0" encoding="%s" ?>' % (encoding,)
+        if encoding and not pretty:
+            #  Encode directly into the output buffer, so that we never
+            #  hold a full copy of the document in unicode form.  The
+            #  encoded chunks are joined once at the end, so the peak is
+            #  still two copies of the encoded document.
+            chunks = _ChunkWriter()
+            out = _EncodingBuffer(encoding,chunks)
+            if not fragment:
+                out.append(header)
+            render_into(self,nsmap,out)
+            out.flush(final=True)
+            return b"".join(chunks)
+        data = []
         if not fragment:
             data.append(header)
 
-        data.extend(self._render(nsmap))
+        render_into(self,nsmap,data)
         xml = "".join(data)
         if pretty:
+            #  Encode to match the declaration, since expat can't be given
+            #  non-ascii unicode on python2.  Without one it assumes utf-8.
+            if fragment or not encoding:
+                xml = xml.encode("utf-8")
+            else:
+                xml = xml.encode(encoding)
             xml = minidom.parseString(xml).toprettyxml()
             # Hack for removing the `<?xml version="1.0"?>` header that
             # minidom adds when pretty printing.
@@ -426,37 +926,201 @@ class Model(object):
             xml = xml.encode(encoding)
         return xml
 
-    def irender(self,encoding=None,fragment=False,nsmap=None):
+    @classmethod
+    def generate(cls,size=10,seed=None,**kwds):
+        """Produce a random instance of this model, for testing.
+
+        The 'size' argument gives the number of items in each List or Dict
+        field of the instance, and 'seed' makes the output repeatable.  See
+        dexml.synth for details and the other available options.
+        """
+        return synth.Generator(seed=seed,size=size,**kwds).generate(cls)
+
+    @classmethod
+    def render_many(cls,instances,encoding=None,fragment=False,framed=False):
+        """Produce XML for each of a sequence of model instances.
+
+        This is equivalent to calling render() on each instance in turn,
+        but shares the per-call setup work between them, which makes a
+        big difference when rendering many small documents.  A list of
+        strings is returned, one per instance.
+
+        If the 'framed' argument is True, a tuple (data,offsets) is returned
+        instead, where 'data' is a single string containing all of the
+        documents and 'offsets' is a list of positions in it such that the
+        i'th document is data[offsets[i]:offsets[i+1]].
+        """
+        header = '<?xml version="1.0" ?>'
+        encode = None
+        if encoding:
+            header = '<?xml version="1.0" encoding="%s" ?>' % (encoding,)
+            encode = codecs.getencoder(encoding)
+        results = []
+        out = []
+        nsmap = {}
+        for inst in instances:
+            if not fragment:
+                out.append(header)
+            inst._render_into(nsmap,out)
+            xml = "".join(out)
+            del out[:]
+            if encode is not None:
+                xml = encode(xml)[0]
+            results.append(xml)
+        if not framed:
+            return results
+        offsets = [0]
+        for xml in results:
+            offsets.append(offsets[-1] + len(xml))
+        if encode is not None:
+            return (b"".join(results),offsets)
+        return ("".join(results),offsets)
+
+    def irender(self,encoding=None,fragment=False,nsmap=None,only=None,
+                     exclude=None):
         """Generator producing XML from this model's instance data.
 
         If any of the objects contain unicode values, the resulting output
         stream will be a mix of bytestrings and unicode; specify the 'encoding'
-        arugment to force generation of bytestrings.
+        arugment to force generation of bytestrings.  When an encoding is
+        given, small fragments are coalesced into chunks of
+        RENDER_CHUNK_SIZE fragments before being encoded.
 
         By default a complete XML document is produced, including the
         leading "<?xml>" declaration.  To generate an XML fragment set
-        the 'fragment' argument to True.
+        the 'fragment' argument to True.  The 'only' and 'exclude' arguments
+        select fields to render, as for render().
         """
+        projection = None
+        if only is not None or exclude is not None:
+            projection = Projection(self.__class__,only,exclude)
+        chunks = self._irender(encoding,fragment,nsmap,projection)
+        if metrics.registry.enabled:
+            return metrics.registry.iterate(self.__class__,"irender",chunks)
+        return chunks
+
+    def _irender(self,encoding,fragment,nsmap,projection=None):
+        """Implementation of irender(), without metrics."""
         if nsmap is None:
             nsmap = {}
-        if not fragment:
-            if encoding:
-                decl = '<?xml version="1.0" encoding="%s" ?>' % (encoding,)
-                yield decl.encode(encoding)
-            else:
-                yield '<?xml version="1.0" ?>'
         if encoding:
-            for data in self._render(nsmap):
-                if isinstance(data,unicode):
-                    data = data.encode(encoding)
+            decl = None
+            if not fragment:
+                decl = '<?xml version="1.0" encoding="%s" ?>' % (encoding,)
+            chunks = self._render(nsmap,projection)
+            for data in _encode_chunks(chunks,encoding,decl):
                 yield data
         else:
-            for data in self._render(nsmap):
+            if not fragment:
+                yield '<?xml version="1.0" ?>'
+            for data in self._render(nsmap,projection):
                 yield data
 
-    def _render(self,nsmap):
-        """Generator rendering this model as an XML fragment."""
-        #  Determine opening and closing tags
+    def _render(self,nsmap,projection=None):
+        """Generator rendering this model as an XML fragment.
+
+        If a Projection is given, only its selected fields are rendered.
+        """
+        if projection is None:
+            render_fields = self._fields
+            wrappers = _NO_WRAPPERS
+        else:
+            render_fields = projection.fields
+            wrappers = projection.wrappers
+        (open_tag_contents,close_tag_contents,pushed_ns) = self._render_tags(nsmap)
+        used_fields = set()
+        open_tag_contents.extend(self._render_attributes(used_fields,nsmap,
+                                                         render_fields,wrappers))
+        #  Render each child node
+        children = self._render_children(used_fields,nsmap,render_fields,
+                                         wrappers)
+        try:
+            first_child = children.next()
+        except StopIteration:
+            yield "<%s />" % (" ".join(open_tag_contents),)
+        else:
+            yield "<%s>" % (" ".join(open_tag_contents),)
+            yield first_child
+            for child in children:
+                yield child
+            yield "</%s>" % (close_tag_contents,)
+        #  Check that all required fields actually rendered something
+        for f in render_fields:
+            if f.required and f not in used_fields:
+                raise RenderError("Field '%s' is missing" % (f.field_name,))
+        #  Clean up
+        if pushed_ns:
+            nsmap[self.meta.namespace_prefix].pop(0)
+
+    def _render_into(self,nsmap,out,plan=None):
+        """Render this model as an XML fragment, appending to list 'out'.
+
+        This does the same job as _render() but uses the buffer-based
+        field rendering protocol, avoiding the overhead of a generator
+        for each field of each instance.  Whether a field rendered anything
+        is determined by watching the length of the output list.
+
+        The optional 'plan' argument can be used to override the rendering
+        methods; see _get_render_plan() for details.
+        """
+        (open_tag_contents,close_tag_contents,pushed_ns) = self._render_tags(nsmap)
+        used_fields = set()
+        if plan is None:
+            plan = self._get_render_plan()
+        for (f,render_attributes,_) in plan:
+            n = len(open_tag_contents)
+            render_attributes(self,f.peek_value(self),nsmap,open_tag_contents)
+            if len(open_tag_contents) > n:
+                used_fields.add(f)
+        out.append("<%s>" % (" ".join(open_tag_contents),))
+        start = n = len(out)
+        for (f,_,render_children) in plan:
+            render_children(self,f.peek_value(self),nsmap,out)
+            if len(out) > n:
+                used_fields.add(f)
+                n = len(out)
+        if n == start:
+            out[-1] = "<%s />" % (" ".join(open_tag_contents),)
+        else:
+            out.append("</%s>" % (close_tag_contents,))
+        #  Check that all required fields actually rendered something
+        for (f,_,_) in plan:
+            if f.required and f not in used_fields:
+                raise RenderError("Field '%s' is missing" % (f.field_name,))
+        #  Clean up
+        if pushed_ns:
+            nsmap[self.meta.namespace_prefix].pop(0)
+        #  Give buffers that write out their contents a chance to do so.
+        if out.__class__ is not list:
+            flush = getattr(out,"maybe_flush",None)
+            if flush is not None:
+                flush()
+
+    @classmethod
+    def _get_render_plan(cls):
+        """Get list of (field,render_attributes_into,render_children_into).
+
+        This is calculated once per class, since checking whether each field
+        natively supports the buffer-based rendering protocol is not free.
+        """
+        try:
+            return cls.__dict__["_render_plan"]
+        except KeyError:
+            plan = []
+            for f in cls._fields:
+                plan.append((f,fields._render_into_method(f,"render_attributes"),
+                             fields._render_into_method(f,"render_children")))
+            cls._render_plan = plan
+            return plan
+
+    def _render_tags(self,nsmap):
+        """Determine contents of the opening and closing tags for rendering.
+
+        This returns a tuple (open_tag_contents,close_tag_contents,pushed_ns)
+        where the first item is a list to which attributes can be added.
+        If 'pushed_ns' is true, the model's namespace has been pushed onto
+        the nsmap and must be popped once rendering is complete.
+        """
         pushed_ns = False
         if self.meta.namespace:
             namespace = self.meta.namespace
@@ -484,31 +1148,13 @@ class Model(object):
         else:
             open_tag_contents = [self.meta.tagname] 
             close_tag_contents = self.meta.tagname
-        used_fields = set()
-        open_tag_contents.extend(self._render_attributes(used_fields,nsmap))
-        #  Render each child node
-        children = self._render_children(used_fields,nsmap)
-        try:
-            first_child = children.next()
-        except StopIteration:
-            yield "<%s />" % (" ".join(open_tag_contents),)
-        else:
-            yield "<%s>" % (" ".join(open_tag_contents),)
-            yield first_child
-            for child in children:
-                yield child
-            yield "</%s>" % (close_tag_contents,)
-        #  Check that all required fields actually rendered something
-        for f in self._fields:
-            if f.required and f not in used_fields:
-                raise RenderError("Field '%s' is missing" % (f.field_name,))
-        #  Clean up
-        if pushed_ns:
-            nsmap[prefix].pop(0)
+        return (open_tag_contents,close_tag_contents,pushed_ns)
 
-    def _render_attributes(self,used_fields,nsmap):
-        for f in self._fields:
-            val = getattr(self,f.field_name)
+    def _render_attributes(self,used_fields,nsmap,render_fields,wrappers):
+        for f in render_fields:
+            val = f.peek_value(self)
+            if f in wrappers and val is not None:
+                val = wrappers[f](val)
             datas = iter(f.render_attributes(self,val,nsmap))
             try:
                 data = datas.next()
@@ -520,9 +1166,11 @@ class Model(object):
                 for data in datas:
                     yield data
 
-    def _render_children(self,used_fields,nsmap):
-        for f in self._fields:
-            val = getattr(self,f.field_name)
+    def _render_children(self,used_fields,nsmap,render_fields,wrappers):
+        for f in render_fields:
+            val = f.peek_value(self)
+            if f in wrappers and val is not None:
+                val = wrappers[f](val)
             datas = iter(f.render_children(self,val,nsmap))
             try:
                 data = datas.next()
@@ -535,14 +1183,19 @@ class Model(object):
                     yield data
 
     @staticmethod
-    def _make_xml_node(xml):
+    def _make_xml_node(xml,limits=None):
         """Transform a variety of input formats to an XML DOM node."""
         try:
             ntype = xml.nodeType
         except AttributeError:
             if isinstance(xml,bytes):
                 try:
-                    xml = minidom.parseString(xml)
+                    if limits is not None:
+                        xml = limits.parse(xml)
+                    else:
+                        xml = _DOMBuilder().parseString(xml)
+                except ParseError:
+                    raise
                 except Exception, e:
                     raise XmlError(e)
             elif isinstance(xml,unicode):
@@ -554,12 +1207,23 @@ class Model(object):
                         encoding = "utf8"
                     else:
                         encoding = encoding.group(1)
-                    xml = minidom.parseString(xml.encode(encoding))
+                    xml = xml.encode(encoding)
+                    if limits is not None:
+                        xml = limits.parse(xml)
+                    else:
+                        xml = _DOMBuilder().parseString(xml)
+                except ParseError:
+                    raise
                 except Exception, e:
                     raise XmlError(e)
             elif hasattr(xml,"read"):
                 try:
-                    xml = minidom.parse(xml)
+                    if limits is not None:
+                        xml = limits.parse(xml)
+                    else:
+                        xml = _DOMBuilder().parseFile(xml)
+                except ParseError:
+                    raise
                 except Exception, e:
                     raise XmlError(e)
             else:
@@ -0,0 +1,11 @@
+"""
+
+Command-line entry point for dexml; see dexml.cli for details.
+
+"""
+
+import sys
+
+from dexml.cli import main
+
+sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+
+dexml.cache:  content-addressed cache for parsed models
+=======================================================
+
+This module provides the ParseCache class, an opt-in cache for the results
+of Model.parse().  It's useful when the same XML documents are parsed over
+and over again, for example configuration blobs or catalog snapshots:
+
+    cache = ParseCache(max_entries=1000)
+    obj = cache.parse(MyModel,xml)
+
+Entries are keyed by a hash of the input data and the model class, and are
+held in the compact encoding produced by Model.dumps().  Each hit decodes a
+fresh instance, so callers can't corrupt the cached copy.
+
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+
+import dexml
+
+
+class _LRUTable(object):
+    """Base class for tables of entries with least-recently-used eviction.
+
+    Entries are kept in a dict of links, and in a circular doubly-linked
+    list in order of use, with each link being [prev,next,key,value].  The
+    methods with a leading underscore must be called with the table's lock
+    held.  Subclasses name their counters in the '_counters' attribute.
+    """
+
+    _counters = ("hits","misses","evictions")
+
+    def __init__(self,max_entries=None):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._root = root = []
+        root[:] = [root,root,None,None]
+        self._links = {}
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._links)
+
+    def reset_stats(self):
+        """Reset all hit/miss counters to zero."""
+        for name in self._counters:
+            setattr(self,name,0)
+
+    def stats(self):
+        """Get a dict giving the current value of each counter."""
+        stats = dict((name,getattr(self,name)) for name in self._counters)
+        stats["entries"] = len(self._links)
+        return stats
+
+    def clear(self):
+        """Remove all entries from the table."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        root = self._root
+        root[:] = [root,root,None,None]
+        self._links.clear()
+
+    def _touch(self,key):
+        """Get the link for the given key and mark it as most recently used.
+
+        If the key is not in the table then None is returned.
+        """
+        link = self._links.get(key)
+        if link is not None:
+            self._unlink(link)
+            self._link_first(link)
+        return link
+
+    def _insert(self,key,value):
+        """Add an entry to the table, replacing any existing one."""
+        self._remove(key)
+        link = [None,None,key,value]
+        self._links[key] = link
+        self._link_first(link)
+        self._added(link)
+        self._evict()
+        return link
+
+    def _remove(self,key):
+        """Remove the entry for the given key, if there is one."""
+        link = self._links.pop(key,None)
+        if link is not None:
+            self._unlink(link)
+            self._removed(link)
+        return link
+
+    def _added(self,link):
+        """Hook called when an entry is added to the table."""
+        pass
+
+    def _removed(self,link):
+        """Hook called when an entry is removed from the table."""
+        pass
+
+    def _over_bounds(self):
+        """Check whether the table has grown beyond its bounds."""
+        return self.max_entries is not None and len(self._links) > self.max_entries
+
+    def _evict(self):
+        """Evict least-recently-used entries until within bounds."""
+        while self._links and self._over_bounds():
+            self._remove(self._root[0][2])
+            self.evictions += 1
+
+    def _unlink(self,link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+    def _link_first(self,link):
+        root = self._root
+        link[0] = root
+        link[1] = root[1]
+        root[1][0] = link
+        root[1] = link
+
+
+class ParseCache(_LRUTable):
+    """Cache of parsed Model instances with LRU eviction.
+
+    The size of the cache can be bounded by number of entries, by the total
+    size of the encoded entries in bytes, or both; the least-recently-used
+    entries are evicted when either bound is exceeded.  If the 'directory'
+    argument is given then entries are also written to files in that
+    directory, and looked up there when they are not found in memory.
+    The on-disk tier is not bounded, so prune it as you see fit.  Parsed
+    instances that Model.dumps() can't encode are returned uncached.
+
+    The following counters are maintained:
+
+        * hits:       number of lookups answered from memory
+        * disk_hits:  number of lookups answered from the on-disk tier
+        * misses:     number of lookups that required a full parse
+        * evictions:  number of entries evicted from memory
+
+    """
+
+    _counters = ("hits","disk_hits","misses","evictions")
+
+    def __init__(self,max_entries=None,max_bytes=None,directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._size = 0
+        super(ParseCache,self).__init__(max_entries)
+
+    @property
+    def size(self):
+        """Total size in bytes of the entries currently held in memory."""
+        return self._size
+
+    def stats(self):
+        """Get a dict giving the current value of each counter."""
+        stats = super(ParseCache,self).stats()
+        stats["size"] = self._size
+        return stats
+
+    def clear(self):
+        """Remove all entries from the in-memory tier of the cache."""
+        with self._lock:
+            self._clear()
+            self._size = 0
+
+    def parse(self,cls,xml):
+        """Produce an instance of the given model from some xml.
+
+        This behaves like cls.parse(xml), but consults the cache first.
+        The xml can be a string or a readable file-like object; DOM nodes
+        are passed straight through to cls.parse() without caching.
+        """
+        if hasattr(xml,"nodeType"):
+            return cls.parse(xml)
+        if hasattr(xml,"read"):
+            xml = xml.read()
+        key = self._make_key(cls,xml)
+        data = self._get(key)
+        if data is not None:
+            try:
+                return cls.loads(data)
+            except dexml.ParseError:
+                #  Most likely a stale on-disk entry for an older version
+                #  of the model class; treat it as a miss.
+                self._discard(key)
+        with self._lock:
+            self.misses += 1
+        inst = cls.parse(xml)
+        try:
+            data = inst.dumps()
+        except ValueError:
+            #  Some field values can't be encoded, so don't cache them.
+            return inst
+        self._put(key,data)
+        return inst
+
+    def _make_key(self,cls,xml):
+        """Make a cache key for the given class and input data."""
+        h = hashlib.sha1()
+        clsname = "%s.%s" % (cls.__module__,cls.__name__,)
+        h.update(clsname.encode("utf8"))
+        if isinstance(xml,dexml.unicode):
+            h.update(b"\x00u")
+            h.update(xml.encode("utf8"))
+        else:
+            h.update(b"\x00b")
+            h.update(xml)
+        return (cls,h.hexdigest())
+
+    def _get(self,key):
+        """Get encoded data for the given key, or None if not cached."""
+        with self._lock:
+            link = self._touch(key)
+            if link is not None:
+                self.hits += 1
+                return link[3]
+        if self.directory is not None:
+            data = self._disk_get(key)
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put(key,data,write_disk=False)
+                return data
+        return None
+
+    def _put(self,key,data,write_disk=True):
+        """Store encoded data under the given key."""
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key,data)
+        if write_disk and self.directory is not None:
+            self._disk_put(key,data)
+
+    def _discard(self,key):
+        """Remove the given key from all tiers of the cache."""
+        with self._lock:
+            self._remove(key)
+        if self.directory is not None:
+            try:
+                os.unlink(self._disk_path(key))
+            except EnvironmentError:
+                pass
+
+    def _added(self,link):
+        self._size += len(link[3])
+
+    def _removed(self,link):
+        self._size -= len(link[3])
+
+    def _over_bounds(self):
+        if super(ParseCache,self)._over_bounds():
+            return True
+        return self.max_bytes is not None and self._size > self.max_bytes
+
+    def _disk_path(self,key):
+        return os.path.join(self.directory,key[1] + ".dexml")
+
+    def _disk_get(self,key):
+        try:
+            f = open(self._disk_path(key),"rb")
+        except EnvironmentError:
+            return None
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def _disk_put(self,key,data):
+        #  Write to a temp file and rename, so that concurrent readers
+        #  never see a partially-written entry.
+        (fd,tmppath) = tempfile.mkstemp(dir=self.directory)
+        try:
+            f = os.fdopen(fd,"wb")
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmppath,self._disk_path(key))
+        except EnvironmentError:
+            try:
+                os.unlink(tmppath)
+            except EnvironmentError:
+                pass
@@ -0,0 +1,296 @@
+"""
+
+dexml.cli:  command-line batch processing of XML files
+======================================================
+
+This module implements the "python -m dexml" command, which applies one of
+a number of operations to a batch of XML files using a given model class:
+
+    python -m dexml validate myapp.models:Order "orders/*.xml"
+    python -m dexml render --pretty -o pretty/ myapp.models:Order orders/
+    python -m dexml to-json -j 8 -o json/ myapp.models.Order orders/
+
+The available commands are:
+
+    * parse:     parse each file, reporting any that fail
+    * validate:  parse each file and check that it can be rendered again
+    * render:    parse and re-render each file, optionally pretty-printed
+    * to-json:   convert each file to JSON, keyed by field name
+
+The model is given as "module:Class" or "module.Class".  Files can be given
+as names or glob patterns, and directories are searched for files ending in
+".xml".  They are processed in a pool of worker processes, and the output
+of "render" and "to-json" is either written to stdout in order or to a file
+per input in the directory given by the -o option.  Files found by
+searching a directory are written at the same relative path under the
+output directory, and others by their base name; it's an error for two
+inputs to map to the same output file.  A summary of throughput is written
+to stderr, and the exit status is 1 if any file failed.
+
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import optparse
+import multiprocessing
+
+import dexml
+from dexml import fields
+
+
+COMMANDS = ("parse","validate","render","to-json",)
+
+USAGE = """%prog COMMAND [options] MODEL FILE...
+
+Commands:
+  parse       parse each file, reporting any that fail
+  validate    parse each file and check that it can be rendered again
+  render      parse and re-render each file
+  to-json     convert each file to JSON"""
+
+#  Extension of the output files written by each command.
+_OUTPUT_EXTENSIONS = {"render":".xml","to-json":".json"}
+
+#  Errors that cause a single file to fail, rather than the whole run.
+_FILE_ERRORS = (dexml.Error,ValueError,EnvironmentError,)
+
+
+def main(argv=None,stdout=None,stderr=None):
+    """Run the command-line interface, returning the exit status."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if stdout is None:
+        stdout = sys.stdout
+    if stderr is None:
+        stderr = sys.stderr
+    parser = _make_option_parser()
+    (opts,args) = parser.parse_args(argv)
+    if len(args) < 3:
+        parser.error("a command, a model and at least one file are required")
+    (command,model_path,patterns) = (args[0],args[1],args[2:])
+    if command not in COMMANDS:
+        parser.error("unknown command: %s" % (command,))
+    try:
+        load_model(model_path)
+    except (ImportError,AttributeError,ValueError), e:
+        parser.error("can't load model '%s': %s" % (model_path,e,))
+    inputs = _find_inputs(patterns)
+    if not inputs:
+        parser.error("no files found")
+    filenames = [filename for (filename,_) in inputs]
+    outfiles = [None] * len(inputs)
+    if opts.output_dir and command in _OUTPUT_EXTENSIONS:
+        ext = _OUTPUT_EXTENSIONS[command]
+        seen = {}
+        for (i,(filename,relname)) in enumerate(inputs):
+            outfile = os.path.join(opts.output_dir,os.path.splitext(relname)[0] + ext)
+            if outfile in seen:
+                parser.error("'%s' and '%s' would both be written to '%s'"
+                             % (seen[outfile],filename,outfile,))
+            seen[outfile] = filename
+            outfiles[i] = outfile
+    options = {"pretty":opts.pretty,"encoding":opts.encoding}
+    tasks = [(command,model_path,filename,outfile,options)
+             for (filename,outfile) in zip(filenames,outfiles)]
+    #  Output is encoded, so write it to the underlying binary stream.
+    out = getattr(stdout,"buffer",stdout)
+    start = time.time()
+    num_failed = 0
+    num_bytes = 0
+    for (filename,size,output,error) in _run_tasks(tasks,opts.workers):
+        num_bytes += size
+        if error is not None:
+            num_failed += 1
+            stderr.write("%s: %s\n" % (filename,error,))
+        elif output is not None:
+            out.write(output)
+            out.write(b"\n")
+    elapsed = max(time.time() - start,1e-6)
+    if not opts.quiet:
+        msg = "%s: %d files (%.1f MB) in %.2fs, %.1f files/s, %.2f MB/s"
+        stderr.write(msg % (command,len(filenames),num_bytes / 1e6,elapsed,
+                            len(filenames) / elapsed,
+                            num_bytes / 1e6 / elapsed,))
+        if num_failed:
+            stderr.write(", %d failed" % (num_failed,))
+        stderr.write("\n")
+    if num_failed:
+        return 1
+    return 0
+
+
+def _make_option_parser():
+    parser = optparse.OptionParser(usage=USAGE,prog="python -m dexml")
+    parser.add_option("-j","--workers",type="int",default=None,
+                      help="number of worker processes [default: cpu count]")
+    parser.add_option("-o","--output-dir",default=None,
+                      help="write output files to this directory")
+    parser.add_option("--pretty",action="store_true",default=False,
+                      help="pretty-print rendered XML")
+    parser.add_option("--encoding",default="utf-8",
+                      help="encoding of output [default: %default]")
+    parser.add_option("-q","--quiet",action="store_true",default=False,
+                      help="don't print throughput statistics")
+    return parser
+
+
+def load_model(path):
+    """Import a model class given as "module:Class" or "module.Class"."""
+    if ":" in path:
+        (modname,clsname) = path.split(":",1)
+    else:
+        (modname,_,clsname) = path.rpartition(".")
+    if not modname or not clsname:
+        raise ValueError("expected 'module:Class'")
+    __import__(modname)
+    cls = getattr(sys.modules[modname],clsname)
+    if not isinstance(cls,dexml.ModelMetaclass):
+        raise ValueError("%s is not a dexml Model" % (clsname,))
+    return cls
+
+
+def find_files(patterns):
+    """Expand a list of filenames, glob patterns and directories.
+
+    Directories are searched recursively for files ending in ".xml".  The
+    resulting list is in order, without duplicates.
+    """
+    return [filename for (filename,_) in _find_inputs(patterns)]
+
+
+def _find_inputs(patterns):
+    """Expand patterns as find_files(), into (filename,relname) pairs.
+
+    The 'relname' is the path to use for the file's output, relative to
+    the output directory.
+    """
+    inputs = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = []
+            for (dirpath,dirnames,names) in os.walk(pattern):
+                dirnames.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(".xml"):
+                        filename = os.path.join(dirpath,name)
+                        relname = os.path.relpath(filename,pattern)
+                        matches.append((filename,relname))
+        else:
+            if glob.has_magic(pattern):
+                filenames = sorted(glob.glob(pattern))
+            else:
+                filenames = [pattern]
+            matches = [(filename,os.path.basename(filename))
+                       for filename in filenames]
+        for (filename,relname) in matches:
+            if filename not in seen:
+                seen.add(filename)
+                inputs.append((filename,relname))
+    return inputs
+
+
+def _run_tasks(tasks,workers):
+    """Generate the result of each task, in order, using a process pool."""
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(tasks) == 1:
+        for task in tasks:
+            yield _process_file(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        chunksize = max(1,min(16,len(tasks) // (workers * 4)))
+        for result in pool.imap(_process_file,tasks,chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _process_file(task):
+    """Apply a command to a single file.
+
+    This returns a tuple (filename,size,output,error) where 'output' is
+    any data to be written to stdout, and 'error' describes the failure
+    if the file could not be processed.  If the task gives an output file
+    then the data is written there instead.
+    """
+    (command,model_path,filename,outfile,options) = task
+    size = 0
+    try:
+        cls = load_model(model_path)
+        f = open(filename,"rb")
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        size = len(data)
+        obj = cls.parse(data)
+        if command == "parse":
+            return (filename,size,None,None)
+        encoding = options["encoding"]
+        if command == "to-json":
+            output = json.dumps(to_json(obj),indent=2,separators=(",",": "),
+                                sort_keys=True,
+                                ensure_ascii=False)
+            if not isinstance(output,dexml.unicode):
+                output = output.decode("utf8")
+            output = output.encode(encoding)
+        else:
+            output = obj.render(encoding=encoding,pretty=options["pretty"])
+        if command == "validate":
+            return (filename,size,None,None)
+        if outfile is None:
+            return (filename,size,output,None)
+        outdir = os.path.dirname(outfile)
+        if outdir and not os.path.isdir(outdir):
+            try:
+                os.makedirs(outdir)
+            except OSError:
+                #  Another worker may have just created it.
+                if not os.path.isdir(outdir):
+                    raise
+        f = open(outfile,"wb")
+        try:
+            f.write(output)
+        finally:
+            f.close()
+        return (filename,size,None,None)
+    except _FILE_ERRORS, e:
+        return (filename,size,None,"%s: %s" % (e.__class__.__name__,e,))
+
+
+def to_json(model):
+    """Convert a model instance to a JSON-compatible dict.
+
+    Each field with a value appears under its field name.  Nested models
+    become dicts, List fields become lists, Dict fields become dicts keyed
+    by the key field, and XmlNode fields become strings of XML.  Values of
+    types that JSON can't represent, such as dates, are given in the same
+    string form as in the XML.
+    """
+    result = {}
+    for f in model._fields:
+        val = f.peek_value(model)
+        if val is not None:
+            result[f.field_name] = _json_value(model,f,val)
+    return result
+
+
+def _json_value(obj,field,val):
+    if isinstance(val,dexml.Model):
+        return to_json(val)
+    if isinstance(field,fields.List):
+        return [_json_value(obj,field.field,item) for item in val]
+    if isinstance(field,fields.Dict):
+        return dict((key,_json_value(obj,field.field,item))
+                    for (key,item) in val.items())
+    if isinstance(field,fields.XmlNode):
+        return "".join(field.render_children(obj,val,{}))
+    if isinstance(val,(bool,int,long,float,basestring)):
+        return val
+    return field.render_value(val)
@@ -0,0 +1,238 @@
+"""
+
+dexml.delta:  structural diff and patch of model instances
+==========================================================
+
+This module computes the differences between two instances of a model, as
+a list of changes to individual fields, list items and dict entries:
+
+    changes = dexml.diff(old,new)
+    data = changes.dumps()
+    ...
+    dexml.patch(replica,dexml.ChangeSet.loads(data))
+
+The size of a change set is proportional to the size of the change rather
+than that of the document, so it's a cheap way to keep copies of a large
+document in sync.
+
+Each change is a tuple (op,path,data).  The path is a tuple giving the
+field names to follow down from the root model, with each List or Dict
+field name followed by the index or key of an item within it.  The op
+is one of:
+
+    * "set":     set the field or item at the path to the given value
+    * "insert":  insert the given value into a list at the path's index
+    * "remove":  remove the list item or dict entry at the path
+
+Values are held in the encoding produced by Field.dump_value(), so change
+sets can be serialized in the same way as Model.dumps().  A change set
+is only meaningful for the model class from which it was produced.
+
+"""
+
+import sys
+import difflib
+import marshal
+
+import dexml
+from dexml import fields
+
+
+#  The 'autojunk' heuristic would treat frequently-repeated items as junk,
+#  giving needlessly large diffs of long lists.  It can only be turned off
+#  from python 2.7.1; before that the diffs are still correct, just larger.
+if sys.version_info >= (2,7,1):
+    _MATCHER_KWDS = {"autojunk":False}
+else:
+    _MATCHER_KWDS = {}
+
+
+class ChangeSet(list):
+    """List of changes between two model instances, as produced by diff()."""
+
+    def dumps(self):
+        """Produce a compact binary encoding of this change set."""
+        return marshal.dumps(tuple(self),dexml._MARSHAL_VERSION)
+
+    @classmethod
+    def loads(cls,data):
+        """Produce a change set from the output of dumps()."""
+        try:
+            changes = marshal.loads(data)
+        except (ValueError,EOFError,TypeError), e:
+            raise dexml.ParseError(e)
+        if not isinstance(changes,tuple):
+            raise dexml.ParseError("invalid change set data")
+        for change in changes:
+            if not isinstance(change,tuple) or len(change) != 3:
+                raise dexml.ParseError("invalid change set data")
+        return cls(changes)
+
+
+def diff(old,new):
+    """Compute the changes needed to turn model 'old' into model 'new'.
+
+    Both arguments must be instances of the same Model class.  The result
+    is a ChangeSet which can be given to patch() to apply the changes.
+    """
+    if old.__class__ is not new.__class__:
+        raise ValueError("Can't diff instances of different classes")
+    changes = ChangeSet()
+    _diff_models(old,new,(),changes)
+    return changes
+
+
+def patch(model,changes):
+    """Apply a set of changes produced by diff() to the given model.
+
+    The model is modified in place, and also returned for convenience.
+    ValueError is raised if a change doesn't fit the structure of the
+    model, for example if it refers to a list item that doesn't exist.
+    """
+    for (op,path,data) in changes:
+        if op not in ("set","insert","remove"):
+            raise ValueError("Unknown change operation: %r" % (op,))
+        if not path:
+            raise ValueError("Change has an empty path")
+        _apply(model,op,path,data)
+    return model
+
+
+def _find_field(cls,name):
+    for f in cls._fields:
+        if f.field_name == name:
+            return f
+    raise ValueError("Class '%s' has no field '%s'" % (cls.__name__,name,))
+
+
+def _diff_models(old,new,path,changes):
+    """Append changes turning 'old' into 'new' to the list 'changes'."""
+    old_vals = old.__dict__
+    new_vals = new.__dict__
+    for f in old._fields:
+        name = f.field_name
+        old_val = old_vals.get(name)
+        new_val = new_vals.get(name)
+        if old_val is new_val:
+            continue
+        fpath = path + (name,)
+        if isinstance(f,fields.List):
+            _diff_lists(f,old,old_val or (),new_val or (),fpath,changes)
+        elif isinstance(f,fields.Dict):
+            _diff_dicts(f,old,old_val or {},new_val or {},fpath,changes)
+        else:
+            _diff_values(f,old,old_val,new_val,fpath,changes)
+
+
+def _diff_values(field,obj,old_val,new_val,path,changes):
+    """Diff two values of a field, recursing into submodels."""
+    if isinstance(field,(fields.Model,fields.Choice)):
+        if old_val is not None and new_val is not None:
+            if old_val.__class__ is new_val.__class__:
+                _diff_models(old_val,new_val,path,changes)
+                return
+    new_data = field.dump_value(obj,new_val)
+    if field.dump_value(obj,old_val) != new_data:
+        changes.append(("set",path,new_data))
+
+
+def _diff_lists(field,obj,old_items,new_items,path,changes):
+    """Diff two lists of items, as a sequence of inserts and removals."""
+    item_field = field.field
+    old_data = [item_field.dump_value(obj,item) for item in old_items]
+    new_data = [item_field.dump_value(obj,item) for item in new_items]
+    old_keys = [marshal.dumps(d,dexml._MARSHAL_VERSION) for d in old_data]
+    new_keys = [marshal.dumps(d,dexml._MARSHAL_VERSION) for d in new_data]
+    matcher = difflib.SequenceMatcher(None,old_keys,new_keys,**_MATCHER_KWDS)
+    #  Work backwards through the lists, so that the indices in each change
+    #  are unaffected by the changes that come before it.
+    for (tag,i1,i2,j1,j2) in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            for k in xrange(i2 - i1):
+                _diff_values(item_field,obj,old_items[i1+k],new_items[j1+k],
+                             path + (i1+k,),changes)
+            continue
+        for i in xrange(i2 - 1,i1 - 1,-1):
+            changes.append(("remove",path + (i,),None))
+        for j in xrange(j1,j2):
+            changes.append(("insert",path + (i1+j-j1,),new_data[j]))
+
+
+def _diff_dicts(field,obj,old_items,new_items,path,changes):
+    """Diff two dicts of items, by key."""
+    item_field = field.field
+    for key in old_items:
+        if key not in new_items:
+            changes.append(("remove",path + (key,),None))
+    for (key,new_val) in new_items.iteritems():
+        if key not in old_items:
+            changes.append(("set",path + (key,),item_field.dump_value(obj,new_val)))
+        else:
+            _diff_values(item_field,obj,old_items[key],new_val,path + (key,),changes)
+
+
+def _load_item(field,obj,data):
+    """Load a single item of a List or Dict field from its dumped form."""
+    tmpobj = fields._AttrBucket()
+    field.field.load_value(tmpobj,data)
+    return getattr(tmpobj,field.field_name,None)
+
+
+def _apply(model,op,path,data):
+    """Apply a single change, starting from the given model."""
+    if model.meta.frozen:
+        err = "Can't patch frozen model '%s'"
+        raise ValueError(err % (model.__class__.__name__,))
+    f = _find_field(model.__class__,path[0])
+    rest = path[1:]
+    if isinstance(f,(fields.List,fields.Dict)) and rest:
+        items = f.__get__(model)
+        key = rest[0]
+        rest = rest[1:]
+        if rest:
+            try:
+                item = items[key]
+            except (LookupError,TypeError):
+                raise ValueError("Field '%s' has no item %r" % (f.field_name,key,))
+            return _apply_to_item(item,op,rest,data)
+        if isinstance(f,fields.List):
+            if not isinstance(key,(int,long)) or key < 0 or key > len(items):
+                raise ValueError("Field '%s' has no item %r" % (f.field_name,key,))
+            if op == "insert":
+                items.insert(key,_load_item(f,model,data))
+                return
+            if key == len(items):
+                raise ValueError("Field '%s' has no item %r" % (f.field_name,key,))
+            if op == "remove":
+                del items[key]
+            else:
+                items[key] = _load_item(f,model,data)
+        else:
+            if op == "insert":
+                raise ValueError("Can't insert into dict field '%s'" % (f.field_name,))
+            if op == "remove":
+                try:
+                    del items[key]
+                except KeyError:
+                    raise ValueError("Field '%s' has no item %r" % (f.field_name,key,))
+            else:
+                items[key] = _load_item(f,model,data)
+        return
+    if rest:
+        return _apply_to_item(f.__get__(model),op,rest,data)
+    if op != "set":
+        raise ValueError("Can't %s field '%s'" % (op,f.field_name,))
+    if data is None:
+        #  Clear the value outright, since some fields' __set__ would turn
+        #  None into a default value such as False.
+        model.__dict__.pop(f.field_name,None)
+    else:
+        f.load_value(model,data)
+
+
+def _apply_to_item(item,op,path,data):
+    if not isinstance(item,dexml.Model):
+        raise ValueError("Change path %r does not lead to a model" % (path,))
+    _apply(item,op,path,data)
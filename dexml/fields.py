@@ -6,17 +6,135 @@ dexml.fields:  basic field type definitions for dexml
 """
 
 import dexml
+import re
 import random
+import datetime
+import decimal
+import binascii
+import tempfile
 from xml.sax.saxutils import escape, quoteattr
 
 #  Global counter tracking the order in which fields are declared.
 _order_counter = 0
 
+#  Scalar types that can be passed through dump_value() unchanged.
+_DUMPABLE_SCALARS = (basestring,bool,int,long,float)
+
 class _AttrBucket:
     """A simple class used only to hold attributes."""
     pass
 
 
+class _FrozenDict(dict):
+    """An immutable dict, used for absent Dict fields and frozen models."""
+
+    def _immutable(self,*args,**kwds):
+        raise TypeError("this dict is read-only")
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __hash__(self):
+        return hash(frozenset(self.iteritems()))
+
+#  Shared read-only values for List and Dict fields that have not been set.
+_EMPTY_LIST = ()
+_EMPTY_DICT = _FrozenDict()
+
+
+def _take_reusable(obj,key):
+    """Take a value offered for reuse by Model.parse_into(), if any.
+
+    While an instance is being parsed by parse_into(), the previous values
+    of its fields are kept in a dict under the "_reusable" attribute.
+    """
+    reusable = obj.__dict__.get("_reusable")
+    if reusable is None:
+        return None
+    return reusable.pop(key,None)
+
+
+def _reusable_items(obj,field,container_class):
+    """Get (container,old_items) offered for reuse by a List or Dict field.
+
+    The first call empties the container previously held by the field, if
+    it is of the given class, and keeps its old items in reverse order so
+    that parsed items can reuse them one at a time.  Either may be None.
+    """
+    reusable = obj.__dict__["_reusable"]
+    try:
+        return reusable[field]
+    except KeyError:
+        container = reusable.pop(field.field_name,None)
+        old_items = None
+        if container is not None:
+            if isinstance(container,dict):
+                old_items = container.values()
+            else:
+                old_items = list(container)
+            old_items.reverse()
+            if container.__class__ is not container_class:
+                container = None
+            elif isinstance(container,dict):
+                container.clear()
+            else:
+                del container[:]
+        reusable[field] = (container,old_items)
+        return (container,old_items)
+
+
+#  Cache of (name,default) pairs for each Field 'arguments' class.
+_argument_defaults_cache = {}
+
+def _argument_defaults(args):
+    """Get the list of (name,default) pairs from an 'arguments' class.
+
+    Walking dir() is slow, and large generated schemas create a great many
+    field instances, so the results are cached for each arguments class.
+    """
+    try:
+        return _argument_defaults_cache[args]
+    except KeyError:
+        defaults = []
+        for argnm in dir(args):
+            if not argnm.startswith("__"):
+                defaults.append((argnm,getattr(args,argnm)))
+        _argument_defaults_cache[args] = defaults
+        return defaults
+
+
+#  Cache of whether each Field subclass natively implements the
+#  buffer-based version of each rendering method.
+_native_render_into = {}
+
+def _render_into_method(field,name):
+    """Get a buffer-based rendering method for the given field.
+
+    This is normally just the field's bound "<name>_into" method.  But if
+    a subclass overrides the generator-based method "<name>" without also
+    overriding "<name>_into", a function adapting the overridden method
+    is returned instead.
+    """
+    cls = field.__class__
+    try:
+        native = _native_render_into[(cls,name)]
+    except KeyError:
+        native = True
+        for klass in cls.__mro__:
+            if name + "_into" in klass.__dict__:
+                break
+            if name in klass.__dict__:
+                native = False
+                break
+        _native_render_into[(cls,name)] = native
+    if native:
+        return getattr(field,name + "_into")
+    method = getattr(field,name)
+    def render_into(obj,val,nsmap,out):
+        out.extend(method(obj,val,nsmap))
+    return render_into
+
+
 class Field(object):
     """Base class for all dexml Field classes.
 
@@ -26,7 +144,9 @@ class Field(object):
 
     Each field instance will magically be given the following properties:
 
-      * model_class:  the Model subclass to which it is attached
+      * model_class:  the Model subclass to which it is attached; fields
+                      inherited by a subclass in the same namespace are
+                      shared with the base class, and keep its value
       * field_name:   the name under which is appears on that class
 
     The following methods are required for interaction with the parsing
@@ -36,6 +156,23 @@ class Field(object):
       * parse_child_node:    parse into out of an XML child node
       * render_attributes:   render XML for node attributes
       * render_children:     render XML for child nodes
+
+    Rendering can instead be implemented using the buffer-based protocol,
+    which appends strings to a shared output list rather than returning
+    them, avoiding generator overhead.  Each field need implement only one
+    version of each rendering method; the other is adapted automatically:
+
+      * render_attributes_into:    render XML for node attributes
+      * render_children_into:      render XML for child nodes
+
+    The following methods are used by Model.dumps() and Model.loads() to
+    serialize instance data without going through XML:
+
+      * dump_value:          produce a compact marshallable value
+      * load_value:          restore a value produced by dump_value
+
+    Rendering reads each field's value using peek_value(), which must not
+    modify the instance.
       
     """
 
@@ -53,10 +190,20 @@ class Field(object):
         """
         global _order_counter
         self._order_counter = _order_counter = _order_counter + 1
-        args = self.__class__.arguments
-        for argnm in dir(args):
-            if not argnm.startswith("__"):
-                setattr(self,argnm,kwds.get(argnm,getattr(args,argnm)))
+        for (argnm,default) in _argument_defaults(self.__class__.arguments):
+            setattr(self,argnm,kwds.get(argnm,default))
+
+    def _copy_for_model(self,model_class):
+        """Make a shallow copy of this field, attached to the given class.
+
+        This is used to give a subclass of a Model that changes its
+        namespace its own copy of the inherited fields.  It's equivalent to copy.copy() but a good deal
+        faster, which matters for large generated schemas.
+        """
+        field = self.__class__.__new__(self.__class__)
+        field.__dict__.update(self.__dict__)
+        field.model_class = model_class
+        return field
 
     def parse_attributes(self,obj,attrs):
         """Parse any attributes for this field from the given list.
@@ -95,12 +242,89 @@ class Field(object):
         pass
 
     def render_attributes(self,obj,val,nsmap):
-        """Render any attributes that this field manages."""
-        return []
+        """Render any attributes that this field manages.
+
+        The default implementation adapts render_attributes_into().
+        """
+        out = []
+        self.render_attributes_into(obj,val,nsmap,out)
+        return out
 
     def render_children(self,obj,val,nsmap):
-        """Render any child nodes that this field manages."""
-        return []
+        """Render any child nodes that this field manages.
+
+        The default implementation adapts render_children_into().
+        """
+        out = []
+        self.render_children_into(obj,val,nsmap,out)
+        return out
+
+    def render_attributes_into(self,obj,val,nsmap,out):
+        """Render any attributes that this field manages, appending to 'out'.
+
+        This is the buffer-based counterpart to render_attributes(); each
+        rendered string should be appended to the list 'out'.
+        """
+        pass
+
+    def render_children_into(self,obj,val,nsmap,out):
+        """Render any child nodes that this field manages, appending to 'out'.
+
+        This is the buffer-based counterpart to render_children(); each
+        rendered string should be appended to the list 'out'.
+        """
+        pass
+
+    def dump_value(self,obj,val):
+        """Produce a compact representation of this field's value.
+
+        The result must be something that the 'marshal' module can handle:
+        None, numbers, strings, and tuples or lists thereof.  The default
+        implementation returns the value unchanged.
+        """
+        return val
+
+    def load_value(self,obj,data):
+        """Restore a value produced by dump_value() onto the given object."""
+        if data is not None:
+            self.__set__(obj,data)
+
+    def clone_value(self,obj,val):
+        """Produce an independent copy of this field's value.
+
+        This is used by Model.clone().  The default implementation returns
+        the value unchanged, which is correct for immutable values; fields
+        holding mutable values must override it.
+        """
+        return val
+
+    def freeze_value(self,obj,val):
+        """Produce an immutable version of this field's value.
+
+        This is used on models with the 'frozen' meta option, once they
+        have been constructed or parsed.  The default implementation
+        returns the value unchanged.
+        """
+        return val
+
+    def generate_value(self,obj,gen):
+        """Produce a random value for this field, for synthetic documents.
+
+        The 'gen' argument is a dexml.synth.Generator, providing a source
+        of random numbers and controlling the size of the result.  The
+        default implementation returns None, meaning no value.
+        """
+        return None
+
+    def peek_value(self,obj):
+        """Get this field's value on the given object, for reading only.
+
+        This is used when rendering.  Unlike attribute access it must not
+        store anything on the object, so fields that create their value
+        on first access should return a shared immutable value instead.
+        The default implementation uses __get__.
+        """
+        return self.__get__(obj)
 
     def __get__(self,instance,owner=None):
         if instance is None:
@@ -229,19 +453,19 @@ class Value(Field):
         self.__set__(obj,self.parse_value("".join(vals)))
         return dexml.PARSE_DONE
 
-    def render_attributes(self,obj,val,nsmap):
+    def render_attributes_into(self,obj,val,nsmap,out):
         if val is not None and val is not self.default and self.attrname:
             qaval = quoteattr(self.render_value(val))
             if isinstance(self.attrname,basestring):
-                yield '%s=%s' % (self.attrname,qaval,)
+                out.append('%s=%s' % (self.attrname,qaval,))
             else:
                 m_meta = self.model_class.meta
                 (ns,nm) = self.attrname
                 if ns == m_meta.namespace and m_meta.namespace_prefix:
                     prefix = m_meta.namespace_prefix
-                    yield '%s:%s=%s' % (prefix,nm,qaval,)
+                    out.append('%s:%s=%s' % (prefix,nm,qaval,))
                 elif ns is None:
-                    yield '%s=%s' % (nm,qaval,)
+                    out.append('%s=%s' % (nm,qaval,))
                 else:
                     for (p,n) in nsmap.iteritems():
                         if ns == n[0]:
@@ -251,44 +475,49 @@ class Value(Field):
                         prefix = "p" + str(random.randint(0,10000))
                         while prefix in nsmap:
                             prefix = "p" + str(random.randint(0,10000))
-                        yield 'xmlns:%s="%s"' % (prefix,ns,)
-                    yield '%s:%s=%s' % (prefix,nm,qaval,)
+                        out.append('xmlns:%s="%s"' % (prefix,ns,))
+                    out.append('%s:%s=%s' % (prefix,nm,qaval,))
 
-    def render_children(self,obj,val,nsmap):
+    def render_children_into(self,obj,val,nsmap,out):
         if val is not None and val is not self.default and self.tagname:
             val = self._esc_render_value(val)
             if self.tagname == ".":
-                yield val
+                out.append(val)
+            else:
+                (prefix,localName,attrs) = self._get_tag_parts(nsmap)
+                out.append(self._render_tag(val,prefix,localName,attrs))
+
+    def _get_tag_parts(self,nsmap):
+        """Get tuple (prefix,localName,attrs) for rendering our tag."""
+        attrs = ""
+        #  By default, tag values inherit the namespace of their
+        #  containing model class.
+        if isinstance(self.tagname,basestring):
+            prefix = self.model_class.meta.namespace_prefix
+            localName = self.tagname
+        else:
+            m_meta = self.model_class.meta
+            (ns,localName) = self.tagname
+            if not ns:
+                #  If we have an explicitly un-namespaced tag,
+                #  we need to be careful.  The model tag might have
+                #  set the default namespace, which we need to undo.
+                prefix = None
+                if m_meta.namespace and not m_meta.namespace_prefix:
+                    attrs = ' xmlns=""'
+            elif ns == m_meta.namespace:
+                prefix = m_meta.namespace_prefix
             else:
-                attrs = ""
-                #  By default, tag values inherit the namespace of their
-                #  containing model class.
-                if isinstance(self.tagname,basestring):
-                    prefix = self.model_class.meta.namespace_prefix
-                    localName = self.tagname
+                for (p,n) in nsmap.iteritems():
+                    if ns == n[0]:
+                        prefix = p
+                        break
                 else:
-                    m_meta = self.model_class.meta
-                    (ns,localName) = self.tagname
-                    if not ns:
-                        #  If we have an explicitly un-namespaced tag,
-                        #  we need to be careful.  The model tag might have
-                        #  set the default namespace, which we need to undo.
-                        prefix = None
-                        if m_meta.namespace and not m_meta.namespace_prefix:
-                            attrs = ' xmlns=""'
-                    elif ns == m_meta.namespace:
-                        prefix = m_meta.namespace_prefix
-                    else:
-                        for (p,n) in nsmap.iteritems():
-                            if ns == n[0]:
-                                prefix = p
-                                break
-                        else:
-                            prefix = "p" + str(random.randint(0,10000))
-                            while prefix in nsmap:
-                                prefix = "p" + str(random.randint(0,10000))
-                            attrs = ' xmlns:%s="%s"' % (prefix,ns)
-                yield self._render_tag(val,prefix,localName,attrs)
+                    prefix = "p" + str(random.randint(0,10000))
+                    while prefix in nsmap:
+                        prefix = "p" + str(random.randint(0,10000))
+                    attrs = ' xmlns:%s="%s"' % (prefix,ns)
+        return (prefix,localName,attrs)
 
     def _render_tag(self,val,prefix,localName,attrs):
         if val:
@@ -314,12 +543,114 @@ class Value(Field):
     def _esc_render_value(self,val):
         return escape(self.render_value(val))
 
+    def dump_value(self,obj,val):
+        #  Values of any other type are stored in rendered form, and wrapped
+        #  in a tuple so that load_value() knows to call parse_value().
+        if val is None or isinstance(val,_DUMPABLE_SCALARS):
+            return val
+        return (self.render_value(val),)
+
+    def generate_value(self,obj,gen):
+        return self.default
+
+    def load_value(self,obj,data):
+        if isinstance(data,tuple):
+            data = self.parse_value(data[0])
+        super(Value,self).load_value(obj,data)
+
 
 
 class String(Value):
-    """Field representing a simple string value."""
-    # actually, the base Value() class will do this automatically.
-    pass
+    """Field representing a simple string value.
+
+    If the keyword argument "intern" is true then parsed values are looked
+    up in a table of previously-seen values, so that repeated values share
+    a single string object.  This can save a lot of memory when the same
+    handful of values occur in many thousands of items.  The table holds
+    up to "intern_size" values, and is simply emptied when it fills up.
+    """
+
+    class arguments(Value.arguments):
+        intern = False
+        intern_size = 10000
+
+    def __init__(self,**kwds):
+        super(String,self).__init__(**kwds)
+        if self.intern:
+            self._interned = {}
+
+    def _intern(self,val):
+        interned = self._interned
+        try:
+            return interned[val]
+        except KeyError:
+            if len(interned) >= self.intern_size:
+                interned.clear()
+            interned[val] = val
+            return val
+
+    def parse_value(self,val):
+        if self.intern:
+            return self._intern(val)
+        return val
+
+    def load_value(self,obj,data):
+        if self.intern and isinstance(data,basestring):
+            data = self._intern(data)
+        super(String,self).load_value(obj,data)
+
+    def generate_value(self,obj,gen):
+        return gen.text()
+
+
+class Enum(Value):
+    """Field representing one of a fixed set of values.
+
+    The allowed values are given as positional arguments to the constructor,
+    and can be strings or any other type whose rendered form is unique:
+
+        class Account(Model):
+            status = fields.Enum("ACTIVE","SUSPENDED","CLOSED")
+
+    Parsing produces the declared value object itself, so that repeated
+    values are shared, and raises ParseError for undeclared values.
+    """
+
+    class arguments(Value.arguments):
+        values = ()
+
+    def __init__(self,*values,**kwds):
+        if values:
+            kwds["values"] = values
+        super(Enum,self).__init__(**kwds)
+        self._by_text = {}
+        self._canonical = {}
+        for val in self.values:
+            self._by_text[super(Enum,self).render_value(val)] = val
+            self._canonical[val] = val
+
+    def parse_value(self,val):
+        try:
+            return self._by_text[val]
+        except KeyError:
+            err = "Field '%s': invalid value '%s'" % (self.field_name,val,)
+            raise dexml.ParseError(err)
+
+    def render_value(self,val):
+        if val not in self._canonical:
+            err = "Field '%s': invalid value '%s'" % (self.field_name,val,)
+            raise dexml.RenderError(err)
+        return super(Enum,self).render_value(val)
+
+    def load_value(self,obj,data):
+        if data is not None:
+            data = self._canonical.get(data,data)
+        super(Enum,self).load_value(obj,data)
+
+    def generate_value(self,obj,gen):
+        if not self.values:
+            return None
+        return gen.random.choice(self.values)
 
 
 class CDATA(Value):
@@ -335,18 +666,27 @@ class CDATA(Value):
         val = val.replace("]]>","]]]]><![CDATA[>")
         return "<![CDATA[" + val + "]]>"
 
+    def generate_value(self,obj,gen):
+        return gen.text()
+
 
 class Integer(Value):
     """Field representing a simple integer value."""
     def parse_value(self,val):
         return int(val)
 
+    def generate_value(self,obj,gen):
+        return gen.random.randint(0,100000)
+
 
 class Float(Value):
     """Field representing a simple float value."""
     def parse_value(self,val):
         return float(val)
 
+    def generate_value(self,obj,gen):
+        return gen.random.randint(0,10000000) / 1000.0
+
 
 class Boolean(Value):
     """Field representing a simple boolean value.
@@ -378,15 +718,16 @@ class Boolean(Value):
             return False
         return True
 
-    def render_children(self,obj,val,nsmap):
-        if not val and self.empty_only:
-            return []
-        return super(Boolean,self).render_children(obj,val,nsmap)
+    def render_children_into(self,obj,val,nsmap,out):
+        if val or not self.empty_only:
+            super(Boolean,self).render_children_into(obj,val,nsmap,out)
 
-    def render_attributes(self,obj,val,nsmap):
-        if not val and self.empty_only:
-            return []
-        return super(Boolean,self).render_attributes(obj,val,nsmap)
+    def render_attributes_into(self,obj,val,nsmap,out):
+        if val or not self.empty_only:
+            super(Boolean,self).render_attributes_into(obj,val,nsmap,out)
+
+    def generate_value(self,obj,gen):
+        return gen.random.random() < 0.5
 
     def render_value(self,val):
         if not val:
@@ -396,6 +737,373 @@ class Boolean(Value):
         return "true"
 
 
+class _MemoValue(Value):
+    """Value subclass that can memoize the results of parse_value().
+
+    If the keyword argument "cache_size" is non-zero, up to that many
+    distinct parsed values are remembered and returned directly when the
+    same text is seen again.  The memo is simply emptied when it fills up.
+    Subclasses should implement _parse_text() instead of parse_value().
+    """
+
+    class arguments(Value.arguments):
+        cache_size = 0
+
+    def __init__(self,**kwds):
+        super(_MemoValue,self).__init__(**kwds)
+        self._memo = {}
+
+    def parse_value(self,val):
+        if not self.cache_size:
+            return self._parse_text(val)
+        memo = self._memo
+        try:
+            return memo[val]
+        except KeyError:
+            if len(memo) >= self.cache_size:
+                memo.clear()
+            parsed = memo[val] = self._parse_text(val)
+            return parsed
+
+    def _esc_render_value(self,val):
+        #  Rendered values never contain characters that need escaping.
+        return self.render_value(val)
+
+
+class _FixedOffset(datetime.tzinfo):
+    """Timezone with a fixed offset in minutes east of UTC."""
+
+    def __init__(self,minutes):
+        self._offset = datetime.timedelta(minutes=minutes)
+        if minutes == 0:
+            self._name = "UTC"
+        else:
+            sign = "+"
+            if minutes < 0:
+                sign = "-"
+                minutes = -minutes
+            self._name = "%s%02d:%02d" % (sign,minutes // 60,minutes % 60,)
+
+    def utcoffset(self,dt):
+        return self._offset
+
+    def dst(self,dt):
+        return datetime.timedelta(0)
+
+    def tzname(self,dt):
+        return self._name
+
+    def __reduce__(self):
+        return (_get_tzinfo,(self._offset.days*1440+self._offset.seconds//60,))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__,self._name,)
+
+
+#  Shared tzinfo instances, keyed by offset in minutes.
+_tzinfos = {}
+
+def _get_tzinfo(minutes):
+    try:
+        return _tzinfos[minutes]
+    except KeyError:
+        return _tzinfos.setdefault(minutes,_FixedOffset(minutes))
+
+def _parse_tzoffset(val):
+    """Parse a timezone suffix such as "Z" or "+10:00" into a tzinfo.
+
+    None is returned for an empty suffix.  Formats other than these common
+    ones raise ValueError, so the caller can fall back to a slower parser.
+    """
+    if not val:
+        return None
+    if val == "Z" or val == "z":
+        return _get_tzinfo(0)
+    if len(val) == 6 and val[3] == ":" and val[0] in "+-":
+        if not (val[1:3] + val[4:6]).isdigit():
+            raise ValueError("invalid timezone: %s" % (val,))
+        minutes = int(val[1:3]) * 60 + int(val[4:6])
+        if val[0] == "-":
+            minutes = -minutes
+        return _get_tzinfo(minutes)
+    raise ValueError("invalid timezone: %s" % (val,))
+
+def _parse_tzoffset_slow(val):
+    """Parse any timezone suffix matched by _TZ_RE."""
+    if not val or val in "Zz":
+        return _parse_tzoffset(val)
+    minutes = int(val[1:3]) * 60
+    if len(val) > 3:
+        minutes += int(val[-2:])
+    if val[0] == "-":
+        minutes = -minutes
+    return _get_tzinfo(minutes)
+
+_TZ_RE = "(Z|z|[+-]\\d{2}(?::?\\d{2})?)?"
+_DATE_RE = re.compile("^(\\d{4})-?(\\d{2})-?(\\d{2})" + _TZ_RE + "$")
+_DATETIME_RE = re.compile("^(\\d{4})-?(\\d{2})-?(\\d{2})[Tt ](\\d{2}):?(\\d{2})"
+                          "(?::?(\\d{2})(?:[.,](\\d+))?)?" + _TZ_RE + "$")
+
+
+class Date(_MemoValue):
+    """Field representing a date, as a datetime.date object.
+
+    Values in the ISO-8601 format "YYYY-MM-DD" are parsed on a fast path.
+    The basic format "YYYYMMDD" is also accepted, as is a trailing timezone
+    designator; since date objects cannot carry a timezone it is ignored.
+    """
+
+    def _parse_text(self,val):
+        if len(val) == 10 and val[4] == "-" and val[7] == "-":
+            if (val[0:4] + val[5:7] + val[8:10]).isdigit():
+                return datetime.date(int(val[0:4]),int(val[5:7]),int(val[8:10]))
+        m = _DATE_RE.match(val.strip())
+        if m is None:
+            raise ValueError("invalid date: %s" % (val,))
+        return datetime.date(int(m.group(1)),int(m.group(2)),int(m.group(3)))
+
+    def render_value(self,val):
+        return val.isoformat()
+
+    def generate_value(self,obj,gen):
+        return datetime.date(2000,1,1) + datetime.timedelta(gen.random.randint(0,10000))
+
+
+class DateTime(_MemoValue):
+    """Field representing a date and time, as a datetime.datetime object.
+
+    Values in the ISO-8601 format "YYYY-MM-DDTHH:MM:SS" with optional
+    fractional seconds and an optional "Z" or "+HH:MM" timezone suffix are
+    parsed on a fast path; values with a timezone produce timezone-aware
+    datetimes.  Other ISO-8601 variants, such as the basic format or
+    omitted seconds, are handled by a slower fallback parser.
+    """
+
+    def _parse_text(self,val):
+        try:
+            return self._parse_fast(val)
+        except (ValueError,IndexError):
+            return self._parse_slow(val)
+
+    def _parse_fast(self,val):
+        if len(val) < 19 or val[4] != "-" or val[7] != "-":
+            raise ValueError("not a simple datetime")
+        if val[10] not in "Tt " or val[13] != ":" or val[16] != ":":
+            raise ValueError("not a simple datetime")
+        if not (val[0:4]+val[5:7]+val[8:10]+val[11:13]+val[14:16]+val[17:19]).isdigit():
+            raise ValueError("not a simple datetime")
+        pos = 19
+        usec = 0
+        if len(val) > 19 and val[19] == ".":
+            pos = 20
+            while pos < len(val) and val[pos].isdigit():
+                pos += 1
+            if pos == 20:
+                raise ValueError("not a simple datetime")
+            usec = int((val[20:pos] + "00000")[:6])
+        tz = _parse_tzoffset(val[pos:])
+        return datetime.datetime(int(val[0:4]),int(val[5:7]),int(val[8:10]),
+                                 int(val[11:13]),int(val[14:16]),
+                                 int(val[17:19]),usec,tz)
+
+    def _parse_slow(self,val):
+        m = _DATETIME_RE.match(val.strip())
+        if m is None:
+            raise ValueError("invalid datetime: %s" % (val,))
+        (year,month,day,hour,minute,sec,frac,tz) = m.groups()
+        usec = 0
+        if frac:
+            usec = int((frac + "00000")[:6])
+        hour = int(hour)
+        minute = int(minute)
+        sec = int(sec or 0)
+        #  ISO-8601 allows "24:00:00" to denote the end of the day.
+        end_of_day = False
+        if hour == 24 and minute == 0 and sec == 0 and usec == 0:
+            end_of_day = True
+            hour = 0
+        dt = datetime.datetime(int(year),int(month),int(day),
+                               hour,minute,sec,usec,_parse_tzoffset_slow(tz))
+        if end_of_day:
+            dt += datetime.timedelta(days=1)
+        return dt
+
+    def render_value(self,val):
+        return val.isoformat()
+
+    def generate_value(self,obj,gen):
+        secs = gen.random.randint(0,10000 * 86400)
+        return datetime.datetime(2000,1,1) + datetime.timedelta(seconds=secs)
+
+
+class Decimal(_MemoValue):
+    """Field representing a decimal number, as a decimal.Decimal object.
+
+    Values are always rendered in plain notation, never with an exponent.
+    """
+
+    def _parse_text(self,val):
+        try:
+            return decimal.Decimal(val.strip())
+        except decimal.InvalidOperation:
+            raise ValueError("invalid decimal: %s" % (val,))
+
+    def render_value(self,val):
+        if not isinstance(val,decimal.Decimal):
+            #  Convert floats via their shortest repr, not their exact
+            #  binary value, so that 0.1 renders as "0.1".
+            if isinstance(val,float):
+                val = repr(val)
+            val = decimal.Decimal(val)
+        return "{0:f}".format(val)
+
+    def generate_value(self,obj,gen):
+        return decimal.Decimal(gen.random.randint(0,10000000)).scaleb(-2)
+
+
+class Binary(Value):
+    """Field representing binary data, encoded in base64.
+
+    Parsed values are file-like objects positioned at the start of the
+    data.  Parsing is DOM-based, so the complete base64 text is held in
+    memory as a text node while the document is parsed; it is then decoded
+    from there a chunk at a time, and once the decoded data grows beyond
+    'spool_size' bytes it is moved from memory into a temporary file.
+    Values to be rendered can be given as file-like objects or as strings
+    of bytes.
+
+    When rendered as a tag, the data is read and encoded a chunk at a time,
+    so that irender() produces output in chunks of bounded size however
+    large the data.
+    """
+
+    class arguments(Value.arguments):
+        spool_size = 1024 * 1024
+
+    #  Number of bytes of data encoded per chunk of rendered output.
+    chunk_size = 3 * 1024
+
+    #  Number of characters of base64 text decoded at a time.
+    decode_size = 64 * 1024
+
+    def parse_value(self,val):
+        return self._decode([val])
+
+    def parse_child_node(self,obj,node):
+        if not self.tagname:
+            return dexml.PARSE_SKIP
+        if self.tagname == ".":
+            node = node.parentNode
+        else:
+            if not self._check_tagname(node,self.tagname):
+                return dexml.PARSE_SKIP
+        for child in node.childNodes:
+            if child.nodeType not in (child.TEXT_NODE,child.CDATA_SECTION_NODE):
+                raise dexml.ParseError("non-text value node")
+        self.__set__(obj,self._decode(child.nodeValue for child in node.childNodes))
+        return dexml.PARSE_DONE
+
+    def _decode(self,texts):
+        """Decode base64 from a sequence of strings into a spooled file."""
+        f = tempfile.SpooledTemporaryFile(self.spool_size)
+        pending = ""
+        try:
+            for text in texts:
+                for i in xrange(0,len(text),self.decode_size):
+                    chunk = pending + "".join(text[i:i+self.decode_size].split())
+                    n = len(chunk) - len(chunk) % 4
+                    f.write(binascii.a2b_base64(chunk[:n].encode("ascii")))
+                    pending = chunk[n:]
+            if pending:
+                raise ValueError("truncated data")
+        except (ValueError,UnicodeError,binascii.Error), e:
+            f.close()
+            msg = "Field '%s': invalid base64 data: %s"
+            raise dexml.ParseError(msg % (self.field_name,e,))
+        f.seek(0)
+        return f
+
+    def _encode_chunks(self,val):
+        """Generate the base64 encoding of a value, a chunk at a time."""
+        size = self.chunk_size
+        if isinstance(val,dexml.bytes):
+            for i in xrange(0,len(val),size):
+                yield _b64encode(val[i:i+size])
+        else:
+            if hasattr(val,"seek"):
+                val.seek(0)
+            data = val.read(size)
+            while data:
+                yield _b64encode(data)
+                data = val.read(size)
+            if hasattr(val,"seek"):
+                val.seek(0)
+
+    def render_value(self,val):
+        return "".join(self._encode_chunks(val))
+
+    def _esc_render_value(self,val):
+        return self.render_value(val)
+
+    def render_children(self,obj,val,nsmap):
+        if val is None or not self.tagname:
+            return
+        if self.tagname == ".":
+            for data in self._encode_chunks(val):
+                yield data
+            return
+        (prefix,localName,attrs) = self._get_tag_parts(nsmap)
+        if prefix:
+            localName = prefix + ":" + localName
+        yield "<%s%s>" % (localName,attrs,)
+        for data in self._encode_chunks(val):
+            yield data
+        yield "</%s>" % (localName,)
+
+    def render_children_into(self,obj,val,nsmap,out):
+        #  Write out any full buffer of fragments as we go.
+        flush = None
+        if out.__class__ is not list:
+            flush = getattr(out,"maybe_flush",None)
+        for data in self.render_children(obj,val,nsmap):
+            out.append(data)
+            if flush is not None:
+                flush()
+
+    def dump_value(self,obj,val):
+        if val is None:
+            return None
+        return (self.render_value(val),)
+
+    def clone_value(self,obj,val):
+        if val is None or isinstance(val,dexml.bytes):
+            return val
+        f = tempfile.SpooledTemporaryFile(self.spool_size)
+        if hasattr(val,"seek"):
+            val.seek(0)
+        data = val.read(self.chunk_size)
+        while data:
+            f.write(data)
+            data = val.read(self.chunk_size)
+        if hasattr(val,"seek"):
+            val.seek(0)
+        f.seek(0)
+        return f
+
+    def generate_value(self,obj,gen):
+        num_bytes = gen.random.randint(0,64)
+        return dexml.bytes(bytearray(gen.random.randint(0,255)
+                                     for _ in xrange(num_bytes)))
+
+
+def _b64encode(data):
+    """Encode bytes as a base64 string, without line breaks."""
+    data = binascii.b2a_base64(data)[:-1]
+    if not isinstance(data,str):
+        data = data.decode("ascii")
+    return data
+
+
 class Model(Field):
     """Field subclass referencing another Model instance.
 
@@ -464,7 +1172,14 @@ class Model(Field):
         except dexml.ParseError:
             return dexml.PARSE_SKIP
         else:
-            inst = typeclass.parse(node)
+            old = _take_reusable(obj,self.field_name)
+            if old is not None and old.__class__ is typeclass \
+               and not typeclass.meta.frozen:
+                inst = typeclass.parse_into(old,node)
+            else:
+                inst = typeclass.parse(node)
+            if typeclass.meta.intern_table is not None:
+                inst = typeclass.meta.intern_table.intern(inst)
             self.__set__(obj,inst)
             return dexml.PARSE_DONE
 
@@ -476,6 +1191,44 @@ class Model(Field):
             for data in val._render(nsmap):
                 yield data
 
+    def render_attributes_into(self,obj,val,nsmap,out):
+        pass
+
+    def render_children_into(self,obj,val,nsmap,out):
+        if val is not None:
+            val._render_into(nsmap,out)
+
+    def dump_value(self,obj,val):
+        #  Fields are encoded by position, so the value must be an instance
+        #  of exactly the declared class for load_value() to decode it.
+        if val is None:
+            return None
+        if val.__class__ is not self.typeclass:
+            msg = "Field '%s': can't dump instance of %s as %s"
+            msg %= (self.field_name,val.__class__.__name__,
+                    self.typeclass.__name__)
+            raise ValueError(msg)
+        return val._dump_fields()
+
+    def load_value(self,obj,data):
+        if data is not None:
+            typeclass = self.typeclass
+            inst = typeclass._load_fields(data)
+            if typeclass.meta.intern_table is not None:
+                inst = typeclass.meta.intern_table.intern(inst)
+            self.__set__(obj,inst)
+
+    def clone_value(self,obj,val):
+        if val is None:
+            return None
+        return val.clone()
+
+    def generate_value(self,obj,gen):
+        #  Stop at the maximum depth, unless the model is required.
+        if gen.depth >= gen.max_depth and not self.required:
+            return None
+        return gen.generate(self.typeclass)
+
 
 class List(Field):
     """Field subclass representing a list of fields.
@@ -526,6 +1279,12 @@ class List(Field):
         if self.minlength and not self.required:
             raise ValueError("List must be required if it has minlength")
 
+    def _copy_for_model(self,model_class):
+        #  The item field takes its namespace from the model class too.
+        field = super(List,self)._copy_for_model(model_class)
+        field.field = self.__dict__["field"]._copy_for_model(model_class)
+        return field
+
     def _get_field(self):
         field = self.__dict__["field"]
         if not hasattr(field,"field_name"):
@@ -538,11 +1297,20 @@ class List(Field):
     field = property(_get_field,_set_field)
 
     def __get__(self,instance,owner=None):
-        val = super(List,self).__get__(instance,owner)
-        if val is not None:
-            return val
-        self.__set__(instance,[])
-        return self.__get__(instance,owner)
+        if instance is None:
+            return self
+        val = instance.__dict__.get(self.field_name)
+        if val is None:
+            if instance.meta.frozen:
+                return _EMPTY_LIST
+            val = instance.__dict__[self.field_name] = []
+        return val
+
+    def peek_value(self,obj):
+        val = obj.__dict__.get(self.field_name)
+        if val is None:
+            return _EMPTY_LIST
+        return val
 
     def parse_child_node(self,obj,node):
         #  If our children are inside a grouping tag, parse
@@ -554,25 +1322,57 @@ class List(Field):
                 if node.nodeType != node.ELEMENT_NODE:
                     return dexml.PARSE_SKIP
                 elif node.tagName == self.tagname:
-                    self.__set__(obj,[])
+                    self.__set__(obj,self._new_items(obj))
                     return dexml.PARSE_CHILDREN
                 else:
                     return dexml.PARSE_SKIP
-        #  Now we just parse each child node.
+        #  Now we just parse each child node, offering it the next of
+        #  the old items for reuse when called from parse_into().
         tmpobj = _AttrBucket()
+        old_items = None
+        if "_reusable" in obj.__dict__:
+            old_items = _reusable_items(obj,self,list)[1]
+            if old_items:
+                tmpobj._reusable = {self.field_name:old_items[-1]}
         res = self.field.parse_child_node(tmpobj,node)
         if res is dexml.PARSE_MORE:
             raise ValueError("items in a list cannot return PARSE_MORE")
         if res is dexml.PARSE_DONE:
-            items = self.__get__(obj)
+            if old_items and self.field_name not in tmpobj._reusable:
+                old_items.pop()
+            items = self._parsed_items(obj)
+            #  Check the length as we go, so that an overlong list is
+            #  rejected without parsing all of its items.
+            if self.maxlength is not None and len(items) >= self.maxlength:
+                raise dexml.ParseError("Field '%s': too many items" % (self.field_name,))
             val = getattr(tmpobj,self.field_name)
             items.append(val)
             return dexml.PARSE_MORE
         else:
             return dexml.PARSE_SKIP
 
+    def _new_items(self,obj):
+        """Get an empty list for parsed items, reusing the old one if any."""
+        if "_reusable" in obj.__dict__:
+            items = _reusable_items(obj,self,list)[0]
+            if items is not None:
+                return items
+        return []
+
+    def _parsed_items(self,obj):
+        """Get the list that parsed items are added to, creating it if needed.
+
+        Unlike __get__ this gives a modifiable list even on frozen models,
+        which are frozen only once parsing is done.
+        """
+        items = obj.__dict__.get(self.field_name)
+        if items is None:
+            items = self._new_items(obj)
+            self.__set__(obj,items)
+        return items
+
     def parse_done(self,obj):
-        items = self.__get__(obj)
+        items = self.peek_value(obj)
         if self.minlength is not None and len(items) < self.minlength:
             raise dexml.ParseError("Field '%s': not enough items" % (self.field_name,))
         if self.maxlength is not None and len(items) > self.maxlength:
@@ -610,6 +1410,65 @@ class List(Field):
             if self.tagname:
                 yield "</%s>" % (self.tagname,)
 
+    def render_children_into(self,obj,items,nsmap,out):
+        render = _render_into_method(self.field,"render_children")
+        if self.tagname:
+            out.append("<%s>" % (self.tagname,))
+        start = len(out)
+        num_items = 0
+        for item in items:
+            num_items += 1
+            if self.maxlength is not None and num_items > self.maxlength:
+                msg = "Field '%s': too many items" % (self.field_name,)
+                raise dexml.RenderError(msg)
+            render(obj,item,nsmap,out)
+        if self.minlength is not None and num_items < self.minlength:
+            msg = "Field '%s': not enough items" % (self.field_name,)
+            raise dexml.RenderError(msg)
+        #  Suppress the wrapper tag if there's no data.
+        if self.tagname:
+            if len(out) > start:
+                out.append("</%s>" % (self.tagname,))
+            elif self.required:
+                out[-1] = "<%s />" % (self.tagname,)
+            else:
+                del out[-1]
+
+    def dump_value(self,obj,items):
+        if items is None:
+            return None
+        field = self.field
+        return [field.dump_value(obj,item) for item in items]
+
+    def load_value(self,obj,data):
+        if data is None:
+            return
+        field = self.field
+        items = []
+        for itemdata in data:
+            tmpobj = _AttrBucket()
+            field.load_value(tmpobj,itemdata)
+            items.append(getattr(tmpobj,self.field_name,None))
+        self.__set__(obj,items)
+
+    def clone_value(self,obj,items):
+        if items is None:
+            return None
+        field = self.field
+        return [field.clone_value(obj,item) for item in items]
+
+    def freeze_value(self,obj,items):
+        return tuple(items)
+
+    def generate_value(self,obj,gen):
+        field = self.field
+        items = []
+        for _ in xrange(gen.num_items(self.minlength,self.maxlength)):
+            item = field.generate_value(obj,gen)
+            if item is not None:
+                items.append(item)
+        return items
+
 
 class Dict(Field):
     """Field subclass representing a dict of fields keyed by unique attribute value.
@@ -685,6 +1544,12 @@ class Dict(Field):
             raise ValueError("Dict must be required if it has minlength")
         self.key = key
 
+    def _copy_for_model(self,model_class):
+        #  The item field takes its namespace from the model class too.
+        field = super(Dict,self)._copy_for_model(model_class)
+        field.field = self.__dict__["field"]._copy_for_model(model_class)
+        return field
+
     def _get_field(self):
         field = self.__dict__["field"]
         if not hasattr(field, "field_name"):
@@ -697,19 +1562,38 @@ class Dict(Field):
     field = property(_get_field, _set_field)
 
     def __get__(self,instance,owner=None):
-        val = super(Dict, self).__get__(instance, owner)
-        if val is not None:
-            return val
+        if instance is None:
+            return self
+        val = instance.__dict__.get(self.field_name)
+        if val is None:
+            if instance.meta.frozen:
+                return _EMPTY_DICT
+            val = instance.__dict__[self.field_name] = self._get_dictclass()()
+        return val
+
+    def peek_value(self, obj):
+        val = obj.__dict__.get(self.field_name)
+        if val is None:
+            return _EMPTY_DICT
+        return val
+
+    def _get_dictclass(self):
+        """Get the dict class enforcing our key, created once per field."""
+        try:
+            return self.__dict__["_dictclass"]
+        except KeyError:
+            pass
         class dictclass(self.dictclass):
             key = self.key
             def __setitem__(self, key, value):
                 keyval = getattr(value, self.key)
-                if keyval and keyval != key:
-                    raise ValueError('Key field value does not match dict key')
-                setattr(value, self.key, key)
+                if keyval != key:
+                    if keyval:
+                        raise ValueError('Key field value does not match dict key')
+                    setattr(value, self.key, key)
                 super(dictclass, self).__setitem__(key, value)
-        self.__set__(instance, dictclass())
-        return self.__get__(instance, owner)
+        self.__dict__["_dictclass"] = dictclass
+        return dictclass
 
     def parse_child_node(self, obj, node):
         #  If our children are inside a grouping tag, parse
@@ -721,17 +1605,25 @@ class Dict(Field):
                 if node.nodeType != node.ELEMENT_NODE:
                     return dexml.PARSE_SKIP
                 elif node.tagName == self.tagname:
-                    self.__get__(obj)
+                    self.__set__(obj, self._new_items(obj))
                     return dexml.PARSE_CHILDREN
                 else:
                     return dexml.PARSE_SKIP
-        #  Now we just parse each child node.
+        #  Now we just parse each child node, offering it the next of
+        #  the old items for reuse when called from parse_into().
         tmpobj = _AttrBucket()
+        old_items = None
+        if "_reusable" in obj.__dict__:
+            old_items = _reusable_items(obj, self, self._get_dictclass())[1]
+            if old_items:
+                tmpobj._reusable = {self.field_name: old_items[-1]}
         res = self.field.parse_child_node(tmpobj, node)
         if res is dexml.PARSE_MORE:
             raise ValueError("items in a dict cannot return PARSE_MORE")
         if res is dexml.PARSE_DONE:
-            items = self.__get__(obj)
+            if old_items and self.field_name not in tmpobj._reusable:
+                old_items.pop()
+            items = self._parsed_items(obj)
             val = getattr(tmpobj, self.field_name)
             try:
                 key = getattr(val, self.key)
@@ -739,13 +1631,33 @@ class Dict(Field):
                 raise dexml.ParseError("Key field '%s' required but not found in dict value" % (self.key, ))
             if self.unique and key in items:
                 raise dexml.ParseError("Key '%s' already exists in dict" % (key,))
+            if self.maxlength is not None and len(items) >= self.maxlength:
+                if key not in items:
+                    raise dexml.ParseError("Field '%s': too many items" % (self.field_name,))
             items[key] = val
             return dexml.PARSE_MORE
         else:
             return dexml.PARSE_SKIP
 
+    def _new_items(self, obj):
+        """Get an empty dict for parsed items, reusing the old one if any."""
+        dictclass = self._get_dictclass()
+        if "_reusable" in obj.__dict__:
+            items = _reusable_items(obj, self, dictclass)[0]
+            if items is not None:
+                return items
+        return dictclass()
+
+    def _parsed_items(self, obj):
+        """Get the dict that parsed items are added to, creating it if needed."""
+        items = obj.__dict__.get(self.field_name)
+        if items is None:
+            items = self._new_items(obj)
+            self.__set__(obj, items)
+        return items
+
     def parse_done(self, obj):
-        items = self.__get__(obj)
+        items = self.peek_value(obj)
         if self.minlength is not None and len(items) < self.minlength:
             raise dexml.ParseError("Field '%s': not enough items" % (self.field_name,))
         if self.maxlength is not None and len(items) > self.maxlength:
@@ -768,6 +1680,74 @@ class Dict(Field):
                 for data in self.field.render_children(obj, item, nsmap):
                     yield data
 
+    def render_children_into(self, obj, items, nsmap, out):
+        if self.minlength is not None and len(items) < self.minlength:
+            raise dexml.RenderError("Field '%s': not enough items" % (self.field_name,))
+        if self.maxlength is not None and len(items) > self.maxlength:
+            raise dexml.RenderError("too many items")
+        render = _render_into_method(self.field, "render_children")
+        if self.tagname:
+            out.append("<%s>" % (self.tagname,))
+        start = len(out)
+        for item in items.values():
+            render(obj, item, nsmap, out)
+        if self.tagname:
+            if len(out) > start:
+                out.append("</%s>" % (self.tagname,))
+            elif self.required:
+                out[-1] = "<%s />" % (self.tagname,)
+            else:
+                del out[-1]
+
+    def dump_value(self, obj, items):
+        if items is None:
+            return None
+        field = self.field
+        return [field.dump_value(obj, item) for item in items.values()]
+
+    def load_value(self, obj, data):
+        if data is None:
+            return
+        field = self.field
+        items = self._parsed_items(obj)
+        for itemdata in data:
+            tmpobj = _AttrBucket()
+            field.load_value(tmpobj, itemdata)
+            val = getattr(tmpobj, self.field_name)
+            items[getattr(val, self.key)] = val
+
+    def clone_value(self, obj, items):
+        if items is None:
+            return None
+        field = self.field
+        #  The dictclass created by __get__ is specific to this field, so
+        #  it can be re-used for the copy.
+        new_items = items.__class__()
+        for (key, item) in items.items():
+            new_items[key] = field.clone_value(obj, item)
+        return new_items
+
+    def freeze_value(self, obj, items):
+        if items.__class__ is _FrozenDict:
+            return items
+        return _FrozenDict(items)
+
+    def generate_value(self, obj, gen):
+        field = self.field
+        items = self._get_dictclass()()
+        for _ in xrange(gen.num_items(self.minlength, self.maxlength)):
+            item = field.generate_value(obj, gen)
+            if item is None:
+                continue
+            #  Make sure that the keys are unique.
+            key = getattr(item, self.key, None)
+            if key is None or key in items:
+                key = "%s%d" % (key or self.key, len(items))
+                #  Bypass the check on frozen models; the item is new.
+                object.__setattr__(item, self.key, key)
+            items[key] = item
+        return items
+
 
 class Choice(Field):
     """Field subclass accepting any one of a given set of Model fields."""
@@ -807,8 +1787,133 @@ class Choice(Field):
             for data in item._render(nsmap=nsmap):
                 yield data
 
+    def render_children_into(self,obj,item,nsmap,out):
+        if item is None:
+            if self.required:
+                raise dexml.RenderError("Field '%s': required field is missing" % (self.field_name,))
+        else:
+            item._render_into(nsmap,out)
+
+    def dump_value(self,obj,item):
+        #  Record the index of the matching alternative along with its data.
+        if item is None:
+            return None
+        for (idx,field) in enumerate(self.fields):
+            field.field_name = self.field_name
+            field.model_class = self.model_class
+            if isinstance(item,field.typeclass):
+                return (idx,field.dump_value(obj,item))
+        raise ValueError("Field '%s': value matches no Choice" % (self.field_name,))
+
+    def load_value(self,obj,data):
+        if data is not None:
+            (idx,data) = data
+            field = self.fields[idx]
+            field.field_name = self.field_name
+            field.model_class = self.model_class
+            field.load_value(obj,data)
+
+    def clone_value(self,obj,item):
+        if item is None:
+            return None
+        return item.clone()
+
+    def generate_value(self,obj,gen):
+        if not self.fields:
+            return None
+        field = gen.random.choice(self.fields)
+        field.field_name = self.field_name
+        field.model_class = self.model_class
+        return field.generate_value(obj,gen)
+
+
+class _DetachedNode(object):
+    """Lazily-materialized stand-in for an XML DOM element.
+
+    This holds the serialized XML of an element as a utf8-encoded string,
+    and only parses it into a DOM when one of the node's attributes is
+    accessed.  Until then rendering just uses the serialized form, and no
+    reference is kept to the document from which the node was parsed.
+    """
+
+    __slots__ = ("_xml","_node",)
+
+    def __init__(self,xml):
+        self._xml = xml
+        self._node = None
+
+    @property
+    def node(self):
+        """The DOM element, parsed from the serialized XML on first access.
+
+        Once materialized, the node may be modified in place; subsequent
+        renders will serialize it afresh.
+        """
+        if self._node is None:
+            self._node = dexml.minidom.parseString(self._xml).documentElement
+            self._xml = None
+        return self._node
+
+    def toxml(self,encoding=None):
+        if self._node is not None:
+            return self._node.toxml(encoding)
+        if encoding is None:
+            return self._xml.decode("utf8")
+        if encoding.lower().replace("-","") == "utf8":
+            return self._xml
+        return self._xml.decode("utf8").encode(encoding)
+
+    def __getattr__(self,attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.node,attr)
+
+    def __reduce__(self):
+        return (_DetachedNode,(self.toxml("utf8"),))
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__,self.toxml(),)
+
+
+def _declare_prefixes(node):
+    """Copy onto an element the xmlns declarations used within it.
+
+    Prefixes used by the element and its descendants may be declared on
+    its ancestors, which would be lost when it is serialized on its own.
+    """
+    prefixes = set()
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n.nodeType != n.ELEMENT_NODE:
+            continue
+        if n.namespaceURI is not None:
+            prefixes.add(n.prefix)
+        for attr in n.attributes.values():
+            if attr.prefix and attr.prefix not in ("xml","xmlns"):
+                prefixes.add(attr.prefix)
+        stack.extend(n.childNodes)
+    for prefix in prefixes:
+        nsattr = "xmlns"
+        if prefix:
+            nsattr = ":".join((nsattr,prefix,))
+        ancestor = node
+        while ancestor is not None and ancestor.nodeType == node.ELEMENT_NODE:
+            if ancestor.hasAttribute(nsattr):
+                if ancestor is not node:
+                    node.setAttribute(nsattr,ancestor.getAttribute(nsattr))
+                break
+            ancestor = ancestor.parentNode
+
 
 class XmlNode(Field):
+    """Field subclass holding an arbitrary XML element.
+
+    The element is stored in detached, serialized form so that it does not
+    keep the source document alive, and is parsed into a DOM node only when
+    its attributes are accessed.  The field value behaves like a DOM element
+    for most purposes; use its 'node' property to get the real thing.
+    """
 
     class arguments(Field.arguments):
         tagname = None
@@ -820,11 +1925,14 @@ class XmlNode(Field):
                 value = value.encode(self.encoding)
             doc = dexml.minidom.parseString(value)
             value = doc.documentElement
-        if value is not None and value.namespaceURI is not None:
-            nsattr = "xmlns"
-            if value.prefix:
-                nsattr = ":".join((nsattr,value.prefix,))
-            value.attributes[nsattr] = value.namespaceURI
+        if value is not None and not isinstance(value,_DetachedNode):
+            if value.namespaceURI is not None:
+                nsattr = "xmlns"
+                if value.prefix:
+                    nsattr = ":".join((nsattr,value.prefix,))
+                value.attributes[nsattr] = value.namespaceURI
+            _declare_prefixes(value)
+            value = _DetachedNode(value.toxml("utf8"))
         return super(XmlNode,self).__set__(instance,value)
 
     def parse_child_node(self,obj,node):
@@ -838,3 +1946,32 @@ class XmlNode(Field):
         if val is not None:
             yield val.toxml()
 
+    def render_children_into(self,obj,val,nsmap,out):
+        if val is not None:
+            out.append(val.toxml())
+
+    def dump_value(self,obj,val):
+        if val is None:
+            return None
+        return val.toxml("utf8")
+
+    def load_value(self,obj,data):
+        #  This data came from dump_value(), so it needn't be re-parsed.
+        if data is not None:
+            super(XmlNode,self).__set__(obj,_DetachedNode(data))
+
+    def clone_value(self,obj,val):
+        #  The DOM may have been materialized and modified in place, so
+        #  take a fresh snapshot rather than sharing it.
+        if val is None:
+            return None
+        return _DetachedNode(val.toxml("utf8"))
+
+    def generate_value(self,obj,gen):
+        tagname = self.tagname or "node"
+        xmlns = ""
+        if not isinstance(tagname,basestring):
+            (ns,tagname) = tagname
+            xmlns = " xmlns=%s" % (quoteattr(ns),)
+        xml = "<%s%s>%s</%s>" % (tagname,xmlns,escape(gen.text()),tagname,)
+        return _DetachedNode(xml.encode("utf8"))
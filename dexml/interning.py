@@ -0,0 +1,65 @@
+"""
+
+dexml.interning:  sharing of identical frozen model instances
+=============================================================
+
+Documents often repeat the same sub-element many times, such as an address
+or a currency block on every line of an order.  Models declared with the
+'frozen' meta option are immutable and compare equal when their fields
+are equal, so a single instance can safely stand in for all of the copies.
+This module provides the InternTable class, which maps each distinct
+instance to a shared one:
+
+    class Currency(dexml.Model):
+        class meta:
+            frozen = True
+            intern_table = InternTable(max_entries=10000)
+        code = fields.String()
+
+When a model has an intern table in its meta object, every instance of it
+that is parsed or loaded as part of another model is replaced by the equal
+instance in the table, if there is one.  Nested models are interned before
+their parents, so a parent compares its children by identity in the usual
+case and interning a whole tree costs little more than parsing it.
+
+A table can be shared between several model classes, and can be emptied
+with clear() to bound its lifetime to a batch of documents.
+
+"""
+
+from dexml.cache import _LRUTable
+
+
+class InternTable(_LRUTable):
+    """Table of shared instances of frozen models, with LRU eviction.
+
+    The number of instances held can be bounded by the 'max_entries'
+    argument, in which case the least-recently-used instances are evicted
+    when it is exceeded.  Evicted instances are still valid, they are just
+    no longer shared with instances parsed later on.
+
+    The following counters are maintained:
+
+        * hits:       number of instances replaced by a shared one
+        * misses:     number of instances added to the table
+        * evictions:  number of instances evicted from the table
+
+    """
+
+    def intern(self,obj):
+        """Get the shared instance equal to the given one.
+
+        If the table holds no such instance then the given one is added
+        and returned.  The instance must be of a frozen model.
+        """
+        if not obj.meta.frozen:
+            raise ValueError("Can't intern instance of unfrozen model '%s'"
+                             % (obj.__class__.__name__,))
+        with self._lock:
+            link = self._touch(obj)
+            if link is not None:
+                self.hits += 1
+                return link[3]
+            self.misses += 1
+            self._insert(obj,obj)
+            return obj
@@ -0,0 +1,186 @@
+"""
+
+dexml.limits:  resource limits for parsing untrusted documents
+==============================================================
+
+This module provides the ParseLimits class, which bounds the resources that
+Model.parse() will spend on a single document.  The limits are checked as
+the document is read, so that an oversized or hostile document is rejected
+with a ParseError as soon as it exceeds them:
+
+    limits = ParseLimits(max_bytes=10*1024*1024,max_depth=32)
+    obj = MyModel.parse(xml,limits=limits)
+
+Limits can also be given for all documents parsed by a model, using the
+'parse_limits' attribute of its meta object.
+
+Expat expands entity references before reporting text and attribute values,
+so a few hundred bytes of nested entity declarations can expand to gigabytes
+before any length limit sees them.  Documents that declare entities are
+therefore rejected outright unless the 'allow_entities' option is set.
+
+"""
+
+from xml.dom import expatbuilder
+
+import dexml
+
+
+class ParseLimits(object):
+    """Resource limits to be enforced when parsing a document.
+
+    Each of the following limits is disabled if set to None:
+
+        * max_bytes:        maximum size of the input document, in bytes
+        * max_depth:        maximum nesting depth of elements
+        * max_elements:     maximum total number of elements
+        * max_text_length:  maximum length of any single run of text or
+                            attribute value, after entity expansion
+
+    Documents declaring entities in their DTD are rejected unless the
+    'allow_entities' option is true.  Only enable it for documents from
+    trusted sources, since the limits above can't stop an attribute value
+    from being expanded in full.
+
+    The 'minlength' and 'maxlength' properties of List and Dict fields are
+    always enforced as items are parsed, regardless of these limits.
+    """
+
+    def __init__(self,max_bytes=None,max_depth=None,max_elements=None,
+                      max_text_length=None,allow_entities=False):
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.max_elements = max_elements
+        self.max_text_length = max_text_length
+        self.allow_entities = allow_entities
+
+    def parse(self,xml):
+        """Parse a bytestring or file-like object into a DOM document."""
+        if hasattr(xml,"read"):
+            if self.max_bytes is None:
+                xml = xml.read()
+            else:
+                xml = xml.read(self.max_bytes + 1)
+        if self.max_bytes is not None and len(xml) > self.max_bytes:
+            raise dexml.ParseError("document exceeds %d bytes" % (self.max_bytes,))
+        return _LimitedBuilder(self).parseString(xml)
+
+
+class _DOMBuilder(expatbuilder.ExpatBuilderNS):
+    """DOM builder that doesn't slow down on long runs of text.
+
+    Expat reports text in pieces of a few kilobytes, and the standard
+    builder appends each one to the text node's data as it arrives, which
+    takes time quadratic in the length of the text.  Here the pieces are
+    collected in a list and joined once the document has been parsed.
+    """
+
+    def __init__(self):
+        expatbuilder.ExpatBuilderNS.__init__(self)
+        self._text_pieces = {}
+
+    def parseString(self,string):
+        try:
+            doc = expatbuilder.ExpatBuilderNS.parseString(self,string)
+            self._join_text()
+        finally:
+            self._text_pieces = {}
+        return doc
+
+    def parseFile(self,file):
+        try:
+            doc = expatbuilder.ExpatBuilderNS.parseFile(self,file)
+            self._join_text()
+        finally:
+            self._text_pieces = {}
+        return doc
+
+    def _join_text(self):
+        for (node,pieces) in self._text_pieces.itervalues():
+            node.__dict__["data"] = node.__dict__["nodeValue"] = "".join(pieces)
+
+    def character_data_handler_cdata(self,data):
+        childNodes = self.curNode.childNodes
+        if childNodes:
+            node = childNodes[-1]
+            if self._cdata:
+                if self._cdata_continue and node.nodeType == node.CDATA_SECTION_NODE:
+                    return self._append_text(node,data)
+            elif node.nodeType == node.TEXT_NODE:
+                return self._append_text(node,data)
+        expatbuilder.ExpatBuilderNS.character_data_handler_cdata(self,data)
+
+    def character_data_handler(self,data):
+        childNodes = self.curNode.childNodes
+        if childNodes and childNodes[-1].nodeType == childNodes[-1].TEXT_NODE:
+            return self._append_text(childNodes[-1],data)
+        expatbuilder.ExpatBuilderNS.character_data_handler(self,data)
+
+    def _append_text(self,node,data):
+        try:
+            self._text_pieces[id(node)][1].append(data)
+        except KeyError:
+            self._text_pieces[id(node)] = (node,[node.data,data])
+
+
+class _LimitedBuilder(_DOMBuilder):
+    """DOM builder that checks a ParseLimits object as it goes."""
+
+    def __init__(self,limits):
+        _DOMBuilder.__init__(self)
+        self._limits = limits
+        self._depth = 0
+        self._num_elements = 0
+        self._text_length = 0
+
+    def install(self,parser):
+        _DOMBuilder.install(self,parser)
+        parser.EntityDeclHandler = self.entity_decl_handler
+
+    def entity_decl_handler(self,entityName,is_parameter_entity,value,
+                                 base,systemId,publicId,notationName):
+        if not self._limits.allow_entities:
+            raise dexml.ParseError("document declares entity '%s'" % (entityName,))
+        _DOMBuilder.entity_decl_handler(self,entityName,is_parameter_entity,
+                                        value,base,systemId,publicId,notationName)
+
+    def start_element_handler(self,name,attributes):
+        limits = self._limits
+        self._depth += 1
+        if limits.max_depth is not None and self._depth > limits.max_depth:
+            raise dexml.ParseError("document exceeds depth %d" % (limits.max_depth,))
+        self._num_elements += 1
+        if limits.max_elements is not None:
+            if self._num_elements > limits.max_elements:
+                msg = "document exceeds %d elements" % (limits.max_elements,)
+                raise dexml.ParseError(msg)
+        if limits.max_text_length is not None:
+            for i in xrange(1,len(attributes),2):
+                if len(attributes[i]) > limits.max_text_length:
+                    self._text_too_long()
+        self._text_length = 0
+        expatbuilder.ExpatBuilderNS.start_element_handler(self,name,attributes)
+
+    def end_element_handler(self,name):
+        self._depth -= 1
+        self._text_length = 0
+        expatbuilder.ExpatBuilderNS.end_element_handler(self,name)
+
+    def character_data_handler(self,data):
+        self._check_text(data)
+        _DOMBuilder.character_data_handler(self,data)
+
+    def character_data_handler_cdata(self,data):
+        self._check_text(data)
+        _DOMBuilder.character_data_handler_cdata(self,data)
+
+    def _check_text(self,data):
+        max_length = self._limits.max_text_length
+        if max_length is not None:
+            self._text_length += len(data)
+            if self._text_length > max_length:
+                self._text_too_long()
+
+    def _text_too_long(self):
+        msg = "document has text longer than %d characters"
+        raise dexml.ParseError(msg % (self._limits.max_text_length,))
@@ -0,0 +1,71 @@
+"""
+
+dexml.memory:  memory accounting for model instances
+====================================================
+
+This module provides the sizeof() function, which estimates the memory
+retained by a model instance:
+
+    obj = MyModel.parse(xml)
+    print(dexml.sizeof(obj))
+
+The estimate is the sum of sys.getsizeof() for the instance, its attribute
+dict and, for a deep size, every object reachable through its fields.  Each
+object is counted once, even if it is referred to several times, but objects
+that are also referenced from elsewhere (such as interned strings or values
+shared via fields.Enum) are still included in the total.
+
+"""
+
+import sys
+
+import dexml
+from dexml import fields
+
+
+def sizeof(model,deep=True):
+    """Estimate the number of bytes of memory used by a model instance.
+
+    With deep=False, only the instance itself and its attribute dict are
+    counted.  Otherwise the values of all its fields are included, along
+    with any nested models, lists and dicts.  The DOM of an XmlNode value
+    is not included once it has been materialized, only its serialized
+    form.
+    """
+    if not deep:
+        return sys.getsizeof(model) + sys.getsizeof(model.__dict__)
+    return _sizeof(model,set())
+
+
+def _sizeof(obj,seen):
+    """Recursively estimate the size of an object, skipping those in 'seen'."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj,dexml.Model):
+        vals = obj.__dict__
+        seen.add(id(vals))
+        size += sys.getsizeof(vals)
+        #  Walk the fields in declaration order, then anything else that
+        #  has been stored on the instance.
+        for f in obj._fields:
+            val = vals.get(f.field_name)
+            if val is not None:
+                size += _sizeof(val,seen)
+        if len(vals) > len(obj._fields):
+            names = set(f.field_name for f in obj._fields)
+            for (attr,val) in vals.iteritems():
+                if attr not in names:
+                    size += _sizeof(val,seen)
+    elif isinstance(obj,(list,tuple,set,frozenset)):
+        for item in obj:
+            size += _sizeof(item,seen)
+    elif isinstance(obj,dict):
+        for (key,val) in obj.iteritems():
+            size += _sizeof(key,seen)
+            size += _sizeof(val,seen)
+    elif isinstance(obj,fields._DetachedNode):
+        if obj._xml is not None:
+            size += _sizeof(obj._xml,seen)
+    return size
@@ -0,0 +1,197 @@
+"""
+
+dexml.metrics:  runtime metrics for parsing and rendering
+=========================================================
+
+This module collects counters and latency histograms for the parse(),
+render() and irender() methods of each Model class.  Collection is off by
+default, and costs a single attribute check per call while disabled:
+
+    from dexml import metrics
+    metrics.registry.enable()
+    ...
+    metrics.registry.export("/var/lib/node_exporter/dexml.prom")
+
+For each model class and operation the following are recorded:
+
+    * count:    number of calls
+    * errors:   number of calls that raised an exception
+    * bytes:    size of the input document (parse) or output (render),
+                with unicode strings counted by their size in utf-8
+    * latency:  histogram of call durations, in seconds
+
+Only the outermost call is recorded when models are parsed recursively.
+The duration of irender() runs until the generator is exhausted, and so
+includes any time spent by the consumer.
+
+"""
+
+import os
+import bisect
+import tempfile
+import threading
+from timeit import default_timer
+
+
+#  Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,
+                   0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0,10.0,)
+
+
+def _byte_size(data):
+    """Get the size in bytes of a document, counting unicode as utf-8."""
+    if isinstance(data,unicode):
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+class _Metric(object):
+    """Counters and latency histogram for one model class and operation."""
+
+    __slots__ = ("count","errors","bytes","seconds","buckets",)
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        #  One bucket per bound, plus one for durations above the last.
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def snapshot(self):
+        return {"count":self.count,"errors":self.errors,"bytes":self.bytes,
+                "seconds":self.seconds,"buckets":list(self.buckets)}
+
+
+class MetricsRegistry(object):
+    """Registry of parse/render metrics, keyed by model class name."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._metrics = {}
+
+    def enable(self):
+        """Start recording metrics."""
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording metrics; those already recorded are kept."""
+        self.enabled = False
+
+    def reset(self):
+        """Discard all recorded metrics."""
+        with self._lock:
+            self._metrics = {}
+
+    def snapshot(self):
+        """Get a copy of the current metrics.
+
+        The result is a dict mapping (model_name,operation) tuples to dicts
+        of values, where 'buckets' is the non-cumulative count of calls
+        for each bound in LATENCY_BUCKETS plus a final overflow bucket.
+        """
+        with self._lock:
+            return dict((key,m.snapshot()) for (key,m) in self._metrics.iteritems())
+
+    def call(self,cls,op,size,func,*args):
+        """Call func(*args), recording it as operation 'op' on class 'cls'.
+
+        If 'size' is None, the size of the result is recorded as the number
+        of bytes processed.
+        """
+        local = self._local
+        depth = getattr(local,"depth",0)
+        if depth:
+            return func(*args)
+        local.depth = 1
+        start = default_timer()
+        try:
+            result = func(*args)
+        except Exception:
+            self.record(cls,op,default_timer() - start,size or 0,error=True)
+            raise
+        finally:
+            local.depth = 0
+        if size is None:
+            size = _byte_size(result)
+        self.record(cls,op,default_timer() - start,size)
+        return result
+
+    def iterate(self,cls,op,chunks):
+        """Iterate over 'chunks', recording it as operation 'op' on 'cls'."""
+        size = 0
+        start = default_timer()
+        try:
+            for chunk in chunks:
+                size += _byte_size(chunk)
+                yield chunk
+        except Exception:
+            self.record(cls,op,default_timer() - start,size,error=True)
+            raise
+        self.record(cls,op,default_timer() - start,size)
+
+    def record(self,cls,op,seconds,size,error=False):
+        """Record a single operation on the given class."""
+        key = ("%s.%s" % (cls.__module__,cls.__name__,),op)
+        idx = bisect.bisect_left(LATENCY_BUCKETS,seconds)
+        with self._lock:
+            try:
+                m = self._metrics[key]
+            except KeyError:
+                m = self._metrics[key] = _Metric()
+            m.count += 1
+            if error:
+                m.errors += 1
+            m.bytes += size
+            m.seconds += seconds
+            m.buckets[idx] += 1
+
+    def write_prometheus(self,stream):
+        """Write the current metrics to a stream in Prometheus text format."""
+        metrics = sorted(self.snapshot().iteritems())
+        write = stream.write
+        for (name,kind,desc,value) in (
+                ("dexml_operations_total","counter","Number of operations.","count"),
+                ("dexml_errors_total","counter","Number of operations that failed.","errors"),
+                ("dexml_bytes_total","counter","Bytes of XML parsed or rendered.","bytes"),):
+            write("# HELP %s %s\n# TYPE %s %s\n" % (name,desc,name,kind,))
+            for ((model,op),m) in metrics:
+                write('%s{model="%s",op="%s"} %d\n' % (name,model,op,m[value],))
+        name = "dexml_duration_seconds"
+        write("# HELP %s Duration of operations.\n# TYPE %s histogram\n" % (name,name,))
+        for ((model,op),m) in metrics:
+            labels = 'model="%s",op="%s"' % (model,op,)
+            total = 0
+            for (bound,n) in zip(LATENCY_BUCKETS,m["buckets"]):
+                total += n
+                write('%s_bucket{%s,le="%r"} %d\n' % (name,labels,bound,total,))
+            write('%s_bucket{%s,le="+Inf"} %d\n' % (name,labels,m["count"],))
+            write('%s_sum{%s} %r\n' % (name,labels,m["seconds"],))
+            write('%s_count{%s} %d\n' % (name,labels,m["count"],))
+
+    def export(self,path):
+        """Write the current metrics to a file in Prometheus text format.
+
+        The file is replaced atomically, so a scraper reading it will never
+        see partial output.
+        """
+        (fd,tmppath) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            f = os.fdopen(fd,"w")
+            try:
+                self.write_prometheus(f)
+            finally:
+                f.close()
+            os.rename(tmppath,path)
+        except Exception:
+            try:
+                os.unlink(tmppath)
+            except EnvironmentError:
+                pass
+            raise
+
+
+#  The global registry used by dexml.Model.
+registry = MetricsRegistry()
@@ -0,0 +1,429 @@
+"""
+
+dexml.parallel:  parallel rendering and parsing of large documents
+==================================================================
+
+This module implements Model.render(workers=N), which renders the items of
+large List and Dict fields on the root model using a pool of processes:
+
+    xml = export.render(encoding="utf-8",workers=4)
+
+The items are partitioned into contiguous ranges, each range is rendered in
+a worker process, and the resulting fragments are stitched back together in
+order.  Each worker starts from a copy of the namespace map in effect at the
+point where the list is rendered, so namespace declarations are consistent
+with those of a serial render.
+
+Items are sent to the workers by pickling them, so their Model classes must
+be importable at module level.  Fields nested inside the items are rendered
+serially within each worker.  When an item field is rendered in a worker
+its 'obj' argument is None, since the containing model is not sent along.
+
+It also implements Model.parse(workers=N), which splits a large document
+into shards and parses them in a pool of processes:
+
+    with open("export.xml","rb") as f:
+        export = Export.parse(f,workers=4)
+
+A fast scanner finds the boundaries of the root element's children, or of
+the items inside the wrapper tag of a List or Dict field on the root.  Runs
+of consecutive children are grouped into shards of about SHARD_SIZE bytes,
+and each worker parses its shard wrapped in a copy of the document prolog
+and root start tag, so namespace declarations and entities carry over.
+The fields parsed in each shard are sent back in their Model.dumps()
+encoding and merged into the root model in document order.  Files that
+have a real file descriptor are memory-mapped rather than read in, and
+workers read their own shards from the file.
+
+In sharded mode the children of the root are matched to fields as if its
+meta.order_sensitive were False, and text content directly inside the root
+element is ignored.
+
+"""
+
+import os
+import re
+import mmap
+import multiprocessing
+
+import dexml
+from dexml import fields
+
+
+#  Fields with fewer than this many items are rendered serially.
+MIN_PARALLEL_ITEMS = 1000
+
+#  Approximate size in bytes of each shard when parsing in parallel.
+SHARD_SIZE = 4 * 1024 * 1024
+
+#  Number of ranges into which to partition the items for each worker.
+#  Using several per worker helps to keep them all busy until the end.
+RANGES_PER_WORKER = 4
+
+
+class ParallelRenderer(object):
+    """Helper object for rendering models with a pool of processes.
+
+    The 'workers' argument can be either a number of processes, in which
+    case a pool is created for each render and shut down afterwards, or
+    an existing multiprocessing.Pool instance.
+    """
+
+    def __init__(self,workers,min_items=MIN_PARALLEL_ITEMS):
+        self.workers = workers
+        self.min_items = min_items
+        self._pool = None
+
+    def render_into(self,model,nsmap,out):
+        """Render the given model, appending to the output list 'out'."""
+        plan = []
+        for (f,render_attributes,render_children) in model._get_render_plan():
+            if isinstance(f,(fields.List,fields.Dict)):
+                render_children = self._make_render_children(f,render_children)
+            plan.append((f,render_attributes,render_children))
+        try:
+            model._render_into(nsmap,out,plan)
+        finally:
+            if self._pool is not None and self._pool is not self.workers:
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            if hasattr(self.workers,"imap"):
+                self._pool = self.workers
+            else:
+                self._pool = multiprocessing.Pool(self.workers)
+        return self._pool
+
+    def _num_workers(self):
+        try:
+            return int(self.workers)
+        except TypeError:
+            return multiprocessing.cpu_count()
+
+    def _make_render_children(self,field,render_children):
+        """Make a render_children_into method rendering items in parallel."""
+        def render_children_into(obj,items,nsmap,out):
+            if not hasattr(items,"__len__") or len(items) < self.min_items:
+                return render_children(obj,items,nsmap,out)
+            if isinstance(field,fields.Dict):
+                items = list(items.values())
+            else:
+                items = list(items)
+            self._render_items(field,items,nsmap,out)
+        return render_children_into
+
+    def _render_items(self,field,items,nsmap,out):
+        """Render the items of the given List or Dict field in parallel.
+
+        This mirrors the serial implementation of render_children_into()
+        on those classes, checking the number of items and rendering the
+        wrapper tag if required.
+        """
+        if field.minlength is not None and len(items) < field.minlength:
+            msg = "Field '%s': not enough items" % (field.field_name,)
+            raise dexml.RenderError(msg)
+        if field.maxlength is not None and len(items) > field.maxlength:
+            msg = "Field '%s': too many items" % (field.field_name,)
+            raise dexml.RenderError(msg)
+        nsmap = dict((p,list(ns)) for (p,ns) in nsmap.iteritems())
+        cls = field.model_class
+        step = len(items) // (self._num_workers() * RANGES_PER_WORKER) + 1
+        tasks = []
+        for start in xrange(0,len(items),step):
+            tasks.append((cls,field.field_name,nsmap,items[start:start+step]))
+        if field.tagname:
+            out.append("<%s>" % (field.tagname,))
+        for data in self._get_pool().imap(_render_items,tasks):
+            out.append(data)
+        if field.tagname:
+            out.append("</%s>" % (field.tagname,))
+
+
+def _render_items(task):
+    """Render a range of items in a worker process."""
+    (cls,field_name,nsmap,items) = task
+    for field in cls._fields:
+        if field.field_name == field_name:
+            break
+    else:
+        raise ValueError("Class '%s' has no field '%s'" % (cls.__name__,field_name,))
+    render = fields._render_into_method(field.field,"render_children")
+    out = []
+    for item in items:
+        render(None,item,nsmap,out)
+    return "".join(out)
+
+
+#  Regular expression matching a single item of XML markup.  Only start and
+#  end tags have the 'close' and 'name' groups set.
+_MARKUP_RE = re.compile(br"""
+    <!--.*?-->
+  | <!\[CDATA\[.*?\]\]>
+  | <\?.*?\?>
+  | <!DOCTYPE(?:[^\[>]|\[.*?\])*>
+  | <(?P<close>/?)(?P<name>[^\s/>]+)(?:[^>"']|"[^"]*"|'[^']*')*?(?P<empty>/?)>
+""",re.S | re.X)
+
+
+def _scan_items(data,wrappers):
+    """Scan an XML document for the boundaries of the root's children.
+
+    The first value generated is the offset of the end of the root start
+    tag, or None if the root element is empty.  Subsequent values are tuples
+    (wrapper,start,end) giving the extent of each child element.  Children
+    of elements whose name is in 'wrappers' are generated in place of the
+    wrapper element itself, with 'wrapper' giving the wrapper's start tag;
+    for other children it is None.  A wrapper with no children is generated
+    as an ordinary child, so that its field is still found.
+    """
+    depth = 0
+    wrapper = None
+    wrapper_start = None
+    wrapper_empty = False
+    start = None
+    for m in _MARKUP_RE.finditer(data):
+        name = m.group("name")
+        if name is None:
+            continue
+        if m.group("close"):
+            depth -= 1
+            if depth == 0:
+                return
+            if depth == 1:
+                if wrapper is None:
+                    yield (None,start,m.end())
+                elif wrapper_empty:
+                    yield (None,wrapper_start,m.end())
+                wrapper = None
+            elif depth == 2 and wrapper is not None:
+                wrapper_empty = False
+                yield (wrapper,start,m.end())
+            continue
+        empty = m.group("empty")
+        if depth == 0:
+            if empty:
+                yield None
+                return
+            yield m.end()
+        elif depth == 1:
+            if name in wrappers and not empty:
+                wrapper = (m.group(0),name)
+                wrapper_start = m.start()
+                wrapper_empty = True
+            else:
+                start = m.start()
+                if empty:
+                    yield (None,start,m.end())
+                    continue
+        elif depth == 2 and wrapper is not None:
+            start = m.start()
+            if empty:
+                wrapper_empty = False
+                yield (wrapper,start,m.end())
+                continue
+        if not empty:
+            depth += 1
+    if depth > 0:
+        raise dexml.XmlError("document ended inside the root element")
+
+
+class ParallelParser(object):
+    """Helper object for parsing large documents with a pool of processes.
+
+    The 'workers' argument can be either a number of processes, in which
+    case a pool is created for each parse and shut down afterwards, or an
+    existing multiprocessing.Pool instance.  The model classes must be
+    importable at module level, so that they can be found by the workers.
+    """
+
+    def __init__(self,workers,shard_size=SHARD_SIZE):
+        self.workers = workers
+        self.shard_size = shard_size
+
+    def parse(self,cls,xml):
+        """Produce an instance of the given model from some xml.
+
+        The xml can be a bytestring, a unicode string, or a readable file
+        object.  Documents smaller than two shards are parsed serially.
+        """
+        (data,filename) = self._load(xml)
+        try:
+            if len(data) < self.shard_size * 2:
+                return cls.parse(data[:])
+            items = self._iterparse(cls,data,filename)
+            (root,fields_found) = items.next()
+            for (field,val) in items:
+                if isinstance(field,fields.List):
+                    field._parsed_items(root).append(val)
+                elif isinstance(field,fields.Dict):
+                    dict_items = field._parsed_items(root)
+                    key = getattr(val,field.key)
+                    if field.unique and key in dict_items:
+                        raise dexml.ParseError("Key '%s' already exists in dict" % (key,))
+                    dict_items[key] = val
+                else:
+                    field.__set__(root,val)
+                if field not in fields_found:
+                    fields_found.append(field)
+            root._parse_done(fields_found)
+            return root
+        finally:
+            if isinstance(data,mmap.mmap):
+                data.close()
+
+    def iterparse(self,cls,xml):
+        """Parse the children of the root element of some xml, in order.
+
+        This generates a (field_name,value) pair for each child of the root
+        element, with an item of a List or Dict field counting as a child.
+        The root's attributes are parsed and validated, but it isn't checked
+        for required fields.
+        """
+        (data,filename) = self._load(xml)
+        try:
+            items = self._iterparse(cls,data,filename)
+            items.next()
+            for (field,val) in items:
+                yield (field.field_name,val)
+        finally:
+            if isinstance(data,mmap.mmap):
+                data.close()
+
+    def _load(self,xml):
+        """Get the document data, and the name of the file holding it.
+
+        Real files are memory-mapped, and if they have a name it is returned
+        so that workers can read their shards directly.  Otherwise the name
+        is None.
+        """
+        if isinstance(xml,dexml.unicode):
+            encoding = dexml._XML_ENCODING_RE.match(xml)
+            if encoding is None:
+                return (xml.encode("utf8"),None)
+            return (xml.encode(encoding.group(1)),None)
+        if isinstance(xml,dexml.bytes):
+            return (xml,None)
+        try:
+            data = mmap.mmap(xml.fileno(),0,access=mmap.ACCESS_READ)
+        except (AttributeError,EnvironmentError,ValueError):
+            return (xml.read(),None)
+        filename = getattr(xml,"name",None)
+        if not isinstance(filename,basestring) or not os.path.isfile(filename):
+            filename = None
+        return (data,filename)
+
+    def _iterparse(self,cls,data,filename):
+        """Generate the results of parsing a document in shards.
+
+        The first value generated is a tuple giving the root instance with
+        its attributes parsed, and the list of fields found.  After that a
+        (field,value) pair is generated for each child, in document order.
+        Fields found in each shard are added to the list as it is merged,
+        including List and Dict fields that had no items.
+        """
+        wrappers = set()
+        for f in cls._fields:
+            if isinstance(f,(fields.List,fields.Dict)) and f.tagname:
+                wrappers.add(f.tagname.encode("utf8"))
+        scanner = _scan_items(data,wrappers)
+        head_end = next(scanner,None)
+        if head_end is None:
+            #  No children to shard, so just parse it in one go.
+            root = cls.parse(data[:])
+            yield (root,[])
+            return
+        head = data[:head_end]
+        root_tag = re.match(br"<([^\s/>]+)",head[head.rfind(b"<"):])
+        close = b"</" + root_tag.group(1) + b">"
+        #  Parse the root attributes from an empty copy of the root element.
+        root = cls()
+        fields_found = []
+        node = root._make_xml_node(head + close)
+        root.validate_xml_node(node)
+        root._parse_attributes(node,fields_found)
+        #  The document is scanned in full before any work is handed to the
+        #  pool, so that malformed markup is reported here in the caller.
+        shards = list(self._group_shards(scanner))
+        yield (root,fields_found)
+        tasks = (self._make_task(cls,shard,head,close,data,filename)
+                 for shard in shards)
+        pool = self._get_pool()
+        results = pool.imap(_parse_shard,tasks)
+        try:
+            for (dumped,found) in results:
+                tmp = cls._load_fields(dumped)
+                for idx in found:
+                    f = cls._fields[idx]
+                    if f not in fields_found:
+                        fields_found.append(f)
+                    val = tmp.__dict__.get(f.field_name)
+                    if isinstance(f,fields.List):
+                        for item in val or ():
+                            yield (f,item)
+                    elif isinstance(f,fields.Dict):
+                        for item in (val or {}).values():
+                            yield (f,item)
+                    else:
+                        yield (f,val)
+        finally:
+            if pool is not self.workers:
+                pool.terminate()
+                pool.join()
+            else:
+                #  Outstanding results would stop a shared pool from being
+                #  joined, so collect them if we've stopped early.
+                while True:
+                    try:
+                        results.next()
+                    except StopIteration:
+                        break
+                    except Exception:
+                        pass
+
+    def _group_shards(self,scanner):
+        """Group children into [wrapper,start,end] shards."""
+        shard = None
+        for (wrapper,start,end) in scanner:
+            if shard is not None:
+                if shard[0] == wrapper and end - shard[1] <= self.shard_size:
+                    shard[2] = end
+                    continue
+                yield shard
+            shard = [wrapper,start,end]
+        if shard is not None:
+            yield shard
+
+    def _make_task(self,cls,shard,head,close,data,filename):
+        (wrapper,start,end) = shard
+        if filename is None:
+            return (cls,head,close,wrapper,None,data[start:end])
+        return (cls,head,close,wrapper,filename,(start,end))
+
+    def _get_pool(self):
+        if hasattr(self.workers,"imap"):
+            return self.workers
+        return multiprocessing.Pool(self.workers)
+
+
+def _parse_shard(task):
+    """Parse a shard of a document in a worker process."""
+    (cls,head,close,wrapper,filename,data) = task
+    if filename is not None:
+        (start,end) = data
+        f = open(filename,"rb")
+        try:
+            f.seek(start)
+            data = f.read(end - start)
+        finally:
+            f.close()
+    if wrapper is not None:
+        data = wrapper[0] + data + b"</" + wrapper[1] + b">"
+    node = dexml.Model._make_xml_node(head + data + close)
+    self = cls()
+    fields_found = []
+    self._parse_children_unordered(node,cls._fields,fields_found)
+    found = [cls._fields.index(f) for f in fields_found]
+    return (self._dump_fields(),found)
@@ -0,0 +1,209 @@
+"""
+
+dexml.projection:  rendering a selection of a model's fields
+============================================================
+
+This module implements the 'only' and 'exclude' arguments to Model.render()
+and Model.irender(), which render a partial view of a model instance:
+
+    xml = order.render(only="id,name,lines.sku")
+    xml = order.render(exclude=["notes","lines.comments"])
+
+A field spec is a list of field names, or a string of them separated by
+commas.  A dotted name refers to the fields of the models held by a Model,
+List, Dict or Choice field, so "lines.sku" is the 'sku' field of each item
+in the 'lines' list; naming a field without any subfields refers to all of
+it.  When both arguments are given, the fields selected by 'only' are
+rendered less those named by 'exclude'.
+
+The spec is resolved against the fields of each model class once per call,
+before anything is rendered, and fields that aren't selected are skipped
+without being looked at.  They are the only fields exempt from the usual
+check for missing required fields.
+
+"""
+
+import dexml
+from dexml import fields
+
+
+def _parse_spec(spec):
+    """Parse a field spec into a tree of dicts keyed by field name.
+
+    A name that refers to a whole field maps to None rather than a dict.
+    """
+    if isinstance(spec,basestring):
+        spec = spec.split(",")
+    tree = {}
+    for name in spec:
+        name = name.strip()
+        if not name:
+            continue
+        parts = name.split(".")
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part,{})
+            if node is None:
+                break
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+class Projection(object):
+    """A selection of the fields of a model class, for rendering.
+
+    The 'plan' attribute is a render plan for the selected fields, as used
+    by Model._render_into(), and 'fields' lists them for Model._render().
+    The 'wrappers' dict maps each field with selected subfields to a
+    function that wraps its value so that it renders only those.
+    """
+
+    def __init__(self,model_class,only=None,exclude=None):
+        if only is not None:
+            only = _parse_spec(only)
+        exclude = _parse_spec(exclude or ())
+        self._resolve(model_class,only,exclude)
+
+    @classmethod
+    def _from_trees(cls,model_class,only,exclude,strict=True):
+        self = cls.__new__(cls)
+        self._resolve(model_class,only,exclude,strict)
+        return self
+
+    def _resolve(self,model_class,only,exclude,strict=True):
+        """Resolve spec trees against the fields of a model class.
+
+        Unless 'strict' is false, naming a field that the class doesn't
+        have is an error.
+        """
+        self.model_class = model_class
+        self.plan = []
+        self.fields = []
+        self.wrappers = {}
+        self._subtrees = {}
+        self._projections = {}
+        if strict:
+            owner = "Class '%s'" % (model_class.__name__,)
+            _check_names(owner,[model_class],only,exclude)
+        for (f,render_attributes,render_children) in model_class._get_render_plan():
+            name = f.field_name
+            sub_only = None
+            if only is not None:
+                if name not in only:
+                    continue
+                sub_only = only[name]
+            sub_exclude = {}
+            if name in exclude:
+                sub_exclude = exclude[name]
+                if sub_exclude is None:
+                    continue
+            if sub_only is not None or sub_exclude:
+                self._subtrees[f] = (sub_only,sub_exclude,True)
+                wrap = self._make_wrapper(f)
+                self.wrappers[f] = wrap
+                render_children = _wrap_render(render_children,wrap)
+            self.plan.append((f,render_attributes,render_children))
+            self.fields.append(f)
+
+    def _make_wrapper(self,field):
+        """Make a function wrapping the value of a field with subfields."""
+        item_field = field
+        if isinstance(field,(fields.List,fields.Dict)):
+            item_field = field.field
+        if not isinstance(item_field,(fields.Model,fields.Choice)):
+            err = "Field '%s' has no subfields"
+            raise ValueError(err % (field.field_name,))
+        #  Resolve the subfields against each declared model class now,
+        #  so that a bad spec fails before anything is rendered.  Items
+        #  of subclasses of those are resolved as they are encountered.
+        #  The alternatives of a Choice need only have the named subfields
+        #  between them.
+        if isinstance(item_field,fields.Choice):
+            classes = []
+            for alt in item_field.fields:
+                alt.field_name = item_field.field_name
+                alt.model_class = item_field.model_class
+                classes.append(alt.typeclass)
+            (only,exclude,_) = self._subtrees[field]
+            _check_names("Field '%s'" % (field.field_name,),classes,only,exclude)
+            self._subtrees[field] = (only,exclude,False)
+        else:
+            classes = [item_field.typeclass]
+        for model_class in classes:
+            self._get_projection(field,model_class)
+        def wrap_item(item):
+            if item is None:
+                return None
+            return _ProjectedModel(item,self._get_projection(field,item.__class__))
+        if isinstance(field,fields.List):
+            def wrap(items):
+                return [wrap_item(item) for item in items]
+        elif isinstance(field,fields.Dict):
+            def wrap(items):
+                return _ProjectedItems([wrap_item(item) for item in items.values()])
+        else:
+            wrap = wrap_item
+        return wrap
+
+    def _get_projection(self,field,model_class):
+        """Get the projection of a field's subfields onto a model class."""
+        try:
+            return self._projections[(field,model_class)]
+        except KeyError:
+            (only,exclude,strict) = self._subtrees[field]
+            proj = Projection._from_trees(model_class,only,exclude,strict)
+            self._projections[(field,model_class)] = proj
+            return proj
+
+
+def _check_names(owner,model_classes,only,exclude):
+    """Check that the top-level names of spec trees are fields of some class."""
+    names = set()
+    for model_class in model_classes:
+        names.update(f.field_name for f in model_class._fields)
+    for tree in (only or (),exclude):
+        for name in tree:
+            if name not in names:
+                err = "%s has no field '%s'"
+                raise ValueError(err % (owner,name,))
+
+
+def _wrap_render(render_children,wrap):
+    """Adapt a render_children_into method to render wrapped values."""
+    def render_children_into(obj,val,nsmap,out):
+        if val is not None:
+            val = wrap(val)
+        render_children(obj,val,nsmap,out)
+    return render_children_into
+
+
+class _ProjectedModel(object):
+    """Stand-in for a model instance, rendering only projected fields."""
+
+    __slots__ = ("model","projection",)
+
+    def __init__(self,model,projection):
+        self.model = model
+        self.projection = projection
+
+    def _render_into(self,nsmap,out,plan=None):
+        self.model._render_into(nsmap,out,self.projection.plan)
+
+    def _render(self,nsmap):
+        return self.model._render(nsmap,self.projection)
+
+
+class _ProjectedItems(object):
+    """Stand-in for the items of a Dict field, for rendering."""
+
+    __slots__ = ("items",)
+
+    def __init__(self,items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def values(self):
+        return self.items
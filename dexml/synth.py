@@ -0,0 +1,131 @@
+"""
+
+dexml.synth:  synthetic documents for load testing
+==================================================
+
+This module generates random instances of a model by walking its fields,
+for use in load tests and benchmarks:
+
+    obj = MyModel.generate(size=100,seed=42)
+
+Each field produces a value by its generate_value() method: strings are
+made up of random words, numbers and dates are drawn from fixed ranges,
+List and Dict fields receive a number of items that respects their
+'minlength' and 'maxlength', and a Choice field picks one of its
+alternatives.  The same seed always produces the same document.
+
+For documents too large to hold in memory, write_document() generates the
+items of the root model's List field one at a time and streams them out
+using an ExportWriter:
+
+    with open("big.xml","wb") as f:
+        write_document(MyModel,f,num_items=10000000,seed=42)
+
+"""
+
+import random
+
+import dexml
+from dexml import fields
+
+
+#  Vocabulary from which string values are constructed.
+WORDS = ("alpha","bravo","charlie","delta","echo","foxtrot","golf","hotel",
+         "india","juliet","kilo","lima","mike","november","oscar","papa",
+         "quebec","romeo","sierra","tango","uniform","victor","whiskey",
+         "xray","yankee","zulu",u"caf\u00e9",u"na\u00efve","<tag>","r&d",)
+
+
+class Generator(object):
+    """Generator of random model instances.
+
+    The 'size' argument gives the number of items to generate for List and
+    Dict fields on the top-level model, while 'nested_size' gives the
+    number for those on nested models.  Optional fields are given a value
+    with probability 'optional'.  Nested models are generated down to a
+    depth of 'max_depth', below which only required models are generated
+    and lists are given their minimum length.
+    """
+
+    def __init__(self,seed=None,size=10,nested_size=3,optional=0.5,
+                      max_depth=5):
+        self.random = random.Random(seed)
+        self.size = size
+        self.nested_size = nested_size
+        self.optional = optional
+        self.max_depth = max_depth
+        self.depth = 0
+
+    def generate(self,cls,exclude=()):
+        """Generate an instance of the given model class.
+
+        Any fields in the list 'exclude' are left without a value.
+        """
+        self.depth += 1
+        try:
+            obj = cls()
+            rand = self.random.random
+            for f in cls._fields:
+                if f in exclude:
+                    continue
+                if not f.required and not isinstance(f,(fields.List,fields.Dict)):
+                    if rand() >= self.optional:
+                        continue
+                val = f.generate_value(obj,self)
+                if val is not None:
+                    f.__set__(obj,val)
+            if cls.meta.frozen:
+                obj._freeze()
+            return obj
+        finally:
+            self.depth -= 1
+
+    def num_items(self,minlength=None,maxlength=None):
+        """Get the number of items to generate for a List or Dict field."""
+        if self.depth <= 1:
+            n = self.size
+        elif self.depth >= self.max_depth:
+            n = 0
+        else:
+            n = self.nested_size
+        if minlength is not None:
+            n = max(n,minlength)
+        if maxlength is not None:
+            n = min(n,maxlength)
+        return n
+
+    def text(self):
+        """Generate a random string of one to three words."""
+        choice = self.random.choice
+        return " ".join([choice(WORDS) for _ in xrange(self.random.randint(1,3))])
+
+
+def write_document(cls,fp,num_items,seed=None,field=None,encoding="utf-8",
+                   **kwds):
+    """Write a random document with the given number of list items.
+
+    The root element is an instance of the given model class, which must
+    have a List field to receive the items; if it has more than one, give
+    its name in the 'field' argument.  Other fields of the root are given
+    random values.  Any additional keyword arguments are passed on to the
+    Generator.  The number of items written is returned.
+    """
+    gen = Generator(seed=seed,**kwds)
+    list_field = dexml.ExportWriter._find_list_field(cls,field)
+    root = gen.generate(cls,exclude=(list_field,))
+    root_vals = dict((f.field_name,root.__dict__[f.field_name])
+                     for f in cls._fields if f.field_name in root.__dict__)
+    #  Items are generated as if they were on the top-level model.
+    item_field = list_field.field
+    n = num_items
+    if list_field.maxlength is not None:
+        n = min(n,list_field.maxlength)
+    writer = dexml.ExportWriter(cls,fp,encoding=encoding,
+                                field=list_field.field_name,**root_vals)
+    gen.depth = 1
+    with writer:
+        for _ in xrange(n):
+            item = item_field.generate_value(root,gen)
+            if item is not None:
+                writer.append(item)
+    return writer.num_items
@@ -8,6 +8,7 @@ import sys
 import os
 import os.path
 import difflib
+import datetime
 import unittest
 import doctest
 from xml.dom import minidom
@@ -114,6 +115,84 @@ class TestDexml(unittest.TestCase):
         self.assertEquals(h.render(encoding="utf8",fragment=True),b("").join(h.irender(encoding="utf8",fragment=True)))
 
 
+    def test_render_with_encoding(self):
+        class item(dexml.Model):
+            name = fields.String()
+        class items(dexml.Model):
+            items = fields.List(item)
+        lamda = u"\N{GREEK SMALL LETTER LAMDA}"
+        i = items()
+        for n in range(2000):
+            i.items.append(item(name=lamda + str(n)))
+        xml = i.render()
+        for enc in ("utf8","UTF-8","utf-16","latin-1"):
+            if enc == "latin-1":
+                self.assertRaises(UnicodeEncodeError,i.render,encoding=enc)
+                continue
+            data = i.render(encoding=enc)
+            self.assertEquals(data.decode(enc),xml.replace("?>",'encoding="%s" ?>' % (enc,),1))
+            chunks = list(i.irender(encoding=enc))
+            self.assertEquals(b("").join(chunks),data)
+            self.assertTrue(len(chunks) < len(i.items))
+        data = i.render(encoding="utf-16",fragment=True)
+        self.assertEquals(data.decode("utf-16"),i.render(fragment=True))
+        self.assertEquals(list(items().irender(encoding="ascii",fragment=True)),[b("<items />")])
+
+
+    def test_render_into_protocol(self):
+        class Shout(fields.String):
+            #  Overrides only the generator-based protocol.
+            def render_attributes(self,obj,val,nsmap):
+                if val is not None:
+                    val = val.upper()
+                for data in super(Shout,self).render_attributes(obj,val,nsmap):
+                    yield data
+        class Whisper(fields.Field):
+            #  Implements only the buffer-based protocol.
+            def render_children_into(self,obj,val,nsmap,out):
+                if val:
+                    out.append("<w>%s</w>" % (val.lower(),))
+        class Old(fields.Field):
+            #  Custom field written against the original protocol.
+            def render_children(self,obj,val,nsmap):
+                if val:
+                    yield "<o>"
+                    yield val
+                    yield "</o>"
+        class Msg(dexml.Model):
+            loud = Shout(required=False)
+            quiet = Whisper(required=False)
+            old = Old(required=False)
+            flag = fields.Boolean(tagname="flag",empty_only=True)
+            tags = fields.List(fields.String(tagname="tag"),tagname="tags")
+            opt = fields.List(fields.String(tagname="o"),tagname="opt",required=False)
+        class Msgs(dexml.Model):
+            msgs = fields.List(Msg)
+            byname = fields.Dict(fields.Model(Msg),key="loud",tagname="byname",required=False)
+
+        ms = Msgs()
+        ms.msgs.append(Msg(loud="hi",quiet="THERE",old="x",flag=True,tags=["a","b"]))
+        ms.msgs.append(Msg(flag=False))
+        ms.byname["z"] = Msg()
+        xml = ('<Msgs><Msg loud="HI"><w>there</w><o>x</o><flag /><tags><tag>a</tag><tag>b</tag></tags></Msg>'
+               '<Msg><tags /></Msg><byname><Msg loud="Z"><tags /></Msg></byname></Msgs>')
+        self.assertEquals(ms.render(fragment=True),xml)
+        self.assertEquals("".join(ms.irender(fragment=True)),xml)
+        self.assertEquals(ms.render(fragment=True,encoding="utf8"),b(xml))
+        out = []
+        ms.msgs[1]._render_into({},out)
+        self.assertEquals(out,["<Msg>","<tags />","</Msg>"])
+        out = ["<x>"]
+        fields.Boolean(empty_only=True).render_children_into(None,False,{},out)
+        self.assertEquals(out,["<x>"])
+        #  Required-field checks apply as usual.
+        class Strict(dexml.Model):
+            quiet = Whisper()
+            old = Old(required=False)
+        self.assertRaises(dexml.RenderError,Strict(old="o").render)
+        self.assertEquals(Strict(quiet="Q").render(fragment=True),"<Strict><w>q</w></Strict>")
+
+
     def test_errors_on_malformed_xml(self):
         class hello(dexml.Model):
             pass
@@ -180,6 +259,10 @@ class TestDexml(unittest.TestCase):
         p = Person()
         p.name = u"hel\N{GREEK SMALL LETTER LAMDA}o"
         self.assertEquals(p.render(encoding="utf8"), u'<?xml version="1.0" encoding="utf8" ?><Person name="hel\N{GREEK SMALL LETTER LAMDA}o" />'.encode("utf8"))
+        self.assertEquals(p.render(fragment=True,pretty=True), u'<Person name="hel\N{GREEK SMALL LETTER LAMDA}o"/>\n')
+        p.name = u"caf\N{LATIN SMALL LETTER E WITH ACUTE}"
+        self.assertEquals(p.render(encoding="latin-1",fragment=True,pretty=True), u'<Person name="caf\N{LATIN SMALL LETTER E WITH ACUTE}"/>\n'.encode("latin-1"))
+        self.assertEquals(Person.parse(p.render(encoding="latin-1",pretty=True)).name,p.name)
 
     def test_model_meta_attributes(self):
         class hello(dexml.Model):
@@ -263,12 +346,165 @@ class TestDexml(unittest.TestCase):
         self.assertRaises(dexml.ParseError,hello.parse,"<hello recipient='ryan' sender='lozz' strength='7'><msg>hi <b>there</b></msg></hello>")
 
 
+    def test_string_field_intern(self):
+        class item(dexml.Model):
+            status = fields.String()
+            code = fields.String(intern=True)
+        class items(dexml.Model):
+            items = fields.List(item)
+        xml = "<items><item status='ACTIVE' code='EUR' /><item status='ACTIVE' code='EUR' /></items>"
+        (i1,i2) = items.parse(xml).items
+        self.assertEquals(i1.status,i2.status)
+        self.assertTrue(i1.status is not i2.status)
+        self.assertEquals(i1.code,"EUR")
+        self.assertTrue(i1.code is i2.code)
+        i3 = item.loads(i1.dumps())
+        self.assertTrue(i3.code is i1.code)
+        self.assertFalse(hasattr(item.status,"_interned"))
+        #  The table of values is bounded.
+        class coded(dexml.Model):
+            code = fields.String(intern=True,intern_size=2)
+        for code in ("a","b","c","d","e"):
+            coded.parse("<coded code='%s' />" % (code,))
+        self.assertTrue(len(coded.code._interned) <= 2)
+        c1 = coded.parse("<coded code='e' />")
+        self.assertTrue(coded.parse("<coded code='e' />").code is c1.code)
+
+    def test_enum_field(self):
+        class item(dexml.Model):
+            status = fields.Enum("ACTIVE","CLOSED")
+            level = fields.Enum(1,2,3,tagname="level",required=False)
+        class items(dexml.Model):
+            items = fields.List(item)
+        xml = "<items><item status='ACTIVE'><level>2</level></item><item status='ACTIVE' /></items>"
+        (i1,i2) = items.parse(xml).items
+        self.assertEquals(i1.status,"ACTIVE")
+        self.assertTrue(i1.status is item.status.values[0])
+        self.assertTrue(i1.status is i2.status)
+        self.assertEquals(i1.level,2)
+        self.assertEquals(i2.level,None)
+        self.assertEquals(items.parse(items(items=[i1,i2]).render()).items[0].level,2)
+        self.assertTrue(item.loads(i1.dumps()).status is i1.status)
+        self.assertRaises(dexml.ParseError,item.parse,"<item status='OPEN' />")
+        self.assertRaises(dexml.ParseError,item.parse,"<item status='ACTIVE'><level>4</level></item>")
+        i1.status = "OPEN"
+        self.assertRaises(dexml.RenderError,i1.render)
+
+
     def test_float_field(self):
         class F(dexml.Model):
             value = fields.Float()
         self.assertEquals(F.parse("<F value='4.2' />").value,4.2)
 
 
+    def test_date_field(self):
+        import datetime
+        class event(dexml.Model):
+            when = fields.Date()
+        self.assertEquals(event.parse("<event when='2011-02-03' />").when,datetime.date(2011,2,3))
+        self.assertEquals(event.parse("<event when='20110203' />").when,datetime.date(2011,2,3))
+        self.assertEquals(event.parse("<event when='2011-02-03Z' />").when,datetime.date(2011,2,3))
+        self.assertEquals(event.parse("<event when=' 2011-02-03+10:00' />").when,datetime.date(2011,2,3))
+        self.assertRaises(ValueError,event.parse,"<event when='2011-02-30' />")
+        self.assertRaises(ValueError,event.parse,"<event when='02/03/2011' />")
+        e = event(when=datetime.date(2011,2,3))
+        self.assertEquals(e.render(fragment=True),'<event when="2011-02-03" />')
+        self.assertEquals(event.loads(e.dumps()).when,e.when)
+
+    def test_datetime_field(self):
+        import datetime
+        import pickle
+        class event(dexml.Model):
+            when = fields.DateTime(tagname="when",cache_size=2)
+        def parse(val):
+            return event.parse("<event><when>%s</when></event>" % (val,)).when
+        def utc(dt):
+            return (dt - dt.utcoffset()).replace(tzinfo=None)
+        dt = parse("2011-02-03T04:05:06")
+        self.assertEquals(dt,datetime.datetime(2011,2,3,4,5,6))
+        self.assertEquals(dt.tzinfo,None)
+        self.assertEquals(parse("2011-02-03 04:05:06.5"),datetime.datetime(2011,2,3,4,5,6,500000))
+        self.assertEquals(parse("2011-02-03T04:05:06.1234567"),datetime.datetime(2011,2,3,4,5,6,123456))
+        dt = parse("2011-02-03T04:05:06Z")
+        self.assertEquals(dt.utcoffset(),datetime.timedelta(0))
+        self.assertEquals(utc(dt),datetime.datetime(2011,2,3,4,5,6))
+        dt = parse("2011-02-03T04:05:06-05:30")
+        self.assertEquals(utc(dt),datetime.datetime(2011,2,3,9,35,6))
+        self.assertEquals(utc(parse("20110203T0405+0100")),datetime.datetime(2011,2,3,3,5))
+        self.assertEquals(utc(parse("2011-02-03T04:05:06+01")),datetime.datetime(2011,2,3,3,5,6))
+        self.assertEquals(parse("2011-02-03T24:00:00"),datetime.datetime(2011,2,4))
+        self.assertRaises(ValueError,parse,"2011-02-03T25:00:00")
+        self.assertRaises(ValueError,parse,"2011-02-03T04:05:06+5")
+        self.assertRaises(ValueError,parse,"yesterday")
+        #  Repeated values are shared via the memo cache.
+        self.assertTrue(parse("2011-02-03T04:05:06Z") is parse("2011-02-03T04:05:06Z"))
+        e = event(when=dt)
+        self.assertEquals(e.render(fragment=True),'<event><when>2011-02-03T04:05:06-05:30</when></event>')
+        self.assertEquals(event.parse(e.render()).when,dt)
+        self.assertEquals(event.loads(e.dumps()).when,dt)
+        self.assertEquals(pickle.loads(pickle.dumps(dt)),dt)
+
+    def test_decimal_field(self):
+        import decimal
+        class price(dexml.Model):
+            amount = fields.Decimal(cache_size=10)
+        p = price.parse("<price amount='12.50' />")
+        self.assertEquals(p.amount,decimal.Decimal("12.50"))
+        self.assertEquals(p.render(fragment=True),'<price amount="12.50" />')
+        p.amount = decimal.Decimal("1E+3")
+        self.assertEquals(p.render(fragment=True),'<price amount="1000" />')
+        p.amount = 7
+        self.assertEquals(p.render(fragment=True),'<price amount="7" />')
+        p.amount = 0.1
+        self.assertEquals(p.render(fragment=True),'<price amount="0.1" />')
+        p.amount = 1234567.891234
+        self.assertEquals(p.render(fragment=True),'<price amount="1234567.891234" />')
+        self.assertRaises(ValueError,price.parse,"<price amount='twelve' />")
+        self.assertEquals(price.loads(price.parse("<price amount='-0.001' />").dumps()).amount,decimal.Decimal("-0.001"))
+
+
+    def test_binary_field(self):
+        import base64
+        class attachment(dexml.Model):
+            name = fields.String()
+            digest = fields.Binary(required=False)
+            data = fields.Binary(tagname="data",spool_size=1000)
+        payload = bytes(bytearray(i % 256 for i in range(5000)))
+        encoded = base64.encodestring(payload).decode("ascii")
+        self.assertTrue("\n" in encoded)
+        a = attachment.parse("<attachment name='x' digest='AAE='><data>%s</data></attachment>"
+                             % (encoded,))
+        self.assertEquals(a.digest.read(),b("\x00\x01"))
+        self.assertEquals(a.data.read(),payload)
+        #  Large payloads are spooled to disk.
+        self.assertTrue(a.data._rolled)
+        xml = a.render(fragment=True)
+        self.assertTrue(xml.startswith('<attachment name="x" digest="AAE="><data>'))
+        self.assertEquals(attachment.parse(xml).data.read(),payload)
+        #  Long text arrives from expat in several pieces.
+        big = payload * 40
+        xml2 = "<attachment name='x'><data>%s</data></attachment>" % (base64.encodestring(big).decode("ascii"),)
+        self.assertEquals(attachment.parse(xml2).data.read(),big)
+        self.assertEquals(attachment.parse(xml2,limits=dexml.ParseLimits()).data.read(),big)
+        #  Rendering streams the data in chunks.
+        chunks = list(a.irender(fragment=True))
+        self.assertEquals("".join(chunks),xml)
+        self.assertTrue(max(len(c) for c in chunks) <= attachment.data.chunk_size * 4 // 3)
+        self.assertEquals(attachment.loads(a.dumps()).data.read(),payload)
+        c = a.clone()
+        self.assertEquals(c.data.read(),payload)
+        self.assertEquals(a.data.read(),payload)
+        a.data = b("hello")
+        self.assertEquals(a.render(fragment=True),
+                          '<attachment name="x" digest="AAE="><data>aGVsbG8=</data></attachment>')
+        self.assertRaises(dexml.ParseError,attachment.parse,
+                          "<attachment name='x'><data>aGVsbG8</data></attachment>")
+        self.assertRaises(dexml.ParseError,attachment.parse,
+                          u"<attachment name='x'><data>aGVsbG\u00e9</data></attachment>")
+        self.assertRaises(dexml.ParseError,attachment.parse,
+                          "<attachment name='x'><data><b /></data></attachment>")
+
+
     def test_boolean_field(self):
         class F(dexml.Model):
             value = fields.Boolean()
@@ -646,6 +882,142 @@ class TestDexml(unittest.TestCase):
         self.assertRaises(dexml.RenderError,s.render)
 
 
+    def test_absent_containers(self):
+        class item(dexml.Model):
+            name = fields.String()
+        class obj(dexml.Model):
+            name = fields.String()
+            things = fields.List(item,required=False)
+            index = fields.Dict(item,key="name",required=False)
+        o = obj.parse("<obj name='x' />")
+        self.assertEquals(o.render(fragment=True),'<obj name="x" />')
+        o.dumps()
+        #  Parsing and rendering don't store empty containers.
+        self.assertEquals(sorted(o.__dict__),["name"])
+        self.assertEquals(obj.index.peek_value(o),{})
+        self.assertRaises(TypeError,obj.index.peek_value(o).__setitem__,"a",item())
+        #  But attribute access gives containers that can be modified.
+        o.things.append(item(name="a"))
+        o.index["b"] = item()
+        self.assertEquals(o.index["b"].name,"b")
+        self.assertEquals(o.render(fragment=True),
+                          '<obj name="x"><item name="a" /><item name="b" /></obj>')
+        #  The dict class is created once for the field.
+        self.assertTrue(obj().index.__class__ is o.index.__class__)
+        self.assertTrue(obj.parse(o.render()).index.__class__ is o.index.__class__)
+
+
+    def test_parse_into(self):
+        class item(dexml.Model):
+            name = fields.String()
+            value = fields.Integer(required=False)
+        class entry(dexml.Model):
+            name = fields.String()
+        class obj(dexml.Model):
+            name = fields.String()
+            note = fields.String(tagname="note",required=False)
+            main = fields.Model(item,required=False)
+            things = fields.List(item,tagname="things",required=False)
+            index = fields.Dict(entry,key="name",required=False)
+        xml1 = "<obj name='x'><note>hi</note><item name='m' value='1' />" \
+               "<things><item name='a' value='2' /><item name='b' /></things></obj>"
+        xml2 = "<obj name='y'><item name='n' />" \
+               "<things><item name='c' value='3' /></things><entry name='d' /></obj>"
+        o = obj.parse(xml1)
+        o.extra = "kept"
+        (main,things,thing) = (o.main,o.things,o.things[0])
+        self.assertTrue(obj.parse_into(o,xml2) is o)
+        self.assertEquals(o.render(fragment=True),obj.parse(xml2).render(fragment=True))
+        self.assertEquals(o.note,None)
+        self.assertEquals(o.main.value,None)
+        self.assertEquals(o.extra,"kept")
+        #  Containers and nested models are reused.
+        self.assertTrue(o.main is main)
+        self.assertTrue(o.things is things)
+        self.assertTrue(o.things[0] is thing)
+        self.assertEquals([t.name for t in o.things],["c"])
+        (index,entry_d) = (o.index,o.index["d"])
+        obj.parse_into(o,xml2)
+        self.assertTrue(o.index is index)
+        self.assertTrue(o.index["d"] is entry_d)
+        #  Fields missing from the document are cleared.
+        obj.parse_into(o,xml1)
+        self.assertEquals(o.render(fragment=True),obj.parse(xml1).render(fragment=True))
+        self.assertEquals(sorted(o.__dict__),["extra","main","name","note","things"])
+        #  A bad document leaves the instance untouched.
+        self.assertRaises(dexml.ParseError,obj.parse_into,o,"<other />")
+        self.assertEquals(o.name,"x")
+        self.assertRaises(ValueError,obj.parse_into,item(),xml1)
+
+
+    def test_frozen_models(self):
+        table = dexml.InternTable(max_entries=2)
+        class measure(dexml.Model):
+            class meta:
+                frozen = True
+                intern_table = table
+            code = fields.String()
+        class line(dexml.Model):
+            class meta:
+                frozen = True
+            qty = fields.Integer()
+            unit = fields.Model(measure)
+            tags = fields.List(fields.String(tagname="tag"),required=False)
+        class order(dexml.Model):
+            lines = fields.List(line)
+        xml = "<order><line qty='1'><measure code='kg' /><tag>a</tag></line>" \
+              "<line qty='1'><measure code='kg' /><tag>a</tag></line>" \
+              "<line qty='2'><measure code='m' /></line></order>"
+        o = order.parse(xml)
+        (l1,l2,l3) = o.lines
+        #  Nested models are shared through the intern table.
+        self.assertTrue(l1.unit is l2.unit)
+        self.assertEquals(table.stats()["hits"],1)
+        #  Frozen instances are immutable and compare by value.
+        self.assertRaises(AttributeError,setattr,l1,"qty",3)
+        self.assertRaises(AttributeError,delattr,l1,"qty")
+        self.assertEquals(l1.tags,("a",))
+        self.assertEquals(l3.tags,())
+        self.assertEquals(l1,l2)
+        self.assertNotEquals(l1,l3)
+        self.assertEquals(hash(l1),hash(l2))
+        self.assertEquals(len(set(o.lines)),2)
+        self.assertEquals(line(qty=1,unit=measure(code="kg"),tags=["a"]),l1)
+        self.assertTrue(l1.clone() is l1)
+        self.assertEquals(line.loads(l1.dumps()),l1)
+        self.assertEquals(o.render(),order.parse(o.render()).render())
+        self.assertRaises(ValueError,dexml.patch,l1,[("set",("qty",),2)])
+        self.assertRaises(ValueError,line.parse_into,l1,"<line qty='3'><measure code='kg' /></line>")
+        self.assertTrue(order.loads(o.dumps()).lines[0].unit is l1.unit)
+        order.parse("<order><line qty='1'><measure code='g' /></line></order>")
+        self.assertEquals(len(table),2)
+        self.assertEquals(table.evictions,1)
+        self.assertRaises(ValueError,table.intern,o)
+        try:
+            class bad(dexml.Model):
+                class meta:
+                    intern_table = table
+        except ValueError:
+            pass
+        else:
+            self.fail("intern_table should require frozen")
+        #  Unfrozen subclasses get back the usual mutable behaviour.
+        class draft_line(line):
+            class meta:
+                tagname = "line"
+                frozen = False
+        d1 = draft_line.parse("<line qty='1'><measure code='kg' /></line>")
+        d2 = draft_line.parse("<line qty='1'><measure code='kg' /></line>")
+        d1.qty = 3
+        self.assertEquals(d1.qty,3)
+        d1.note = "x"
+        del d1.note
+        self.assertNotEquals(d1,d2)
+        self.assertEquals(len(set([d1,d2])),2)
+        d2.tags.append("b")
+        self.assertEquals(d2.render(),'<?xml version="1.0" ?><line qty="1"><measure code="kg" /><tag>b</tag></line>')
+
+
     def test_choice_field(self):
         """Test operation of fields.Choice"""
         class breakfast(dexml.Model):
@@ -759,6 +1131,40 @@ class TestDexml(unittest.TestCase):
         self.assertEquals(b.contents.childNodes[0].tagName,"hello")
 
 
+    def test_XmlNode_is_detached(self):
+        import gc
+        import weakref
+        class bucket(dexml.Model):
+            class meta:
+                namespace = "bucket-uri"
+            contents = fields.XmlNode(tagname="contents")
+        doc = minidom.parseString("<bucket xmlns='bucket-uri'><contents><hello a='1' /></contents></bucket>")
+        docref = weakref.ref(doc)
+        b = bucket.parse(doc)
+        del doc
+        gc.collect()
+        self.assertEquals(docref(),None)
+        #  Rendering uses the stored serialization without parsing it.
+        xml = '<bucket xmlns="bucket-uri"><contents xmlns="bucket-uri"><hello a="1"/></contents></bucket>'
+        self.assertEquals(b.render(fragment=True),xml)
+        self.assertEquals(b.__dict__["contents"]._node,None)
+        self.assertEquals(b.dumps(),bucket.loads(b.dumps()).dumps())
+        #  Accessing the node materializes it, and changes are rendered.
+        self.assertEquals(b.contents.childNodes[0].getAttribute("a"),"1")
+        b.contents.node.childNodes[0].setAttribute("a","2")
+        self.assertTrue('<hello a="2"/>' in b.render())
+        self.assertEquals(bucket.parse(b.render()).contents.childNodes[0].getAttribute("a"),"2")
+        #  Prefixes declared on ancestors are carried along.
+        class Holder(dexml.Model):
+            node = fields.XmlNode(tagname="node")
+        h = Holder.parse('<Holder xmlns:a="urn:a" xmlns:b="urn:b"><node><a:child a:x="1"><c b:y="2" /></a:child></node></Holder>')
+        child = h.node.childNodes[0]
+        self.assertEquals((child.namespaceURI,child.localName),("urn:a","child"))
+        self.assertEquals(child.getAttributeNS("urn:a","x"),"1")
+        self.assertEquals(child.childNodes[0].getAttributeNS("urn:b","y"),"2")
+        self.assertEquals(Holder.parse(h.render()).node.childNodes[0].namespaceURI,"urn:a")
+
+
     def test_namespaced_attrs(self):
         class nsa(dexml.Model):
             f1 = fields.Integer(attrname=("test:","f1"))
@@ -778,6 +1184,33 @@ class TestDexml(unittest.TestCase):
         self.assertEquals(n.render(fragment=True),'<t:nsa xmlns:t="test:" t:f1="7" />')
 
 
+    def test_attribute_binding(self):
+        class Pair(fields.Field):
+            def parse_attributes(self,obj,attrs):
+                unused = []
+                for attr in attrs:
+                    if attr.localName.startswith("pair_"):
+                        self.__set__(obj,attr.nodeValue)
+                    else:
+                        unused.append(attr)
+                return unused
+        class rec(dexml.Model):
+            a = fields.String()
+            b = fields.Integer(attrname="bee")
+            c = fields.Integer(attrname=("test:","a"))
+            d = fields.String(tagname="d",required=False)
+            p = Pair(required=False)
+        r = rec.parse("<rec xmlns:t='test:' t:a='2' bee='1' a='x' pair_x='y' />")
+        self.assertEquals((r.a,r.b,r.c,r.p),("x",1,2,"y"))
+        self.assertEquals(set(rec._get_attribute_plan()[0]),
+                          set([(None,"a"),(None,"bee"),("test:","a")]))
+        self.assertEquals(rec._get_attribute_plan()[1],[rec._fields[-1]])
+        self.assertRaises(dexml.ParseError,rec.parse,"<rec a='x' bee='1' c='2' />")
+        self.assertRaises(dexml.ParseError,rec.parse,"<rec a='x' bee='1' d='2' />")
+        self.assertRaises(dexml.ParseError,rec.parse,"<rec a='x' t:a='2' xmlns:t='test:' />")
+        self.assertRaises(ValueError,rec.parse,"<rec a='x' bee='b' t:a='2' xmlns:t='test:' />")
+
+
     def test_namespaced_children(self):
         class nsc(dexml.Model):
             f1 = fields.Integer(tagname=("test:","f1"))
@@ -1030,6 +1463,488 @@ class TestDexml(unittest.TestCase):
         self.assertRaises(dexml.ParseError,Notebook.parse,"<Notebook tag='home'><notes><note>one</note><note>two</note></notes></Notebook>")
 
 
+    def test_inherited_fields(self):
+        class Base(dexml.Model):
+            class meta:
+                namespace = "urn:base"
+            name = fields.String(tagname="name")
+            tags = fields.List(fields.String(tagname="tag"),required=False)
+        class Child(Base):
+            class meta:
+                namespace = "urn:child"
+            extra = fields.Integer(required=False)
+
+        self.assertEquals([f.field_name for f in Child._fields],["name","tags","extra"])
+        for (bf,cf) in zip(Base._fields,Child._fields):
+            self.assertTrue(bf is not cf)
+            self.assertTrue(bf.__class__ is cf.__class__)
+            self.assertTrue(bf.model_class is Base)
+            self.assertTrue(cf.model_class is Child)
+        self.assertTrue(Child._fields[1].required is False)
+        c = Child.parse("<Child xmlns='urn:child' extra='2'><name>N</name><tag>t</tag></Child>")
+        self.assertEquals((c.name,c.tags,c.extra),("N",["t"],2))
+        #  Fields are shared when the namespace doesn't change.
+        class Sibling(Base):
+            class meta:
+                tagname = "sib"
+        self.assertTrue(Sibling._fields[0] is Base._fields[0])
+        s = Sibling.parse("<sib xmlns='urn:base'><name>N</name><tag>t</tag></sib>")
+        self.assertEquals((s.name,s.tags),("N",["t"]))
+        self.assertEquals(Sibling.parse(s.render()).render(),s.render())
+
+
+    def test_dumps_and_loads(self):
+        class Item(dexml.Model):
+            name = fields.String()
+            price = fields.Float(tagname="price")
+            note = fields.CDATA(tagname="note",required=False)
+        class Other(dexml.Model):
+            pass
+        class Catalog(dexml.Model):
+            name = fields.String(tagname="name")
+            count = fields.Integer(required=False)
+            active = fields.Boolean(required=False)
+            items = fields.List(Item)
+            index = fields.Dict(Item,key="name",tagname="index")
+            extra = fields.Choice(fields.Model(Item),fields.Model(Other),required=False)
+            raw = fields.XmlNode(tagname="raw",required=False)
+
+        c = Catalog(name=u"hel\N{GREEK SMALL LETTER LAMDA}o",count=3)
+        c.items.append(Item(name="one",price=1.5))
+        c.items.append(Item(name="two",price=2.0,note="<two>"))
+        c.index["three"] = Item(price=3.25)
+        c.extra = Other()
+        c.raw = "<raw><stuff a='1' /></raw>"
+        data = c.dumps()
+        self.assertTrue(isinstance(data,bytes))
+        c2 = Catalog.loads(data)
+        self.assertEquals(c2.render(),c.render())
+        self.assertEquals(c2.active,None)
+        self.assertEquals(c2.index["three"].name,"three")
+        self.assertTrue(isinstance(c2.extra,Other))
+        self.assertEquals(Catalog().dumps(),Catalog.loads(Catalog().dumps()).dumps())
+
+        self.assertRaises(dexml.ParseError,Catalog.loads,b("garbage"))
+        self.assertRaises(dexml.ParseError,Item.loads,data)
+
+        class SubItem(Item):
+            pass
+        c.items.append(SubItem(name="sub",price=0.0))
+        self.assertRaises(ValueError,c.dumps)
+
+
+    def test_dumps_custom_value_field(self):
+        class Point(fields.Value):
+            def parse_value(self,val):
+                return tuple(int(v) for v in val.split(","))
+            def render_value(self,val):
+                return "%d,%d" % val
+        class Shape(dexml.Model):
+            at = Point()
+
+        s = Shape.parse("<Shape at='1,2' />")
+        self.assertEquals(s.at,(1,2))
+        self.assertEquals(Shape.loads(s.dumps()).at,(1,2))
+
+
+    def test_pickle_and_copy(self):
+        import pickle
+        import copy
+        p = PickledPerson(name="Ugh",age=5)
+        p.nickname = "U"
+        for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+            p2 = pickle.loads(pickle.dumps(p,proto))
+            self.assertEquals(p2.render(),p.render())
+            self.assertEquals(p2.nickname,"U")
+        p3 = copy.copy(p)
+        self.assertEquals(p3.render(),p.render())
+        self.assertEquals(p3.nickname,"U")
+        #  Instances that dumps() can't encode are pickled by their state.
+        g = PickledGroup(name="g")
+        g.people.append(PickledSubPerson(name="sub",age=1))
+        self.assertRaises(ValueError,g.dumps)
+        e = PickledEvent(name="e",when={"at":datetime.date(2010,1,2)})
+        self.assertRaises(ValueError,e.dumps)
+        for obj in (g,e):
+            for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+                obj2 = pickle.loads(pickle.dumps(obj,proto))
+                self.assertEquals(obj2.render(),obj.render())
+            obj3 = copy.deepcopy(obj)
+            self.assertEquals(obj3.render(),obj.render())
+        self.assertEquals(obj2.when,e.when)
+        self.assertTrue(obj3.when is not e.when)
+        self.assertEquals(obj3.when,e.when)
+        g3 = copy.deepcopy(g)
+        self.assertTrue(g3.people[0].__class__ is PickledSubPerson)
+        self.assertTrue(g3.people[0] is not g.people[0])
+
+
+    def test_parse_limits(self):
+        class Item(dexml.Model):
+            name = fields.String(tagname="name",required=False)
+        class Doc(dexml.Model):
+            items = fields.List(Item,maxlength=3)
+        xml = "<Doc><Item><name>a</name></Item><Item /></Doc>"
+        self.assertEquals(len(Doc.parse(xml,limits=dexml.ParseLimits()).items),2)
+        def assertLimited(xml,**kwds):
+            limits = dexml.ParseLimits(**kwds)
+            self.assertRaises(dexml.ParseError,Doc.parse,xml,limits)
+            self.assertRaises(dexml.ParseError,Doc.parse,StringIO(xml),limits)
+            self.assertRaises(dexml.ParseError,Doc.parse,xml.decode("ascii"),limits)
+        assertLimited(xml,max_bytes=len(xml)-1)
+        self.assertEquals(len(Doc.parse(StringIO(xml),dexml.ParseLimits(max_bytes=len(xml))).items),2)
+        assertLimited(xml,max_depth=2)
+        self.assertEquals(len(Doc.parse(xml,dexml.ParseLimits(max_depth=3)).items),2)
+        assertLimited(xml,max_elements=3)
+        assertLimited("<Doc><Item><name>abcd</name></Item></Doc>",max_text_length=3)
+        assertLimited("<Doc><Item x='abcd' /></Doc>",max_text_length=3)
+        bomb = '<!DOCTYPE Doc [<!ENTITY a "aaaaaaaaaa"><!ENTITY b "&a;&a;&a;&a;&a;">]><Doc><Item><name>&b;&b;</name></Item></Doc>'
+        assertLimited(bomb)
+        assertLimited(bomb,max_text_length=50,allow_entities=True)
+        self.assertEquals(Doc.parse(bomb,dexml.ParseLimits(allow_entities=True)).items[0].name,"a" * 100)
+        #  Entities are rejected before they can be expanded into an attribute.
+        laughs = ['<!ENTITY l0 "lol">']
+        for i in xrange(1,10):
+            laughs.append('<!ENTITY l%d "%s">' % (i,("&l%d;" % (i-1,)) * 10,))
+        laughs = '<!DOCTYPE Doc [%s]><Doc><Item x="&l9;" /></Doc>' % ("".join(laughs),)
+        assertLimited(laughs)
+        assertLimited(laughs,max_text_length=1000)
+        self.assertEquals(Doc.parse(bomb).items[0].name,"a" * 100)
+        #  Limits can be set on the model's meta object.
+        class LimitedDoc(Doc):
+            class meta:
+                parse_limits = dexml.ParseLimits(max_elements=3)
+        self.assertRaises(dexml.ParseError,LimitedDoc.parse,xml.replace("Doc","LimitedDoc"))
+        #  List and Dict lengths are checked as items arrive.
+        self.assertRaises(dexml.ParseError,Doc.parse,"<Doc>" + "<Item />" * 4 + "</Doc>")
+        class Index(dexml.Model):
+            items = fields.Dict(Item,key="name",maxlength=2)
+        self.assertRaises(dexml.ParseError,Index.parse,"<Index><Item><name>a</name></Item>"
+                          "<Item><name>b</name></Item><Item><name>c</name></Item></Index>")
+
+
+    def test_metrics(self):
+        from dexml import metrics
+        registry = metrics.registry
+        registry.reset()
+        xml = "<PickledGroup name='g'><people><PickledPerson name='a'><age>1</age></PickledPerson></people></PickledGroup>"
+        PickledGroup.parse(xml)
+        self.assertEquals(registry.snapshot(),{})
+        registry.enable()
+        try:
+            g = PickledGroup.parse(xml)
+            self.assertRaises(dexml.ParseError,PickledGroup.parse,"<PickledGroup />")
+            out = g.render()
+            chunks = list(g.irender())
+        finally:
+            registry.disable()
+        g.render()
+        stats = registry.snapshot()
+        self.assertEquals(sorted(stats.keys()),
+                          [("dexml.test.PickledGroup","irender"),
+                           ("dexml.test.PickledGroup","parse"),
+                           ("dexml.test.PickledGroup","render")])
+        parse = stats[("dexml.test.PickledGroup","parse")]
+        self.assertEquals(parse["count"],2)
+        self.assertEquals(parse["errors"],1)
+        self.assertEquals(parse["bytes"],len(xml) + len("<PickledGroup />"))
+        self.assertEquals(sum(parse["buckets"]),2)
+        self.assertEquals(stats[("dexml.test.PickledGroup","render")]["bytes"],len(out))
+        self.assertEquals(stats[("dexml.test.PickledGroup","irender")]["bytes"],
+                          len("".join(chunks)))
+        stream = StringIO()
+        registry.write_prometheus(stream)
+        text = stream.getvalue()
+        self.assertTrue('dexml_errors_total{model="dexml.test.PickledGroup",op="parse"} 1\n' in text)
+        self.assertTrue('dexml_duration_seconds_bucket{model="dexml.test.PickledGroup",op="parse",le="+Inf"} 2\n' in text)
+        self.assertTrue("# TYPE dexml_duration_seconds histogram\n" in text)
+        import tempfile
+        import shutil
+        tdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tdir,"dexml.prom")
+            registry.export(path)
+            self.assertEquals(open(path).read(),text)
+            self.assertEquals(os.listdir(tdir),["dexml.prom"])
+        finally:
+            shutil.rmtree(tdir)
+        registry.reset()
+        self.assertEquals(registry.snapshot(),{})
+        #  Unicode documents are counted in bytes of utf-8.
+        uxml = u"<PickledPerson name='\u00e9\u00e9'><age>1</age></PickledPerson>"
+        registry.enable()
+        try:
+            p = PickledPerson.parse(uxml)
+            out = p.render()
+            chunks = list(p.irender())
+        finally:
+            registry.disable()
+        stats = registry.snapshot()
+        registry.reset()
+        self.assertEquals(stats[("dexml.test.PickledPerson","parse")]["bytes"],
+                          len(uxml.encode("utf-8")))
+        self.assertTrue(isinstance(out,dexml.unicode))
+        self.assertEquals(stats[("dexml.test.PickledPerson","render")]["bytes"],
+                          len(out.encode("utf-8")))
+        self.assertEquals(stats[("dexml.test.PickledPerson","irender")]["bytes"],
+                          len("".join(chunks).encode("utf-8")))
+
+
+    def test_sizeof(self):
+        import sys
+        p = PickledPerson(name="somebody",age=1)
+        self.assertEquals(dexml.sizeof(p,deep=False),
+                          sys.getsizeof(p) + sys.getsizeof(p.__dict__))
+        self.assertEquals(dexml.sizeof(p),dexml.sizeof(p,deep=False) +
+                          sys.getsizeof("somebody") + sys.getsizeof(1))
+        g = PickledGroup(name="g")
+        base = dexml.sizeof(g)
+        g.people.append(p)
+        self.assertEquals(dexml.sizeof(g),base + dexml.sizeof(p) +
+                          sys.getsizeof(g.people))
+        #  Shared objects are only counted once.
+        g.people.append(p)
+        self.assertEquals(dexml.sizeof(g),base + dexml.sizeof(p) +
+                          sys.getsizeof(g.people))
+
+
+    def test_clone(self):
+        import copy
+        class Item(dexml.Model):
+            name = fields.String()
+            when = fields.Date(required=False)
+        class Catalog(dexml.Model):
+            title = fields.String(tagname="title")
+            items = fields.List(Item)
+            index = fields.Dict(Item,key="name",required=False)
+            extra = fields.XmlNode(tagname="extra",required=False)
+            best = fields.Model(Item,required=False)
+        c = Catalog.parse("<Catalog><title>t</title><Item name='a' when='2012-01-02' />"
+                          "<Item name='b' /><extra><x y='1' /></extra></Catalog>")
+        c.index["k"] = Item()
+        c.best = Item(name="best")
+        c.note = ["extra"]
+        for c2 in (c.clone(),copy.deepcopy(c)):
+            self.assertEquals(c2.render(),c.render())
+            self.assertTrue(c2.items is not c.items)
+            self.assertTrue(c2.items[0] is not c.items[0])
+            self.assertTrue(c2.index["k"] is not c.index["k"])
+            self.assertTrue(c2.best is not c.best)
+            c2.items[0].name = "changed"
+            c2.items.append(Item(name="new"))
+            c2.index["j"] = Item()
+            c2.extra.node.setAttribute("z","2")
+            self.assertEquals(c.items[0].name,"a")
+            self.assertEquals(len(c.items),2)
+            self.assertEquals(sorted(c.index.keys()),["k"])
+            self.assertEquals(c.extra.toxml(),'<extra><x y="1"/></extra>')
+        self.assertRaises(ValueError,c.clone().index.__setitem__,"x",Item(name="y"))
+        self.assertTrue(c.clone().note is c.note)
+        c3 = c.clone(deep=False)
+        self.assertTrue(c3.items is c.items)
+
+
+    def test_render_many(self):
+        people = [PickledPerson(name=u"p\u00e9%d" % (i,),age=i) for i in range(5)]
+        self.assertEquals(PickledPerson.render_many(people),
+                          [p.render() for p in people])
+        self.assertEquals(PickledPerson.render_many(people,encoding="utf-8",fragment=True),
+                          [p.render(encoding="utf-8",fragment=True) for p in people])
+        (data,offsets) = PickledPerson.render_many(people,encoding="utf-8",framed=True)
+        self.assertEquals(len(offsets),6)
+        for (i,p) in enumerate(people):
+            self.assertEquals(data[offsets[i]:offsets[i+1]],p.render(encoding="utf-8"))
+        self.assertEquals(PickledPerson.render_many([],framed=True),("",[0]))
+        self.assertRaises(dexml.RenderError,PickledPerson.render_many,[PickledPerson(age=1)])
+
+
+    def test_render_projection(self):
+        class line(dexml.Model):
+            sku = fields.String()
+            qty = fields.Integer()
+            note = fields.String(tagname="note",required=False)
+        class order(dexml.Model):
+            id = fields.String()
+            name = fields.String(tagname="name")
+            lines = fields.List(line,tagname="lines")
+            index = fields.Dict(line,key="sku",required=False)
+            main = fields.Model(line,required=False)
+        o = order(id="o1",name="Order")
+        o.lines.append(line(sku="a",qty=1,note="hi"))
+        o.lines.append(line(sku="b",qty=2))
+        o.index["c"] = line(qty=3)
+        o.main = line(sku="d",qty=4,note="there")
+        def check(xml,**kwds):
+            self.assertEquals(o.render(fragment=True,**kwds),xml)
+            self.assertEquals("".join(o.irender(fragment=True,**kwds)),xml)
+        check('<order id="o1"><name>Order</name></order>',only="id,name")
+        check('<order id="o1"><lines><line sku="a" /><line sku="b" /></lines>'
+              '<line sku="c" /></order>',only=["id","lines.sku","index.sku"])
+        check('<order id="o1"><name>Order</name><lines><line sku="a" qty="1" />'
+              '<line sku="b" qty="2" /></lines><line sku="d" qty="4" /></order>',
+              exclude=["index","lines.note","main.note"])
+        check('<order><line qty="4"><note>there</note></line></order>',
+              only="main",exclude="main.sku")
+        #  Naming a whole field takes precedence over its subfields.
+        self.assertEquals(o.render(only="main.sku,main"),o.render(only="main"))
+        self.assertEquals(o.render(only="id",encoding="utf-8"),
+                          '<?xml version="1.0" encoding="utf-8" ?><order id="o1" />')
+        #  Only the fields that are left out aren't checked for values.
+        o.name = None
+        self.assertEquals(o.render(fragment=True,only="id"),'<order id="o1" />')
+        self.assertRaises(dexml.RenderError,o.render,exclude="lines")
+        o.lines[0].sku = None
+        self.assertRaises(dexml.RenderError,o.render,only="lines.qty,lines.sku")
+        self.assertEquals(o.render(fragment=True,only="lines.qty"),
+                          '<order><lines><line qty="1" /><line qty="2" /></lines></order>')
+        self.assertRaises(ValueError,o.render,only="ids")
+        self.assertRaises(ValueError,o.render,only="lines.price")
+        self.assertRaises(ValueError,o.render,only="id.name")
+        self.assertRaises(ValueError,o.render,only="id",workers=2)
+        #  Nested names are checked even when there are no items to render.
+        class shipment(dexml.Model):
+            lines = fields.List(line,required=False)
+            index = fields.Dict(line,key="sku",required=False)
+            main = fields.Model(line,required=False)
+            either = fields.Choice(fields.Model(line),fields.Model(order),
+                                   required=False)
+        s = shipment()
+        for spec in ("lines.bogus","index.bogus","main.bogus","either.bogus"):
+            self.assertRaises(ValueError,s.render,only=spec)
+            self.assertRaises(ValueError,s.irender,only=spec)
+        self.assertEquals(s.render(fragment=True,only="lines.sku,either.id"),"<shipment />")
+
+
+    def test_parallel_render(self):
+        from multiprocessing import Pool
+        from dexml.parallel import ParallelRenderer
+        g = PickledGroup(name="big")
+        for i in xrange(1200):
+            g.people.append(PickledPerson(name="p%d" % (i,),age=i))
+            g.index["k%d" % (i,)] = PickledPerson(name="k%d" % (i,),age=i)
+        xml = g.render()
+        self.assertEquals(g.render(workers=2),xml)
+        self.assertEquals(g.render(encoding="utf-8",workers=2),
+                          g.render(encoding="utf-8"))
+        pool = Pool(2)
+        try:
+            self.assertEquals(g.render(workers=pool),xml)
+            small = PickledGroup(name="small")
+            small.people.append(PickledPerson(name="a",age=1))
+            out = []
+            ParallelRenderer(pool,min_items=1).render_into(small,{},out)
+            self.assertEquals("".join(out),small.render(fragment=True))
+        finally:
+            pool.close()
+            pool.join()
+        #  Item counts are checked just like in a serial render.
+        people = [f for f in PickledGroup._fields if f.field_name == "people"][0]
+        people.maxlength = 1000
+        try:
+            self.assertRaises(dexml.RenderError,g.render,workers=2)
+        finally:
+            people.maxlength = None
+
+
+    def test_parallel_parse(self):
+        import tempfile
+        from multiprocessing import Pool
+        from dexml.parallel import ParallelParser
+        g = PickledGroup(name="big")
+        for i in xrange(300):
+            g.people.append(PickledPerson(name="p%d" % (i,),age=i))
+            g.index["k%d" % (i,)] = PickledPerson(name="k%d" % (i,),age=i)
+        xml = g.render(encoding="utf-8")
+        self.assertEquals(PickledGroup.parse(xml,workers=2).render(),
+                          PickledGroup.parse(xml).render())
+        self.assertRaises(ValueError,PickledGroup.parse,xml,
+                          limits=dexml.ParseLimits(),workers=2)
+        pool = Pool(2)
+        try:
+            parser = ParallelParser(pool,shard_size=500)
+            g2 = parser.parse(PickledGroup,xml)
+            self.assertEquals(g2.name,"big")
+            self.assertEquals([p.render() for p in g2.people],
+                              [p.render() for p in g.people])
+            self.assertEquals(sorted(g2.index.keys()),sorted(g.index.keys()))
+            self.assertEquals(parser.parse(PickledGroup,xml.decode("utf-8")).render(),
+                              g2.render())
+            #  Files are memory-mapped and read by the workers.
+            f = tempfile.TemporaryFile()
+            try:
+                f.write(xml)
+                f.flush()
+                f.seek(0)
+                self.assertEquals(parser.parse(PickledGroup,f).render(),g2.render())
+            finally:
+                f.close()
+            items = list(parser.iterparse(PickledGroup,xml))
+            self.assertEquals(len(items),600)
+            self.assertEquals([v.name for (n,v) in items if n == "people"],
+                              [p.name for p in g.people])
+            #  Namespace declarations on the root are carried into shards.
+            ns_xml = '<PickledNsDoc xmlns:n="urn:dexml:test"><!-- <n:NsItem> -->'
+            ns_xml += "".join('<n:PickledNsItem value="%d"><![CDATA[<x>]]></n:PickledNsItem>' % (i,)
+                              for i in range(100))
+            ns_xml += "</PickledNsDoc>"
+            doc = parser.parse(PickledNsDoc,ns_xml)
+            self.assertEquals([i.value for i in doc.items],[str(i) for i in range(100)])
+            #  Errors in the shards are reported as usual.
+            #  Empty wrapper tags still count as finding a required List.
+            notes = "".join("<note>n%d</note>" % (i,) for i in xrange(100))
+            for people in ("<people />","<people>\n</people>"):
+                empty_xml = "<PickledBatch>%s%s</PickledBatch>" % (people,notes,)
+                self.assertEquals(parser.parse(PickledBatch,empty_xml).render(),
+                                  PickledBatch.parse(empty_xml).render())
+            bad = xml.replace('<PickledPerson name="p250">','<PickledPerson>')
+            self.assertRaises(dexml.ParseError,parser.parse,PickledGroup,bad)
+            self.assertRaises(dexml.XmlError,parser.parse,PickledGroup,xml[:-20])
+        finally:
+            pool.close()
+            pool.join()
+
+
+class PickledPerson(dexml.Model):
+    name = fields.String()
+    age = fields.Integer(tagname="age")
+
+
+class PickledSubPerson(PickledPerson):
+    pass
+
+
+class PickledGroup(dexml.Model):
+    name = fields.String()
+    people = fields.List(PickledPerson,tagname="people")
+    index = fields.Dict(PickledPerson,key="name",required=False)
+
+
+class PickledBatch(dexml.Model):
+    people = fields.List(PickledPerson,tagname="people")
+    notes = fields.List(fields.String(tagname="note"),required=False)
+
+
+class _DateMapField(fields.Field):
+    """Field holding a dict of dates, which marshal can't encode."""
+    pass
+
+
+class PickledEvent(dexml.Model):
+    name = fields.String()
+    when = _DateMapField(required=False)
+
+
+class PickledNsItem(dexml.Model):
+    class meta:
+        namespace = "urn:dexml:test"
+        namespace_prefix = "n"
+    value = fields.String()
+
+
+class PickledNsDoc(dexml.Model):
+    items = fields.List(PickledNsItem)
+
+
 class TestListField(unittest.TestCase):
     class F(dexml.Model):
         class meta:
@@ -1094,3 +2009,390 @@ class TestListField(unittest.TestCase):
         o = obj()
         o.fs.append("s1")
         self.assertEqual(o.render(fragment=True), "<obj><val>s1</val></obj>")
+
+
+class TestParseCache(unittest.TestCase):
+
+    def test_hits_and_copies(self):
+        cache = dexml.ParseCache()
+        xml = "<PickledPerson name='Ugh'><age>5</age></PickledPerson>"
+        p1 = cache.parse(PickledPerson,xml)
+        self.assertEquals(cache.misses,1)
+        p1.name = "Changed"
+        p2 = cache.parse(PickledPerson,xml)
+        self.assertEquals(cache.hits,1)
+        self.assertEquals(p2.name,"Ugh")
+        self.assertEquals(p2.age,5)
+        p3 = cache.parse(PickledPerson,StringIO(xml))
+        self.assertEquals(cache.hits,2)
+        self.assertEquals(p3.render(),p2.render())
+        cache.parse(PickledPerson,minidom.parseString(xml))
+        self.assertEquals(cache.stats()["entries"],1)
+        self.assertRaises(dexml.ParseError,cache.parse,PickledPerson,"<Oops />")
+        self.assertEquals(len(cache),1)
+        cache.clear()
+        self.assertEquals(len(cache),0)
+        self.assertEquals(cache.size,0)
+
+    def test_unencodable_values(self):
+        class stamp(fields.Field):
+            def parse_done(self,obj):
+                self.__set__(obj,{"at":datetime.date(2020,1,1)})
+        class stamped(dexml.Model):
+            name = fields.String()
+            when = stamp(required=False)
+        cache = dexml.ParseCache()
+        for i in range(2):
+            s = cache.parse(stamped,"<stamped name='x' />")
+            self.assertEquals(s.when,{"at":datetime.date(2020,1,1)})
+        self.assertEquals((cache.misses,len(cache)),(2,0))
+
+    def test_lru_eviction(self):
+        cache = dexml.ParseCache(max_entries=2)
+        xml = "<PickledPerson name='%d'><age>5</age></PickledPerson>"
+        cache.parse(PickledPerson,xml % 1)
+        cache.parse(PickledPerson,xml % 2)
+        cache.parse(PickledPerson,xml % 1)
+        cache.parse(PickledPerson,xml % 3)
+        self.assertEquals(cache.evictions,1)
+        cache.parse(PickledPerson,xml % 1)
+        self.assertEquals(cache.hits,2)
+        cache.parse(PickledPerson,xml % 2)
+        self.assertEquals(cache.misses,4)
+        size = len(PickledPerson(name="1",age=5).dumps())
+        cache = dexml.ParseCache(max_bytes=size*2)
+        for i in range(5):
+            cache.parse(PickledPerson,xml % i)
+        self.assertEquals(len(cache),2)
+        self.assertEquals(cache.size,size*2)
+
+    def test_disk_tier(self):
+        import tempfile
+        import shutil
+        tdir = tempfile.mkdtemp()
+        try:
+            xml = "<PickledPerson name='Ugh'><age>5</age></PickledPerson>"
+            dexml.ParseCache(directory=tdir).parse(PickledPerson,xml)
+            cache = dexml.ParseCache(directory=tdir)
+            p = cache.parse(PickledPerson,xml)
+            self.assertEquals(p.name,"Ugh")
+            self.assertEquals((cache.hits,cache.disk_hits,cache.misses),(0,1,0))
+            cache.parse(PickledPerson,xml)
+            self.assertEquals((cache.hits,cache.disk_hits,cache.misses),(1,1,0))
+            for nm in os.listdir(tdir):
+                f = open(os.path.join(tdir,nm),"wb")
+                f.write(b("stale"))
+                f.close()
+            cache = dexml.ParseCache(directory=tdir)
+            self.assertEquals(cache.parse(PickledPerson,xml).age,5)
+            self.assertEquals(cache.misses,1)
+        finally:
+            shutil.rmtree(tdir)
+
+
+class TestExportWriter(unittest.TestCase):
+
+    class Item(dexml.Model):
+        class meta:
+            namespace = "urn:export"
+            namespace_prefix = "e"
+        sku = fields.String()
+        qty = fields.Integer(tagname="qty")
+
+    def _export_class(self,**kwds):
+        class Export(dexml.Model):
+            class meta:
+                namespace = "urn:export"
+            name = fields.String()
+            title = fields.String(tagname="title")
+            items = fields.List(self.Item,**kwds)
+            footer = fields.String(tagname="footer",required=False)
+        return Export
+
+    def test_incremental_export(self):
+        from io import BytesIO
+        Export = self._export_class(tagname="items")
+        items = [self.Item(sku="s%d" % (i,),qty=i) for i in range(1000)]
+        out = BytesIO()
+        with dexml.ExportWriter(Export,out,name="nightly",title=u"T\N{GREEK SMALL LETTER LAMDA}") as w:
+            for item in items:
+                w.append(item)
+            w.root.footer = "end"
+        self.assertEquals(w.num_items,1000)
+        e = Export(name="nightly",title=u"T\N{GREEK SMALL LETTER LAMDA}",footer="end")
+        e.items.extend(items)
+        self.assertEquals(out.getvalue(),e.render(encoding="utf-8"))
+        e2 = Export.parse(out.getvalue())
+        self.assertEquals(len(e2.items),1000)
+        self.assertEquals(e2.items[-1].qty,999)
+        #  Empty exports, unicode output.
+        out = StringIO()
+        with dexml.ExportWriter(Export,out,encoding=None,fragment=True,name="x",title="t") as w:
+            pass
+        self.assertEquals(out.getvalue(),'<Export xmlns="urn:export" name="x"><title>t</title><items /></Export>')
+
+    def test_incremental_checks(self):
+        from io import BytesIO
+        Export = self._export_class(tagname="items",minlength=1,maxlength=2)
+        self.assertRaises(dexml.RenderError,dexml.ExportWriter(Export,BytesIO(),title="t").open)
+        w = dexml.ExportWriter(Export,BytesIO(),name="n")
+        self.assertRaises(dexml.RenderError,w.open)
+        out = BytesIO()
+        w = dexml.ExportWriter(Export,out,name="n",title="t")
+        w.open()
+        self.assertRaises(dexml.RenderError,w.close)
+        self.assertRaises(dexml.RenderError,w.append,self.Item(sku="s"))
+        w.append(self.Item(sku="s",qty=1))
+        w.append(self.Item(sku="s",qty=2))
+        self.assertRaises(dexml.RenderError,w.append,self.Item(sku="s",qty=3))
+        w.close()
+        self.assertEquals(len(Export.parse(out.getvalue()).items),2)
+        self.assertRaises(ValueError,w.append,self.Item(sku="s",qty=3))
+        class NoList(dexml.Model):
+            name = fields.String()
+        self.assertRaises(ValueError,dexml.ExportWriter,NoList,out)
+        self.assertRaises(ValueError,dexml.ExportWriter,Export,out,field="nope")
+
+
+class TestDelta(unittest.TestCase):
+
+    class Item(dexml.Model):
+        sku = fields.String()
+        qty = fields.Integer(required=False)
+
+    class Catalog(dexml.Model):
+        name = fields.String()
+        note = fields.String(tagname="note",required=False)
+        items = fields.List(fields.Model("Item"),tagname="items")
+        index = fields.Dict(fields.Model("Item"),key="sku",required=False)
+        featured = fields.Model("Item",required=False)
+        flag = fields.Boolean(required=False)
+
+    def _make_catalog(self):
+        c = self.Catalog(name="c")
+        for i in range(20):
+            c.items.append(self.Item(sku="s%d" % (i,),qty=i))
+            c.index["k%d" % (i,)] = self.Item(qty=i)
+        c.featured = self.Item(sku="f",qty=1)
+        return c
+
+    def assertPatches(self,old,new):
+        changes = dexml.diff(old,new)
+        target = self.Catalog.loads(old.dumps())
+        self.assertEquals(dexml.patch(target,changes).render(),new.render())
+        loaded = dexml.ChangeSet.loads(changes.dumps())
+        self.assertEquals(loaded,changes)
+        target = self.Catalog.loads(old.dumps())
+        self.assertEquals(dexml.patch(target,loaded).render(),new.render())
+        return changes
+
+    def test_no_changes(self):
+        self.assertEquals(dexml.diff(self._make_catalog(),self._make_catalog()),[])
+
+    def test_value_changes(self):
+        old = self._make_catalog()
+        new = self._make_catalog()
+        new.name = "d"
+        new.note = "hello"
+        new.featured.qty = 7
+        changes = self.assertPatches(old,new)
+        self.assertEquals(changes,[("set",("name",),"d"),
+                                   ("set",("note",),"hello"),
+                                   ("set",("featured","qty"),7)])
+        new2 = self._make_catalog()
+        new2.featured = None
+        self.assertEquals(len(self.assertPatches(old,new2)),1)
+        self.assertEquals(len(self.assertPatches(new2,old)),1)
+
+    def test_boolean_changes(self):
+        old = self._make_catalog()
+        old.flag = True
+        new = self._make_catalog()
+        self.assertEquals(self.assertPatches(old,new),[("set",("flag",),None)])
+        self.assertTrue("flag" not in new.render())
+        self.assertEquals(len(self.assertPatches(new,old)),1)
+
+    def test_list_changes(self):
+        old = self._make_catalog()
+        new = self._make_catalog()
+        new.items[3].qty = 42
+        del new.items[10:12]
+        new.items.insert(0,self.Item(sku="new"))
+        new.items.append(self.Item(sku="last",qty=1))
+        changes = self.assertPatches(old,new)
+        self.assertEquals(len(changes),5)
+        self.assertTrue(("set",("items",3,"qty"),42) in changes)
+        new.items = []
+        self.assertPatches(old,new)
+        self.assertPatches(new,old)
+
+    def test_dict_changes(self):
+        old = self._make_catalog()
+        new = self._make_catalog()
+        del new.index["k1"]
+        new.index["k5"].qty = 55
+        new.index["extra"] = self.Item(qty=3)
+        changes = self.assertPatches(old,new)
+        self.assertEquals(sorted(changes),
+                          [("remove",("index","k1"),None),
+                           ("set",("index","extra"),("extra",3)),
+                           ("set",("index","k5","qty"),55)])
+
+    def test_bad_changes(self):
+        c = self._make_catalog()
+        self.assertRaises(ValueError,dexml.diff,c,self.Item(sku="s"))
+        self.assertRaises(ValueError,dexml.patch,c,[("set",("nope",),1)])
+        self.assertRaises(ValueError,dexml.patch,c,[("remove",("items",99),None)])
+        self.assertRaises(ValueError,dexml.patch,c,[("insert",("name",),"x")])
+        self.assertRaises(ValueError,dexml.patch,c,[("remove",("index","nope"),None)])
+        self.assertRaises(ValueError,dexml.patch,c,[("frob",("name",),"x")])
+        self.assertRaises(dexml.ParseError,dexml.ChangeSet.loads,"junk")
+
+
+class TestSynth(unittest.TestCase):
+
+    class Part(dexml.Model):
+        class meta:
+            namespace = "urn:synth"
+            namespace_prefix = "s"
+        code = fields.String()
+        kind = fields.Enum("bolt","nut","washer")
+        made = fields.Date(required=False)
+        updated = fields.DateTime(required=False)
+        price = fields.Decimal(tagname="price")
+        weight = fields.Float(required=False)
+        count = fields.Integer(tagname="count")
+        spare = fields.Boolean(required=False)
+        notes = fields.CDATA(tagname="notes",required=False)
+        subparts = fields.List("Part",required=False)
+
+    class Tool(dexml.Model):
+        name = fields.String()
+        meta_data = fields.XmlNode(tagname="meta",required=False)
+
+    class Inventory(dexml.Model):
+        name = fields.String()
+        parts = fields.List(fields.Model("Part"),tagname="parts",minlength=2,maxlength=50)
+        index = fields.Dict(fields.Model("Tool"),key="name",required=False)
+        featured = fields.Choice(fields.Model("Part"),fields.Model("Tool"))
+
+    def test_generate(self):
+        inv = self.Inventory.generate(size=20,seed=42)
+        xml = inv.render()
+        inv2 = self.Inventory.parse(xml)
+        self.assertEquals([p.render() for p in inv2.parts],
+                          [p.render() for p in inv.parts])
+        self.assertEquals(sorted(inv2.index.keys()),sorted(inv.index.keys()))
+        self.assertEquals(len(inv.parts),20)
+        self.assertEquals(len(inv.index),20)
+        self.assertEquals(self.Inventory.generate(size=20,seed=42).render(),xml)
+        self.assertNotEquals(self.Inventory.generate(size=20,seed=43).render(),xml)
+        self.assertEquals(len(self.Inventory.generate(size=0,seed=1).parts),2)
+        self.assertEquals(len(self.Inventory.generate(size=100,seed=1).parts),50)
+        #  Recursion stops at the maximum depth.
+        p = self.Part.generate(size=3,seed=1,max_depth=3)
+        self.assertEquals(len(p.subparts),3)
+        self.assertEquals(len(p.subparts[0].subparts[0].subparts),0)
+
+    def test_write_document(self):
+        from io import BytesIO
+        from dexml import synth
+        class Catalog(dexml.Model):
+            title = fields.String(tagname="title")
+            items = fields.List(fields.Model("Tool"))
+        out = BytesIO()
+        self.assertEquals(synth.write_document(Catalog,out,250,seed=7),250)
+        c = Catalog.parse(out.getvalue())
+        self.assertEquals(len(c.items),250)
+        self.assertTrue(c.title)
+        out2 = BytesIO()
+        synth.write_document(Catalog,out2,250,seed=7)
+        self.assertEquals(out2.getvalue(),out.getvalue())
+
+
+class TestCLI(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tdir = tempfile.mkdtemp()
+        for i in range(6):
+            g = PickledGroup(name="g%d" % (i,))
+            g.people.append(PickledPerson(name=u"p\u00e9",age=i))
+            f = open(os.path.join(self.tdir,"g%d.xml" % (i,)),"wb")
+            f.write(g.render(encoding="utf-8"))
+            f.close()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tdir)
+
+    def run_cli(self,*args):
+        from dexml import cli
+        (out,err) = (StringIO(),StringIO())
+        #  Usage errors are reported by optparse on sys.stderr.
+        (old_stderr,sys.stderr) = (sys.stderr,err)
+        try:
+            status = cli.main(list(args),stdout=out,stderr=err)
+        finally:
+            sys.stderr = old_stderr
+        return (status,out.getvalue(),err.getvalue())
+
+    def test_commands(self):
+        (status,out,err) = self.run_cli("validate","-j","2","dexml.test:PickledGroup",self.tdir)
+        self.assertEquals((status,out),(0,""))
+        self.assertTrue(err.startswith("validate: 6 files"))
+        pattern = os.path.join(self.tdir,"g[12].xml")
+        (status,out,err) = self.run_cli("render","-q","dexml.test.PickledGroup",pattern)
+        self.assertEquals((status,err),(0,""))
+        self.assertEquals(out.count('<?xml version="1.0" encoding="utf-8" ?>'),2)
+        self.assertEquals(PickledGroup.parse(out.split("\n")[0]).name,"g1")
+        (status,out,err) = self.run_cli("to-json","-q","dexml.test:PickledGroup",
+                                        os.path.join(self.tdir,"g2.xml"))
+        self.assertEquals(status,0)
+        import json
+        data = json.loads(out.decode("utf8"))
+        self.assertEquals(data,{"name":"g2","index":{},
+                                "people":[{"name":u"p\u00e9","age":2}]})
+        outdir = os.path.join(self.tdir,"out")
+        (status,out,err) = self.run_cli("render","--pretty","-q","-o",outdir,
+                                        "dexml.test:PickledGroup",self.tdir)
+        self.assertEquals((status,out),(0,""))
+        self.assertEquals(len(os.listdir(outdir)),6)
+        f = open(os.path.join(outdir,"g3.xml"),"rb")
+        self.assertEquals(PickledGroup.parse(f.read()).name,"g3")
+        f.close()
+
+    def test_output_paths(self):
+        indir = os.path.join(self.tdir,"in")
+        for sub in ("a","b"):
+            os.makedirs(os.path.join(indir,sub))
+            g = PickledGroup(name=sub)
+            f = open(os.path.join(indir,sub,"1.xml"),"wb")
+            f.write(g.render(encoding="utf-8"))
+            f.close()
+        outdir = os.path.join(self.tdir,"out")
+        (status,out,err) = self.run_cli("render","-q","-j","2","-o",outdir,
+                                        "dexml.test:PickledGroup",indir)
+        self.assertEquals((status,out,err),(0,"",""))
+        for sub in ("a","b"):
+            f = open(os.path.join(outdir,sub,"1.xml"),"rb")
+            self.assertEquals(PickledGroup.parse(f.read()).name,sub)
+            f.close()
+        #  Files named directly only keep their basename, so these collide.
+        self.assertRaises(SystemExit,self.run_cli,"render","-o",outdir,
+                          "dexml.test:PickledGroup",
+                          os.path.join(indir,"a","1.xml"),
+                          os.path.join(indir,"b","1.xml"))
+
+    def test_errors(self):
+        f = open(os.path.join(self.tdir,"bad.xml"),"wb")
+        f.write(b("<PickledGroup name='bad'><people>"))
+        f.close()
+        (status,out,err) = self.run_cli("parse","-j","1","dexml.test:PickledGroup",self.tdir)
+        self.assertEquals(status,1)
+        self.assertTrue("bad.xml: XmlError" in err)
+        self.assertTrue(err.endswith(", 1 failed\n"))
+        self.assertRaises(SystemExit,self.run_cli,"frob","dexml.test:PickledGroup",self.tdir)
+        self.assertRaises(SystemExit,self.run_cli,"parse","dexml.test:Nope",self.tdir)
+        self.assertRaises(SystemExit,self.run_cli,"parse","dexml.test:PickledGroup",
+                          os.path.join(self.tdir,"*.txt"))
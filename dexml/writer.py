@@ -0,0 +1,181 @@
+"""
+
+dexml.writer:  incremental writing of large XML documents
+=========================================================
+
+This module provides the ExportWriter class, for writing documents whose
+root element contains a very large list of children without having to hold
+them all in memory at once:
+
+    with ExportWriter(Export,fp,name="nightly") as writer:
+        for item in generate_items():
+            writer.append(item)
+
+"""
+
+import dexml
+from dexml import fields
+
+
+class ExportWriter(object):
+    """Write a document incrementally, one list item at a time.
+
+    The first argument is the Model class of the document's root element,
+    and the second is the file-like object to write to.  Any additional
+    keyword arguments are used to construct the root instance, providing
+    values for its other fields.  The root class must have a List field
+    to receive the appended items; if it has more than one, specify which
+    using the 'field' argument.
+
+    When the writer is opened, the XML declaration and root start tag are
+    written along with any child fields that come before the list field.
+    Each call to append() renders a single item and writes it out.  When
+    the writer is closed, the remaining child fields are written followed
+    by the root end tag.  Required fields and the list's 'minlength' and
+    'maxlength' properties are checked as soon as possible, raising
+    RenderError; any items already given to the list field on the root
+    instance are written out first.
+
+    By default the output is encoded as utf-8; pass encoding=None to write
+    unicode strings to the file instead.  Pass fragment=True to omit the
+    leading "<?xml>" declaration.
+    """
+
+    def __init__(self,model_class,fp,encoding="utf-8",fragment=False,
+                       field=None,**kwds):
+        self.root = model_class(**kwds)
+        self.fp = fp
+        self.encoding = encoding
+        self.fragment = fragment
+        self.field = self._find_list_field(model_class,field)
+        self.num_items = 0
+        self._out = None
+        self._closed = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None:
+            self.close()
+        elif self._out is not None:
+            #  Write out whatever we have, but don't pretend that the
+            #  document is complete.
+            self._out.flush(final=True)
+            self._closed = True
+
+    @staticmethod
+    def _find_list_field(model_class,name):
+        """Find the List field that will receive appended items."""
+        candidates = []
+        for f in model_class._fields:
+            if isinstance(f,fields.List):
+                if name is None or f.field_name == name:
+                    candidates.append(f)
+        if len(candidates) != 1:
+            if name is None:
+                err = "Class '%s' must have exactly one List field"
+                raise ValueError(err % (model_class.__name__,))
+            err = "Class '%s' has no List field '%s'"
+            raise ValueError(err % (model_class.__name__,name,))
+        return candidates[0]
+
+    def open(self):
+        """Write the document header and root start tag."""
+        if self._out is not None:
+            raise ValueError("ExportWriter is already open")
+        root = self.root
+        out = self._out = dexml._EncodingBuffer(self.encoding,self.fp)
+        if not self.fragment:
+            if self.encoding:
+                out.append('<?xml version="1.0" encoding="%s" ?>' % (self.encoding,))
+            else:
+                out.append('<?xml version="1.0" ?>')
+        self._nsmap = {}
+        (open_tag,self._close_tag,self._pushed_ns) = root._render_tags(self._nsmap)
+        self._used_fields = set()
+        plan = root._get_render_plan()
+        for (f,render_attributes,_) in plan:
+            n = len(open_tag)
+            render_attributes(root,f.peek_value(root),self._nsmap,open_tag)
+            if len(open_tag) > n:
+                self._used_fields.add(f)
+        out.append("<%s>" % (" ".join(open_tag),))
+        idx = root._fields.index(self.field)
+        self._render_children(plan[:idx])
+        self._check_required(root._fields[:idx])
+        self._item_render = fields._render_into_method(self.field.field,
+                                                       "render_children")
+        for item in root.__dict__.get(self.field.field_name) or ():
+            self.append(item)
+        out.maybe_flush()
+
+    def append(self,item):
+        """Render the given item and write it into the document."""
+        if self._out is None or self._closed:
+            raise ValueError("ExportWriter is not open")
+        field = self.field
+        if field.maxlength is not None and self.num_items >= field.maxlength:
+            msg = "Field '%s': too many items" % (field.field_name,)
+            raise dexml.RenderError(msg)
+        #  Render into a temporary buffer, so that nothing is written if
+        #  the item turns out to be invalid.
+        data = []
+        nsmap = self._nsmap
+        ns_depths = dict((p,len(ns)) for (p,ns) in nsmap.iteritems())
+        try:
+            self._item_render(self.root,item,nsmap,data)
+        except Exception:
+            #  Namespaces pushed by the failed item won't have been popped,
+            #  so restore the nsmap for rendering of subsequent items.
+            for (p,ns) in nsmap.items():
+                if p not in ns_depths:
+                    del nsmap[p]
+                else:
+                    del ns[:len(ns)-ns_depths[p]]
+            raise
+        if self.num_items == 0 and field.tagname:
+            self._out.append("<%s>" % (field.tagname,))
+        self.num_items += 1
+        self._out.extend(data)
+        self._out.maybe_flush()
+
+    def close(self):
+        """Write the remainder of the document, and the root end tag."""
+        if self._out is None or self._closed:
+            raise ValueError("ExportWriter is not open")
+        root = self.root
+        field = self.field
+        out = self._out
+        if field.minlength is not None and self.num_items < field.minlength:
+            msg = "Field '%s': not enough items" % (field.field_name,)
+            raise dexml.RenderError(msg)
+        if field.tagname:
+            if self.num_items:
+                out.append("</%s>" % (field.tagname,))
+            elif field.required:
+                out.append("<%s />" % (field.tagname,))
+        idx = root._fields.index(field)
+        self._render_children(root._get_render_plan()[idx+1:])
+        self._check_required(root._fields[idx+1:])
+        out.append("</%s>" % (self._close_tag,))
+        if self._pushed_ns:
+            self._nsmap[root.meta.namespace_prefix].pop(0)
+        out.flush(final=True)
+        self._closed = True
+
+    def _render_children(self,plan):
+        root = self.root
+        out = self._out
+        n = len(out)
+        for (f,_,render_children) in plan:
+            render_children(root,f.peek_value(root),self._nsmap,out)
+            if len(out) > n:
+                self._used_fields.add(f)
+                n = len(out)
+
+    def _check_required(self,fields):
+        for f in fields:
+            if f.required and f not in self._used_fields:
+                raise dexml.RenderError("Field '%s' is missing" % (f.field_name,))